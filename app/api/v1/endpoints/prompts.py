@@ -1,99 +1,311 @@
-from fastapi import APIRouter, HTTPException, status
-from app.schemas.prompt import PromptRequest, PromptResponse, SinglePromptRequest, SinglePromptResponse, VersionInfo # Importe os schemas atualizados
-from app.services.prompt_engineering import generate_reformulations, ReformulationError # Importe o serviço e a exceção
-from app.services.prompt_judge import evaluate_reformulations, evaluate_single_prompt # Seu serviço de avaliação
+import asyncio
+import logging
+from typing import Awaitable, Optional, Set, Type, TypeVar
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError, request_deadline # Prazo por requisição
+from app.core.metrics import REQUESTS_ABANDONED
+from app.core.responses import FastJSONResponse, FieldSelection, json_dumps, model_response # Serialização com orjson e seleção de campos
+from app.providers.admission import ProviderOverloadedError # Chamada recusada pelo controle de admissão
+from app.providers.token_budget import PromptTooLargeError # Prompt acima do orçamento de tokens
+from app.schemas.prompt import BatchPromptRequest, BatchPromptResponse, JobStatusResponse, JobSubmitRequest, JobSubmitResponse, PromptRequest, PromptResponse, SinglePromptRequest, SinglePromptResponse # Importe os schemas atualizados
+from app.services.batch_processing import batch_scheduler # Escalonador do processamento em lote
+from app.services.job_queue import JobQueueFullError, get_job_store # Fila de jobs persistente
+from app.services.prompt_engineering import ReformulationError # Importe a exceção do serviço de geração
+from app.services.prompt_judge import EvaluationError, criterion_score_cache # Exceção e cache de notas do serviço de avaliação
+from app.services.prompt_pipeline import fit_prompt_request, near_duplicate_index, prompt_cache_key, result_cache, run_prompt_pipeline, run_single_evaluation, stream_prompt_pipeline # Fluxos com cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+T = TypeVar("T")
+
+# Parâmetros de seleção de campos das respostas (ver FieldSelection)
+FIELDS_QUERY = Query(None, description="Campos da resposta a retornar, separados por vírgula (aceita os grupos 'echo' e 'raw').")
+EXCLUDE_QUERY = Query(None, description="Campos da resposta a omitir, separados por vírgula (ex: 'echo,raw').")
+
+# Status não padronizado (nginx) para requisições abandonadas pelo cliente; a resposta não chega a ser lida
+HTTP_499_CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnectedError(Exception):
+    """Levantada quando o cliente fecha a conexão antes da resposta ficar pronta."""
+
+
+def _overloaded_exception(error: ProviderOverloadedError) -> HTTPException:
+    """Converte uma recusa do controle de admissão em 503 com Retry-After."""
+    logger.warning("Requisição recusada pelo controle de admissão: %s", error, extra={"retry_after": error.retry_after})
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Provedor LLM sobrecarregado: {str(error)}",
+        headers={"Retry-After": str(max(1, round(error.retry_after)))}
+    )
+
+
+def _too_large_exception(error: PromptTooLargeError) -> HTTPException:
+    """Converte um prompt acima do orçamento de tokens em 413, antes de qualquer chamada às LLMs."""
+    logger.warning("Prompt recusado pelo orçamento de tokens: %s", error, extra={"stage": "token_budget"})
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(error))
+
+
+def _excluded_fields(fields: Optional[str], exclude: Optional[str], model: Type[BaseModel]) -> Set[str]:
+    """Campos de `model` omitidos pela seleção do cliente (?fields=/?exclude=); nomes desconhecidos retornam 400."""
+    try:
+        return FieldSelection(fields, exclude).excluded(model)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+def _route_path(http_request: Request) -> str:
+    route = http_request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+def _deadline_exception(error: DeadlineExceededError, http_request: Request) -> HTTPException:
+    """Converte o prazo esgotado da requisição em 504, contabilizando o trabalho abandonado."""
+    REQUESTS_ABANDONED.inc(route=_route_path(http_request), reason="deadline")
+    logger.warning("Prazo da requisição esgotado: %s", error, extra={"stage": error.stage or "-"})
+    return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(error))
+
+
+def _header_timeout(http_request: Request) -> float:
+    """Prazo do cabeçalho X-Request-Timeout (segundos) ou REQUEST_DEFAULT_TIMEOUT_SECONDS; 0 = sem prazo."""
+    raw = http_request.headers.get("X-Request-Timeout")
+    if not raw:
+        return settings.REQUEST_DEFAULT_TIMEOUT_SECONDS
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="X-Request-Timeout deve ser um número de segundos.")
+
+
+async def _wait_for_disconnect(http_request: Request) -> None:
+    """Retorna quando o servidor ASGI sinaliza que o cliente fechou a conexão (o corpo já foi lido)."""
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _run_while_connected(http_request: Request, work: Awaitable[T], timeout_seconds: float) -> T:
+    """
+    Executa `work` sob o prazo timeout_seconds (0 = sem prazo) enquanto o cliente estiver conectado.
+    Se ele desconectar antes, o trabalho é cancelado (com as chamadas LLM pendentes, liberando
+    suas conexões) e ClientDisconnectedError é levantada.
+    """
+    with request_deadline(timeout_seconds):
+        task = asyncio.ensure_future(work) # A tarefa herda o prazo do contexto atual
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        REQUESTS_ABANDONED.inc(route=_route_path(http_request), reason="client_disconnect")
+        logger.info("Cliente desconectou; trabalho pendente cancelado.")
+        raise ClientDisconnectedError()
+    finally:
+        for pending in (task, disconnect):
+            if not pending.done():
+                pending.cancel()
 
-router = APIRouter()
 
 @router.post("/processar-prompt",
              response_model=PromptResponse,
              summary="Processa um prompt, gera reformulações e as avalia",
              tags=["Prompt Processing"])
-async def process_prompt(request: PromptRequest):
+async def process_prompt(request: PromptRequest, http_request: Request, fields: Optional[str] = FIELDS_QUERY, exclude: Optional[str] = EXCLUDE_QUERY):
     """
-    Recebe um prompt, gera duas reformulações (criativa e clara/objetiva)
-    usando o `generation_model_type` especificado, e então avalia essas
-    reformulações usando o `judge_model_type` especificado.
+    Recebe um prompt, gera `num_variants` reformulações (padrão: duas, criativa e clara/objetiva)
+    usando o `generation_model_type` especificado e as avalia com o `judge_model_type` especificado
+    (ou com o ensemble de `judge_ensemble`). Por padrão as fases são sequenciais: gera todas e depois
+    avalia numa chamada conjunta (duas variantes) ou pontuando cada texto (mais de duas). Com
+    PIPELINED_EXECUTION_ENABLED, cada texto é pontuado assim que existe e só a comparação final
+    espera pela geração.
+    Resultados idênticos são servidos do cache, a menos que `bypass_cache` seja verdadeiro.
+    `timeout_seconds` (ou o cabeçalho X-Request-Timeout) limita a requisição: ao expirar, retorna 504.
+    Se o cliente desconectar, as chamadas pendentes às LLMs são canceladas.
+    Um prompt acima do orçamento de tokens retorna 413 (ou é cortado, com PROMPT_OVERFLOW_POLICY=truncate).
+    `fields`/`exclude` selecionam os campos da resposta (ex: `exclude=echo,raw` omite o prompt ecoado,
+    version1/version2 e a saída bruta do judge).
 
     Retorna as reformulações, os dados da avaliação, a versão vencedora e uma justificativa.
     """
+    excluded = _excluded_fields(fields, exclude, PromptResponse)
+    timeout_seconds = _header_timeout(http_request)
     try:
-        reform1_content, reform2_content = generate_reformulations(
-            original_prompt=request.prompt,
-            generation_model_type=request.generation_model_type
-        )
+        response = await _run_while_connected(http_request, run_prompt_pipeline(request), timeout_seconds)
+        return model_response(response, excluded)
+    except ClientDisconnectedError:
+        return Response(status_code=HTTP_499_CLIENT_CLOSED_REQUEST)
+    except DeadlineExceededError as e:
+        raise _deadline_exception(e, http_request)
+    except PromptTooLargeError as e:
+        raise _too_large_exception(e)
+    except ProviderOverloadedError as e:
+        raise _overloaded_exception(e)
     except ReformulationError as e:
+        logger.error("Falha ao gerar reformulações: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Falha ao gerar reformulações: {str(e)}"
         )
     except Exception as e: 
+        logger.exception("Erro inesperado em /processar-prompt: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro inesperado no serviço de geração: {str(e)}"
         )
 
-    if not reform1_content or not reform2_content:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Serviço de geração retornou conteúdo vazio para reformulações."
-        )
+@router.post("/processar-prompt/stream",
+             summary="Processa um prompt emitindo o progresso via Server-Sent Events",
+             tags=["Prompt Processing"])
+async def process_prompt_stream(request: PromptRequest, http_request: Request):
+    """
+    Mesmo fluxo de `/processar-prompt`, mas em streaming (text/event-stream).
+    Eventos: `reformulation_token`, `reformulation_done`, `evaluation_row`, `verdict`,
+    `result` (PromptResponse completo) ou `error` (com `reason: "deadline"` se o prazo expirar
+    e `reason: "prompt_too_large"` se o prompt exceder o orçamento de tokens).
+    Se o cliente desconectar, o fluxo e as chamadas pendentes às LLMs são cancelados.
+    """
+    timeout_seconds = _header_timeout(http_request)
+    route = _route_path(http_request)
+
+    async def event_source():
+        try:
+            with request_deadline(timeout_seconds):
+                async for event, payload in stream_prompt_pipeline(request):
+                    if event == "error" and payload.get("reason") == "deadline":
+                        REQUESTS_ABANDONED.inc(route=route, reason="deadline")
+                    yield f"event: {event}\ndata: {json_dumps(payload)}\n\n"
+        except (asyncio.CancelledError, GeneratorExit):
+            REQUESTS_ABANDONED.inc(route=route, reason="client_disconnect")
+            raise
 
-    evaluation_report = evaluate_reformulations(
-        prompt_original=request.prompt,
-        reformulation_1=reform1_content,
-        reformulation_2=reform2_content,
-        judge_model_type=request.judge_model_type
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    if "error" in evaluation_report:
-        print(f"Erro do serviço de avaliação: {evaluation_report['error']}")
-        print(f"Saída bruta do judge: {evaluation_report.get('raw_output')}")
-        return PromptResponse(
-            original_prompt=request.prompt,
-            version1=VersionInfo(title="Reformulação 1 (Criativa)", content=reform1_content),
-            version2=VersionInfo(title="Reformulação 2 (Clara e Objetiva)", content=reform2_content),
-            error=f"Falha na avaliação das reformulações: {evaluation_report['error']}",
-            raw_judge_output=str(evaluation_report.get('raw_output', ''))
+@router.post("/processar-prompt/lote",
+             response_model=BatchPromptResponse,
+             summary="Processa uma lista de prompts com concorrência limitada",
+             tags=["Prompt Processing"])
+async def process_prompt_batch(request: BatchPromptRequest, http_request: Request, fields: Optional[str] = FIELDS_QUERY, exclude: Optional[str] = EXCLUDE_QUERY):
+    """
+    Executa o fluxo de `/processar-prompt` para cada item, respeitando o limite global
+    e os limites por provedor. Os resultados seguem a ordem de entrada; falhas são
+    reportadas por item em `error` sem interromper o lote.
+    O cabeçalho X-Request-Timeout limita o lote inteiro (itens não concluídos a tempo falham);
+    se o cliente desconectar, os itens pendentes são cancelados.
+    `fields`/`exclude` selecionam os campos do `result` de cada item.
+    """
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"O lote excede o máximo de {settings.BATCH_MAX_ITEMS} itens."
         )
-
-    return PromptResponse(
-        original_prompt=request.prompt,
-        version1=VersionInfo(
-            title=evaluation_report.get("version1", {}).get("title", "Reformulação 1 (Criativa)"),
-            content=evaluation_report.get("version1", {}).get("content", reform1_content)
-        ),
-        version2=VersionInfo(
-            title=evaluation_report.get("version2", {}).get("title", "Reformulação 2 (Clara e Objetiva)"), 
-            content=evaluation_report.get("version2", {}).get("content", reform2_content)
-        ),
-        evaluationData=evaluation_report.get("evaluationData"),
-        winningVersion=evaluation_report.get("winningVersion"),
-        justification=evaluation_report.get("justification")
-    )
+    excluded = _excluded_fields(fields, exclude, PromptResponse)
+    timeout_seconds = _header_timeout(http_request)
+    try:
+        response = await _run_while_connected(http_request, batch_scheduler.run(request.items), timeout_seconds)
+        return model_response(response, {"results": {"__all__": {"result": excluded}}} if excluded else None)
+    except ClientDisconnectedError:
+        return Response(status_code=HTTP_499_CLIENT_CLOSED_REQUEST)
 
 @router.post("/avaliar-prompt",
              response_model=SinglePromptResponse,
              summary="Avalia um único prompt com base nos critérios",
              tags=["Prompt Judge"])
-async def avaliar_prompt(request: SinglePromptRequest):
+async def avaliar_prompt(request: SinglePromptRequest, http_request: Request, fields: Optional[str] = FIELDS_QUERY, exclude: Optional[str] = EXCLUDE_QUERY):
     """
     Avalia um único prompt com base nos critérios técnicos, linguísticos e éticos.
     Utiliza o modelo especificado em `judge_model_type`.
+    `timeout_seconds` (ou o cabeçalho X-Request-Timeout) limita a avaliação: ao expirar, retorna 504.
+    `fields`/`exclude` selecionam os campos da resposta (ex: `exclude=echo` omite o prompt ecoado).
     """
-    evaluation = evaluate_single_prompt(
-        prompt=request.prompt,
-        judge_model_type=request.judge_model_type
-    )
-
-    if "error" in evaluation:
+    excluded = _excluded_fields(fields, exclude, SinglePromptResponse)
+    timeout_seconds = _header_timeout(http_request)
+    try:
+        response = await _run_while_connected(http_request, run_single_evaluation(request), timeout_seconds)
+        return model_response(response, excluded)
+    except ClientDisconnectedError:
+        return Response(status_code=HTTP_499_CLIENT_CLOSED_REQUEST)
+    except DeadlineExceededError as e:
+        raise _deadline_exception(e, http_request)
+    except PromptTooLargeError as e:
+        raise _too_large_exception(e)
+    except ProviderOverloadedError as e:
+        raise _overloaded_exception(e)
+    except EvaluationError as e:
+        logger.error("Erro na avaliação: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro na avaliação: {evaluation['error']}"
+            detail=f"Erro na avaliação: {str(e)}"
         )
 
-    return SinglePromptResponse(
-        prompt=evaluation["prompt"],
-        evaluationData=evaluation["evaluationData"],
-        justification=evaluation["justification"]
-    )
+@router.get("/cache/stats",
+            summary="Estatísticas dos caches de resultados e de notas",
+            tags=["Cache"])
+async def cache_stats():
+    """Retorna contadores de acerto/falha e ocupação do cache de resultados, do cache de notas por texto e do índice de quase duplicatas."""
+    return {
+        "results": result_cache.snapshot(),
+        "criterion_scores": criterion_score_cache.snapshot(),
+        "near_duplicates": near_duplicate_index.snapshot()
+    }
+
+
+@router.post("/jobs",
+             response_model=JobSubmitResponse,
+             status_code=status.HTTP_202_ACCEPTED,
+             summary="Enfileira o processamento de um prompt para execução assíncrona",
+             tags=["Jobs"])
+async def submit_job(request: JobSubmitRequest, http_request: Request, response: Response):
+    """
+    Enfileira o mesmo processamento de /processar-prompt e retorna imediatamente o id do job.
+    O resultado é consultado em GET /jobs/{job_id}. Requisições idênticas a um job pendente,
+    em execução ou concluído recentemente reaproveitam esse job (salvo com `bypass_cache`).
+    """
+    prompt_request = PromptRequest(**request.model_dump(exclude={"priority"}))
+    try:
+        fit_prompt_request(prompt_request) # Recusa já na submissão o prompt que o worker não poderia processar
+    except PromptTooLargeError as e:
+        raise _too_large_exception(e)
+    try:
+        job, deduplicated = await get_job_store().asubmit(prompt_request, prompt_cache_key(prompt_request), request.priority)
+    except JobQueueFullError as e:
+        logger.warning("Job recusado: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
+    response.headers["Location"] = str(http_request.url_for("get_job", job_id=job["id"]))
+    return JobSubmitResponse(job_id=job["id"], status=job["status"], deduplicated=deduplicated)
+
+@router.get("/jobs/stats",
+            summary="Número de jobs por status",
+            tags=["Jobs"])
+async def job_stats():
+    return await get_job_store().acounts()
+
+@router.get("/jobs/{job_id}",
+            response_model=JobStatusResponse,
+            summary="Consulta o status e o resultado de um job",
+            tags=["Jobs"])
+async def get_job(job_id: str, fields: Optional[str] = FIELDS_QUERY, exclude: Optional[str] = EXCLUDE_QUERY):
+    """Status do job e, se concluído, o resultado; `fields`/`exclude` selecionam os campos do `result`."""
+    excluded = _excluded_fields(fields, exclude, PromptResponse)
+    job = await get_job_store().aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    return model_response(JobStatusResponse(
+        job_id=job["id"], status=job["status"], priority=job["priority"], attempts=job["attempts"],
+        created_at=job["created_at"], started_at=job["started_at"], finished_at=job["finished_at"],
+        result=job["result"], error=job["error"]
+    ), {"result": excluded} if excluded else None)
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza o texto para fins de cache: remove espaços nas bordas e colapsa espaços internos."""
+    return " ".join(text.split())
+
+
+def make_cache_key(*parts: Any) -> str:
+    """Gera uma chave determinística (sha256) a partir das partes informadas."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """Interface mínima de um backend de cache. Valores são objetos serializáveis em JSON."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        raise NotImplementedError
+
+
+class MemoryLRUCache(CacheBackend):
+    """
+    Cache em memória do processo com política LRU e expiração por TTL.
+    Entradas expiradas são removidas na leitura e, a cada purge_interval_seconds, numa varredura feita na escrita.
+    """
+
+    def __init__(self, max_entries: int, purge_interval_seconds: float = 60.0):
+        self.max_entries = max_entries
+        self.purge_interval_seconds = purge_interval_seconds
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._next_purge_at = time.monotonic() + purge_interval_seconds
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        now = time.monotonic()
+        if now >= self._next_purge_at:
+            self.purge_expired(now)
+        self._entries[key] = (now + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Remove as entradas expiradas. Retorna quantas foram removidas."""
+        now = time.monotonic() if now is None else now
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at < now]
+        for key in expired:
+            del self._entries[key]
+        self._next_purge_at = now + self.purge_interval_seconds
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache em disco (SQLite em modo WAL) compartilhado por todos os workers do uvicorn.
+    As operações rodam em thread separada para não bloquear o event loop.
+    A cada purge_interval_seconds, uma escrita apaga as entradas expiradas do namespace e, se ele passar
+    de max_entries (0 = sem limite), as que expiram primeiro.
+    """
+
+    def __init__(self, path: str, namespace: str, max_entries: int = 0, purge_interval_seconds: float = 60.0):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.purge_interval_seconds = purge_interval_seconds
+        self._next_purge_at = time.monotonic() + purge_interval_seconds
+        self._local = threading.local()
+        self._connect().executescript(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key));"
+            "CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (namespace, expires_at);"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get_sync(self, key: str) -> Optional[Any]:
+        row = self._connect().execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def _set_sync(self, key: str, value: Any, ttl_seconds: float) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, json.dumps(value, ensure_ascii=False), time.time() + ttl_seconds),
+        )
+        if time.monotonic() >= self._next_purge_at:
+            self.purge_expired()
+
+    def purge_expired(self) -> int:
+        """Apaga as entradas expiradas e o excedente de max_entries (as que expiram primeiro). Retorna quantas apagou."""
+        self._next_purge_at = time.monotonic() + self.purge_interval_seconds
+        conn = self._connect()
+        removed = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at < ?", (self.namespace, time.time())
+        ).rowcount
+        if self.max_entries:
+            removed += conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE namespace = ? ORDER BY expires_at"
+                " LIMIT MAX(0, (SELECT COUNT(*) FROM cache_entries WHERE namespace = ?) - ?))",
+                (self.namespace, self.namespace, self.namespace, self.max_entries),
+            ).rowcount
+        return removed
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: Any, ttl_seconds: float) -> None:
+        await asyncio.to_thread(self._set_sync, key, value, ttl_seconds)
+
+
+class TieredCache:
+    """
+    Cache em camadas: memória (LRU+TTL) na frente de um SQLite opcional.
+    Acertos no SQLite são promovidos para a memória. Mantém contadores de acerto/falha.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        max_entries: int,
+        ttl_seconds: float,
+        sqlite_path: str = "",
+        disk_max_entries: int = 0,
+        purge_interval_seconds: float = 60.0,
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryLRUCache(max_entries, purge_interval_seconds)
+        self.disk: Optional[SQLiteCache] = (
+            SQLiteCache(sqlite_path, namespace, disk_max_entries, purge_interval_seconds) if sqlite_path else None
+        )
+        self.stats: Dict[str, int] = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+        if self.disk is not None:
+            value = await self.disk.get(key)
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                await self.memory.set(key, value, self.ttl_seconds)
+                return value
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.memory.set(key, value, self.ttl_seconds)
+        if self.disk is not None:
+            await self.disk.set(key, value, self.ttl_seconds)
+        self.stats["stores"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Retorna os contadores atuais e o tamanho da camada em memória."""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "memory_entries": len(self.memory),
+            "disk_enabled": self.disk is not None,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
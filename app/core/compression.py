@@ -0,0 +1,71 @@
+from typing import Set
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli # Dependência opcional: sem ela, as respostas são comprimidas só com gzip
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(header: str) -> Set[str]:
+    """Codificações aceitas pelo cliente no Accept-Encoding (as marcadas com q=0 são recusadas)."""
+    accepted: Set[str] = set()
+    for part in header.lower().split(","):
+        coding, *params = (item.strip() for item in part.split(";"))
+        refused = False
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    refused = float(value) <= 0
+                except ValueError:
+                    refused = True
+        if coding and not refused:
+            accepted.add(coding)
+    return accepted
+
+
+class BrotliResponder(IdentityResponder):
+    """Comprime o corpo da resposta com brotli (em streaming, cada parte é descarregada com flush)."""
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = 4, *, exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES):
+        super().__init__(app, minimum_size, exclude_content_types=exclude_content_types)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        compressed = self._compressor.process(body)
+        return compressed + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class CompressionMiddleware:
+    """
+    Comprime respostas a partir de minimum_size bytes com a melhor codificação aceita pelo cliente:
+    brotli (se instalado), depois gzip. Reaproveita os responders do GZipMiddleware do Starlette, que já
+    ignoram respostas pequenas, já codificadas, parciais e os tipos excluídos (ex: text/event-stream).
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+        elif "gzip" in accepted:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -1,8 +1,20 @@
+import logging
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def _get_bool_env(name: str, default: bool) -> bool:
+    """Lê uma variável de ambiente booleana ('1', 'true', 'yes', 'on' são verdadeiros)."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 class Settings:
     """
     Configurações da aplicação, carregadas de variáveis de ambiente.
@@ -14,15 +26,267 @@ class Settings:
     API_KEY_OPENAI: str = os.getenv("API_KEY_OPENAI", "")
     API_KEY_JUDGE: str = os.getenv("API_KEY_JUDGE", "") 
 
+    # Pool de conexões HTTP compartilhado pelos clientes LLM (keep-alive entre requisições)
+    LLM_POOL_MAX_CONNECTIONS: int = int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "100"))
+    LLM_POOL_MAX_KEEPALIVE: int = int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "20"))
+    LLM_POOL_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    LLM_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "10"))
+    LLM_REQUEST_TIMEOUT_SECONDS: float = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+    # Cache de resultados de /processar-prompt e /avaliar-prompt
+    RESULT_CACHE_ENABLED: bool = _get_bool_env("RESULT_CACHE_ENABLED", True)
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+    RESULT_CACHE_TTL_SECONDS: float = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+    RESULT_CACHE_SQLITE_PATH: str = os.getenv("RESULT_CACHE_SQLITE_PATH", "") # Vazio desativa a camada em disco
+    RESULT_CACHE_SQLITE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_SQLITE_MAX_ENTRIES", "100000")) # Por namespace; 0 = sem limite
+    RESULT_CACHE_PURGE_INTERVAL_SECONDS: float = float(os.getenv("RESULT_CACHE_PURGE_INTERVAL_SECONDS", "60")) # Limpeza de expirados
+
+    # Controle de admissão por (provedor, modelo): cotas, concorrência adaptativa e disjuntor.
+    # Cotas por provedor: RATE_LIMIT_<PROVEDOR>_RPM / RATE_LIMIT_<PROVEDOR>_TPM
+    DEFAULT_RATE_LIMITS = {
+        "gemini": (360, 4_000_000),
+        "groq": (30, 6_000),
+        "openai": (500, 300_000),
+        "fake": (1_000_000, 1_000_000_000),
+    }
+    LLM_ADMISSION_MAX_WAIT_SECONDS: float = float(os.getenv("LLM_ADMISSION_MAX_WAIT_SECONDS", "30"))
+    LLM_ESTIMATED_OUTPUT_TOKENS: int = int(os.getenv("LLM_ESTIMATED_OUTPUT_TOKENS", "800"))
+    LLM_ADAPTIVE_INITIAL_CONCURRENCY: int = int(os.getenv("LLM_ADAPTIVE_INITIAL_CONCURRENCY", "8"))
+    LLM_ADAPTIVE_MIN_CONCURRENCY: int = int(os.getenv("LLM_ADAPTIVE_MIN_CONCURRENCY", "1"))
+    LLM_ADAPTIVE_MAX_CONCURRENCY: int = int(os.getenv("LLM_ADAPTIVE_MAX_CONCURRENCY", "64"))
+    LLM_LATENCY_SPIKE_FACTOR: float = float(os.getenv("LLM_LATENCY_SPIKE_FACTOR", "3.0"))
+    LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+    LLM_BREAKER_RESET_SECONDS: float = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    LLM_LATENCY_WINDOW: int = int(os.getenv("LLM_LATENCY_WINDOW", "200")) # Amostras por (provedor, modelo)
+
+    # Requisições "hedged": se a geração não responder até o p95 observado, dispara uma cópia em outro provedor
+    HEDGE_CANDIDATE_MODEL_TYPES: str = os.getenv("HEDGE_CANDIDATE_MODEL_TYPES", "gemini,groq,openai")
+    HEDGE_DEFAULT_DELAY_SECONDS: float = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20")) # Amostras antes de confiar no p95
+
+    # Judge: saída estruturada nativa do provedor e reparo barato de JSON inválido
+    JUDGE_STRUCTURED_OUTPUT: bool = _get_bool_env("JUDGE_STRUCTURED_OUTPUT", True)
+    JUDGE_REPAIR_ENABLED: bool = _get_bool_env("JUDGE_REPAIR_ENABLED", True)
+    # Opt-in: pontua cada texto separadamente (com cache de notas) e usa o judge só para a decisão final.
+    # Sem cache quente custa N+1 chamadas de nota e uma comparação em vez de uma chamada conjunta;
+    # desativado, só avaliações com mais de duas reformulações seguem por texto
+    JUDGE_PER_TEXT_SCORING: bool = _get_bool_env("JUDGE_PER_TEXT_SCORING", False)
+    SCORE_CACHE_MAX_ENTRIES: int = int(os.getenv("SCORE_CACHE_MAX_ENTRIES", "4096"))
+    SCORE_CACHE_TTL_SECONDS: float = float(os.getenv("SCORE_CACHE_TTL_SECONDS", "604800"))
+
+    # Geração de N variantes: "parallel" (padrão) faz uma chamada independente por variante. Opt-in:
+    # "single_call" pede todas as candidatas numa só chamada (separadas e divididas depois), "n" usa o
+    # parâmetro `n` do provedor e "auto" escolhe "n" nos provedores de REFORMULATION_N_PARAM_PROVIDERS e
+    # "single_call" nos demais
+    REFORMULATION_STRATEGY: str = os.getenv("REFORMULATION_STRATEGY", "parallel").lower()
+    REFORMULATION_N_PARAM_PROVIDERS: str = os.getenv("REFORMULATION_N_PARAM_PROVIDERS", "openai")
+    # Quantas variantes mais bem pontuadas disputam o mata-mata de comparações em pares
+    JUDGE_TOURNAMENT_TOP_K: int = int(os.getenv("JUDGE_TOURNAMENT_TOP_K", "2"))
+    # Opt-in: execução em pipeline de /processar-prompt. Usa sempre a avaliação por texto (independente de
+    # JUDGE_PER_TEXT_SCORING) e uma chamada de geração por variante: pontua o original e cada reformulação assim
+    # que existem, deixando só o mata-mata final à espera da geração. Tira o judge do caminho crítico ao custo de
+    # N+1 chamadas de nota e uma comparação (sem cache quente) em vez de uma chamada conjunta. Ignorada com ensemble
+    PIPELINED_EXECUTION_ENABLED: bool = _get_bool_env("PIPELINED_EXECUTION_ENABLED", False)
+
+    # Ensemble de avaliadores: lista "provedor" ou "provedor:modelo" (ex: "gemini,openai:gpt-4o,groq"); vazio = um só judge.
+    # Começa com JUDGE_ENSEMBLE_INITIAL_JUDGES em paralelo e só aciona os demais enquanto não houver acordo: para
+    # (cancelando os restantes) quando JUDGE_ENSEMBLE_QUORUM avaliadores escolhem a mesma vencedora com margem de
+    # JUDGE_ENSEMBLE_MIN_MARGIN pontos na nota média ou, na avaliação de um prompt, dão notas médias a até
+    # JUDGE_ENSEMBLE_SCORE_TOLERANCE pontos entre si
+    JUDGE_ENSEMBLE: str = os.getenv("JUDGE_ENSEMBLE", "")
+    JUDGE_ENSEMBLE_AGGREGATION: str = os.getenv("JUDGE_ENSEMBLE_AGGREGATION", "mean").lower() # "mean" ou "median"
+    JUDGE_ENSEMBLE_QUORUM: int = int(os.getenv("JUDGE_ENSEMBLE_QUORUM", "2"))
+    JUDGE_ENSEMBLE_INITIAL_JUDGES: int = int(os.getenv("JUDGE_ENSEMBLE_INITIAL_JUDGES", "2"))
+    JUDGE_ENSEMBLE_MIN_MARGIN: float = float(os.getenv("JUDGE_ENSEMBLE_MIN_MARGIN", "0.3"))
+    JUDGE_ENSEMBLE_SCORE_TOLERANCE: float = float(os.getenv("JUDGE_ENSEMBLE_SCORE_TOLERANCE", "1.0"))
+
+    # Cache de prompts quase duplicados (MinHash/LSH local): reaproveita o resultado de um prompt já processado
+    # quando a similaridade estimada dos shingles atinge o limiar
+    NEAR_DUP_ENABLED: bool = _get_bool_env("NEAR_DUP_ENABLED", True)
+    NEAR_DUP_THRESHOLD: float = float(os.getenv("NEAR_DUP_THRESHOLD", "0.85"))
+    NEAR_DUP_NUM_PERM: int = int(os.getenv("NEAR_DUP_NUM_PERM", "128"))
+    NEAR_DUP_BANDS: int = int(os.getenv("NEAR_DUP_BANDS", "16")) # Deve dividir NEAR_DUP_NUM_PERM
+    NEAR_DUP_SHINGLE_SIZE: int = int(os.getenv("NEAR_DUP_SHINGLE_SIZE", "5")) # Caracteres por shingle
+    NEAR_DUP_MAX_ENTRIES: int = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "200000"))
+
+    # Processamento em lote
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "32")) # Itens simultâneos no pipeline
+    BATCH_PROVIDER_CONCURRENCY: int = int(os.getenv("BATCH_PROVIDER_CONCURRENCY", "8")) # Chamadas simultâneas por provedor
+    # Limites específicos por provedor, ex: "gemini=4,openai=16"
+    BATCH_PROVIDER_LIMITS: str = os.getenv("BATCH_PROVIDER_LIMITS", "")
+
+    # Respostas HTTP: compressão (brotli se instalado e aceito pelo cliente, senão gzip) a partir de
+    # RESPONSE_COMPRESSION_MIN_SIZE bytes; streams SSE não são comprimidos
+    RESPONSE_COMPRESSION_ENABLED: bool = _get_bool_env("RESPONSE_COMPRESSION_ENABLED", True)
+    RESPONSE_COMPRESSION_MIN_SIZE: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+    RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+    # Campos omitidos quando o cliente não informa ?exclude= (nomes ou grupos "echo" e "raw", ex: "raw");
+    # vazio mantém a resposta completa. Um campo pedido em ?fields= é sempre incluído
+    RESPONSE_DEFAULT_EXCLUDE: str = os.getenv("RESPONSE_DEFAULT_EXCLUDE", "")
+
+    # Provedores: SDK usado (openai, groq, gemini, fake) e variável com a chave de API. Provedores compatíveis com a API
+    # da OpenAI podem ser acrescentados em MODEL_ROUTES_PATH com "sdk": "openai" e "base_url" (recebem prompt_cache_key
+    # só com "prefix_cache_key": true, pois servidores compatíveis podem recusar campos desconhecidos).
+    DEFAULT_PROVIDERS = {
+        "openai": {"sdk": "openai", "api_key_env": "API_KEY_OPENAI"},
+        "groq": {"sdk": "groq", "api_key_env": "API_KEY_GROQ"},
+        "gemini": {"sdk": "gemini", "api_key_env": "API_KEY_GEMINI"},
+        "fake": {"sdk": "fake"},
+    }
+    # Tabela de roteamento: (provedor, papel) -> modelos candidatos; o primeiro é o padrão. Campos opcionais:
+    # max_prompt_tokens (prompts maiores vão para outro candidato), latency_target_seconds (latência esperada
+    # enquanto não há amostras observadas), context_window e price [entrada, saída] (senão, as tabelas abaixo).
+    DEFAULT_MODEL_ROUTES = {
+        "openai": {
+            "generation": [{"model": "gpt-3.5-turbo", "temperature": 0.7, "latency_target_seconds": 4}],
+            "judge": [{"model": "gpt-4o", "temperature": 0.2, "latency_target_seconds": 8}], # Modelo mais capaz para judge
+        },
+        "groq": {
+            # Para Groq mantemos o mesmo modelo e ajustamos apenas a temperatura do judge.
+            "generation": [{"model": "mixtral-8x7b-32768", "temperature": 0.7, "latency_target_seconds": 2}],
+            "judge": [{"model": "mixtral-8x7b-32768", "temperature": 0.2, "latency_target_seconds": 2}],
+        },
+        "gemini": {
+            "generation": [{"model": "gemini-1.5-flash-latest", "temperature": 0.7, "latency_target_seconds": 3}],
+            "judge": [ # Modelo mais robusto para judge; o flash atende prompts curtos com MODEL_ROUTING_ENABLED
+                {"model": "gemini-1.5-pro-latest", "temperature": 0.2, "latency_target_seconds": 10},
+                {"model": "gemini-1.5-flash-latest", "temperature": 0.2, "latency_target_seconds": 4, "max_prompt_tokens": 1500},
+            ],
+        },
+        "fake": {
+            "generation": [{"model": "fake-generation", "temperature": 0.7}],
+            "judge": [{"model": "fake-judge", "temperature": 0.2}],
+        },
+    }
+    # JSON {"providers": {...}, "routes": {...}} no formato acima, mesclado por provedor e por (provedor, papel)
+    MODEL_ROUTES_PATH: str = os.getenv("MODEL_ROUTES_PATH", "")
+    # Com o roteamento ativo, cada chamada usa o candidato mais barato ("cost") ou mais rápido ("latency")
+    # que comporta o prompt e o prazo da requisição; desativado, usa sempre o primeiro candidato.
+    MODEL_ROUTING_ENABLED: bool = _get_bool_env("MODEL_ROUTING_ENABLED", False)
+    MODEL_ROUTING_OBJECTIVE: str = os.getenv("MODEL_ROUTING_OBJECTIVE", "cost").lower()
+
+    # Observabilidade: cabeçalho Server-Timing por requisição e tabela de preços (USD por 1M tokens de entrada/saída)
+    SERVER_TIMING_ENABLED: bool = _get_bool_env("SERVER_TIMING_ENABLED", False)
+    DEFAULT_MODEL_PRICING = {
+        "gpt-3.5-turbo": (0.50, 1.50),
+        "gpt-4o": (2.50, 10.00),
+        "mixtral-8x7b-32768": (0.24, 0.24),
+        "gemini-1.5-flash-latest": (0.075, 0.30),
+        "gemini-1.5-pro-latest": (1.25, 5.00),
+    }
+    # Preços específicos por modelo, ex: "gpt-4o=2.5/10,gemini-1.5-pro-latest=1.25/5"
+    LLM_PRICING: str = os.getenv("LLM_PRICING", "")
+    # Fração do preço de entrada cobrada pelos tokens servidos do cache de prefixo do provedor
+    DEFAULT_CACHED_INPUT_PRICE_FACTORS = {"openai": 0.5, "gemini": 0.25}
+
+    # Logging estruturado (fila não bloqueante). LOG_FORMAT: "json" ou "text"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_QUEUE_MAX_SIZE: int = int(os.getenv("LOG_QUEUE_MAX_SIZE", "10000")) # Registros além disso são descartados
+    LOG_MAX_MESSAGE_CHARS: int = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+    LOG_MAX_PAYLOAD_CHARS: int = int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "500")) # Saídas de LLM e JSON bruto
+    LOG_MAX_TRACEBACK_CHARS: int = int(os.getenv("LOG_MAX_TRACEBACK_CHARS", "4000"))
+    LOG_PAYLOAD_SAMPLE_RATE: float = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0")) # Fração de payloads registrados
+
+    # Provedor falso (model_type="fake") para desenvolvimento offline e benchmarks
+    FAKE_LLM_LATENCY_MS: float = float(os.getenv("FAKE_LLM_LATENCY_MS", "500")) # Mediana da latência até o 1º token
+    FAKE_LLM_LATENCY_SIGMA: float = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.3")) # Dispersão log-normal; 0 = fixa
+    FAKE_LLM_TOKENS_PER_SECOND: float = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200"))
+    FAKE_LLM_ERROR_RATE: float = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+    FAKE_LLM_RATE_LIMIT_RATE: float = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0")) # Fração de respostas 429
+    FAKE_LLM_SEED: int = int(os.getenv("FAKE_LLM_SEED")) if os.getenv("FAKE_LLM_SEED") else None
+
+    # Gravação/reprodução das respostas dos provedores reais: "record", "replay" ou vazio (desligado)
+    LLM_RECORD_REPLAY_MODE: str = os.getenv("LLM_RECORD_REPLAY_MODE", "")
+    LLM_RECORD_REPLAY_DIR: str = os.getenv("LLM_RECORD_REPLAY_DIR", "recordings")
+
+    # Warm-up no startup: constrói clientes e chains dos provedores listados antes de /ready responder 200
+    WARMUP_ENABLED: bool = _get_bool_env("WARMUP_ENABLED", False)
+    WARMUP_GENERATION_MODEL_TYPES: str = os.getenv("WARMUP_GENERATION_MODEL_TYPES", "gemini")
+    WARMUP_JUDGE_MODEL_TYPES: str = os.getenv("WARMUP_JUDGE_MODEL_TYPES", "gemini")
+
+    # Fila de jobs persistente (/jobs) executada por processos worker
+    JOB_QUEUE_SQLITE_PATH: str = os.getenv("JOB_QUEUE_SQLITE_PATH", "jobs.db")
+    JOB_QUEUE_MAX_DEPTH: int = int(os.getenv("JOB_QUEUE_MAX_DEPTH", "1000")) # Jobs aguardando antes de recusar (429)
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "600")) # Após isso, job de worker morto volta à fila
+    JOB_LEASE_RENEW_SECONDS: float = float(os.getenv("JOB_LEASE_RENEW_SECONDS", "60")) # Intervalo do heartbeat do lease
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_POLL_INTERVAL_SECONDS: float = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "0.5"))
+    JOB_RETENTION_SECONDS: float = float(os.getenv("JOB_RETENTION_SECONDS", "604800"))
+    JOB_WORKER_PROCESSES: int = int(os.getenv("JOB_WORKER_PROCESSES", "0")) # > 0 inicia os workers junto com a API
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", "8")) # Jobs simultâneos por processo
+
+    # Prazo por requisição (campo timeout_seconds ou cabeçalho X-Request-Timeout); 0 = sem prazo padrão
+    REQUEST_DEFAULT_TIMEOUT_SECONDS: float = float(os.getenv("REQUEST_DEFAULT_TIMEOUT_SECONDS", "0"))
+    # Fração do tempo restante reservada à geração; o judge fica com o que sobrar
+    DEADLINE_GENERATION_SHARE: float = float(os.getenv("DEADLINE_GENERATION_SHARE", "0.6"))
+
+    # Orçamento de tokens: contagem local por modelo, admissão do prompt antes das chamadas e saída máxima por estágio
+    TOKENIZER_ENABLED: bool = _get_bool_env("TOKENIZER_ENABLED", True) # tiktoken, se instalado e com as codificações disponíveis
+    TOKEN_COUNT_MARGIN: float = float(os.getenv("TOKEN_COUNT_MARGIN", "1.15")) # Folga aplicada quando a contagem é aproximada
+    MAX_PROMPT_TOKENS: int = int(os.getenv("MAX_PROMPT_TOKENS", "0")) # Limite extra opt-in; 0 = só as janelas de contexto
+    PROMPT_OVERFLOW_POLICY: str = os.getenv("PROMPT_OVERFLOW_POLICY", "reject").lower() # "reject" (413) ou "truncate"
+    LLM_DEFAULT_CONTEXT_WINDOW: int = int(os.getenv("LLM_DEFAULT_CONTEXT_WINDOW", "8192"))
+    DEFAULT_CONTEXT_WINDOWS = {
+        "gpt-3.5-turbo": 16_385,
+        "gpt-4o": 128_000,
+        "mixtral-8x7b-32768": 32_768,
+        "gemini-1.5-flash-latest": 1_048_576,
+        "gemini-1.5-pro-latest": 2_097_152,
+        "fake-generation": 32_768,
+        "fake-judge": 32_768,
+    }
+    # Janelas específicas por modelo, ex: "gpt-4o=128000,mixtral-8x7b-32768=32768"
+    LLM_CONTEXT_WINDOWS: str = os.getenv("LLM_CONTEXT_WINDOWS", "")
+    # Máximo de tokens de saída por estágio (0 = padrão do provedor); a geração é por variante
+    MAX_OUTPUT_TOKENS_REFORMULATION: int = int(os.getenv("MAX_OUTPUT_TOKENS_REFORMULATION", "1024"))
+    MAX_OUTPUT_TOKENS_JUDGE: int = int(os.getenv("MAX_OUTPUT_TOKENS_JUDGE", "2048"))
+    MAX_OUTPUT_TOKENS_SCORE: int = int(os.getenv("MAX_OUTPUT_TOKENS_SCORE", "1024"))
+    MAX_OUTPUT_TOKENS_WINNER: int = int(os.getenv("MAX_OUTPUT_TOKENS_WINNER", "400"))
+    # Templates: "full" (rubrica detalhada) ou "compact" (a mesma rubrica em menos tokens)
+    PROMPT_TEMPLATE_STYLE: str = os.getenv("PROMPT_TEMPLATE_STYLE", "full").lower()
+    # Envia a chave de roteamento do cache de prefixo (prompt_cache_key) aos provedores que a aceitam (a API da
+    # OpenAI e os provedores com "prefix_cache_key": true)
+    PROVIDER_PROMPT_CACHE_ENABLED: bool = _get_bool_env("PROVIDER_PROMPT_CACHE_ENABLED", True)
+
+    def provider_rate_limits(self, provider: str) -> tuple[float, float]:
+        """Retorna (requisições/min, tokens/min) do provedor, com override por variável de ambiente."""
+        default_rpm, default_tpm = self.DEFAULT_RATE_LIMITS.get(provider, (60, 100_000))
+        prefix = f"RATE_LIMIT_{provider.upper()}"
+        return (
+            float(os.getenv(f"{prefix}_RPM", default_rpm)),
+            float(os.getenv(f"{prefix}_TPM", default_tpm)),
+        )
+
+    def model_pricing(self, model_name: str) -> tuple[float, float]:
+        """Retorna (USD por 1M tokens de entrada, USD por 1M tokens de saída) do modelo; (0, 0) se desconhecido."""
+        for entry in self.LLM_PRICING.split(","):
+            name, _, prices = entry.partition("=")
+            if name.strip() == model_name and "/" in prices:
+                input_price, output_price = prices.split("/", 1)
+                return float(input_price), float(output_price)
+        return self.DEFAULT_MODEL_PRICING.get(model_name, (0.0, 0.0))
+
+    def model_context_window(self, model_name: str) -> int:
+        """Retorna a janela de contexto (tokens) do modelo, com override por LLM_CONTEXT_WINDOWS."""
+        for entry in self.LLM_CONTEXT_WINDOWS.split(","):
+            name, _, tokens = entry.partition("=")
+            if name.strip() == model_name and tokens.strip().isdigit():
+                return int(tokens)
+        return self.DEFAULT_CONTEXT_WINDOWS.get(model_name, self.LLM_DEFAULT_CONTEXT_WINDOW)
+
     def __init__(self):
         if not self.API_KEY_GEMINI:
-            print("AVISO: API_KEY_GEMINI não definida no .env.")
+            logger.warning("AVISO: API_KEY_GEMINI não definida no .env.")
         if not self.API_KEY_GROQ:
-            print("AVISO: API_KEY_GROQ não definida no .env.")
+            logger.warning("AVISO: API_KEY_GROQ não definida no .env.")
         if not self.API_KEY_OPENAI:
-            print("AVISO: API_KEY_OPENAI não definida no .env.")
+            logger.warning("AVISO: API_KEY_OPENAI não definida no .env.")
         if not self.API_KEY_JUDGE:
-            print("AVISO: API_KEY_JUDGE não definida no .env.")
+            logger.warning("AVISO: API_KEY_JUDGE não definida no .env.")
 
 settings = Settings()
 
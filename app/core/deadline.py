@@ -0,0 +1,94 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
+
+# Prazo absoluto (relógio do event loop) da requisição atual; herdado pelas tarefas criadas a partir dela
+_deadline_var: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """Levantada quando o prazo da requisição se esgota antes ou durante um estágio."""
+
+    def __init__(self, message: str, stage: str = ""):
+        super().__init__(message)
+        self.stage = stage
+
+
+def _now() -> float:
+    return asyncio.get_running_loop().time()
+
+
+def remaining_time() -> Optional[float]:
+    """Segundos até o prazo da requisição atual (pode ser negativo), ou None se não houver prazo."""
+    deadline = _deadline_var.get()
+    return None if deadline is None else deadline - _now()
+
+
+@contextmanager
+def _deadline_scope(deadline: Optional[float]) -> Iterator[None]:
+    token = _deadline_var.set(deadline)
+    try:
+        yield
+    finally:
+        try:
+            _deadline_var.reset(token)
+        except ValueError:
+            pass # Gerador finalizado em outro contexto: o contexto original já foi descartado
+
+
+@contextmanager
+def request_deadline(timeout_seconds: Optional[float]) -> Iterator[None]:
+    """
+    Define o prazo do bloco como agora + timeout_seconds, sem nunca estender um prazo já definido
+    (vale o menor). timeout_seconds vazio ou <= 0 mantém o prazo atual.
+    """
+    deadline = _deadline_var.get()
+    if timeout_seconds and timeout_seconds > 0:
+        candidate = _now() + timeout_seconds
+        deadline = candidate if deadline is None else min(deadline, candidate)
+    with _deadline_scope(deadline):
+        yield
+
+
+@contextmanager
+def stage_budget(share: float) -> Iterator[None]:
+    """
+    Reserva ao bloco a fração `share` do tempo restante; o resto fica para os estágios seguintes.
+    Sem prazo definido, não faz nada.
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        yield
+        return
+    with _deadline_scope(_now() + max(0.0, remaining) * share):
+        yield
+
+
+def check_deadline(stage: str) -> None:
+    """Levanta DeadlineExceededError se o prazo já passou (evita iniciar trabalho que não será aproveitado)."""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceededError(f"Prazo da requisição esgotado antes do estágio '{stage}'.", stage)
+
+
+@asynccontextmanager
+async def enforce_deadline(stage: str) -> AsyncIterator[None]:
+    """
+    Cancela o bloco quando o prazo da requisição expira, levantando DeadlineExceededError.
+    O cancelamento chega às chamadas em andamento (ex: requisição HTTP ao provedor), liberando a conexão.
+    Não use em torno de um `yield` de gerador assíncrono.
+    """
+    deadline = _deadline_var.get()
+    if deadline is None:
+        yield
+        return
+    check_deadline(stage)
+    timeout = asyncio.timeout_at(deadline)
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if timeout.expired():
+            raise DeadlineExceededError(f"Prazo da requisição esgotado durante o estágio '{stage}'.", stage) from None
+        raise
@@ -0,0 +1,137 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from app.core.config import settings
+
+# Identificador da requisição HTTP atual e estágio do pipeline em execução, anexados a cada registro
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+stage_var: ContextVar[str] = ContextVar("stage", default="-")
+
+# Atributos padrão de LogRecord; o que não estiver aqui veio de `extra` e vai para o JSON
+_STANDARD_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(text: Optional[str], limit: Optional[int] = None) -> str:
+    """Corta textos grandes (saídas de LLM, JSON quebrado) indicando quantos caracteres foram omitidos."""
+    text = "" if text is None else str(text)
+    limit = settings.LOG_MAX_PAYLOAD_CHARS if limit is None else limit
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... (+{len(text) - limit} caracteres)"
+
+
+def sample_payload(text: Optional[str]) -> str:
+    """Versão truncada do payload em uma fração LOG_PAYLOAD_SAMPLE_RATE dos registros; nas demais, só o tamanho."""
+    text = "" if text is None else str(text)
+    if random.random() < settings.LOG_PAYLOAD_SAMPLE_RATE:
+        return truncate(text)
+    return f"<omitido: {len(text)} caracteres>"
+
+
+class _ContextFilter(logging.Filter):
+    """Preenche request_id e stage a partir do contexto, exceto quando vierem explícitos em `extra`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        if not hasattr(record, "stage"):
+            record.stage = stage_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com campos de contexto e os campos extras informados."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), settings.LOG_MAX_MESSAGE_CHARS),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = truncate(self.formatException(record.exc_info), settings.LOG_MAX_TRACEBACK_CHARS)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enfileira registros sem bloquear: a formatação e a escrita em stdout acontecem na thread
+    do QueueListener. Com a fila cheia o registro é descartado e contabilizado.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Só resolve a mensagem (args podem referenciar objetos mutáveis); traceback é formatado no listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_NonBlockingQueueHandler] = None
+
+
+def setup_logging() -> None:
+    """
+    Configura o logger 'app': handler de fila no caminho da requisição e um QueueListener
+    que escreve em stdout (JSON ou texto, conforme LOG_FORMAT). Idempotente.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    output_handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        output_handler.setFormatter(JsonFormatter())
+    else:
+        output_handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s [%(request_id)s] [%(stage)s] %(name)s: %(message)s"
+        ))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAX_SIZE)
+    _queue_handler = _NonBlockingQueueHandler(log_queue)
+    _queue_handler.addFilter(_ContextFilter())
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.addHandler(_queue_handler)
+    app_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Esvazia a fila e encerra a thread do listener (chamado no desligamento da aplicação)."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    logging.getLogger("app").removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+
+
+def dropped_records() -> int:
+    """Registros descartados por fila cheia desde a inicialização."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
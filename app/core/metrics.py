@@ -0,0 +1,281 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.logging_config import dropped_records, stage_var
+
+# Limites padrão dos histogramas de latência (segundos): de parse de JSON (ms) a chamadas LLM longas
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base das métricas: nome, ajuda, nomes de labels e lock para atualizações vindas de threads."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> Iterable[Tuple[str, LabelValues, float, Sequence[str]]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for sample_name, values, value, names in self.samples():
+            lines.append(f"{sample_name}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Contador monotônico por combinação de labels."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for values, value in items:
+            yield self.name, values, value, self.label_names
+
+
+class Gauge(_Metric):
+    """
+    Valor instantâneo por combinação de labels. Com `collect`, os valores são lidos
+    no momento da exportação (ex: chamadas em andamento mantidas por outro componente).
+    """
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = dict(self._values)
+        if self._collect is not None:
+            items.update(self._collect())
+        for values, value in items.items():
+            yield self.name, values, value, self.label_names
+
+
+class Histogram(_Metric):
+    """Histograma cumulativo no formato Prometheus (_bucket, _sum, _count) por combinação de labels."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[LabelValues, List[float]] = {} # contagens por bucket + [soma]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 1)
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[index] += 1
+                    break
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(values, list(series)) for values, series in self._series.items()]
+        bucket_names = self.label_names + ("le",)
+        for values, series in items:
+            cumulative = 0.0
+            for upper_bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket", values + (_format_value(upper_bound),), cumulative, bucket_names
+            yield f"{self.name}_sum", values, series[-1], self.label_names
+            yield f"{self.name}_count", values, cumulative, self.label_names
+
+
+class MetricsRegistry:
+    """Conjunto de métricas do processo, exportado no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Métricas são por processo: com vários workers do uvicorn, cada worker expõe as próprias séries
+registry = MetricsRegistry()
+
+STAGE_LATENCY = registry.register(Histogram(
+    "prompt_api_stage_duration_seconds",
+    "Duração de cada estágio do pipeline (construção do provedor, reformulações, judge, parse de JSON).",
+    ["stage", "provider", "model", "role"],
+))
+HTTP_REQUEST_LATENCY = registry.register(Histogram(
+    "prompt_api_http_request_duration_seconds",
+    "Duração das requisições HTTP por rota e status.",
+    ["method", "route", "status"],
+))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "prompt_api_http_requests_in_flight",
+    "Requisições HTTP em andamento.",
+))
+LLM_CALLS = registry.register(Counter(
+    "prompt_api_llm_calls_total",
+    "Chamadas LLM por estágio e resultado (ok, error, overloaded, deadline, cancelled).",
+    ["stage", "provider", "model", "role", "outcome"],
+))
+REQUESTS_ABANDONED = registry.register(Counter(
+    "prompt_api_requests_abandoned_total",
+    "Requisições interrompidas antes do fim, por rota e motivo (client_disconnect, deadline).",
+    ["route", "reason"],
+))
+LLM_IN_FLIGHT = registry.register(Gauge(
+    "prompt_api_llm_calls_in_flight",
+    "Chamadas LLM em andamento (incluindo espera na admissão).",
+    ["provider", "model", "role"],
+))
+LLM_TOKENS = registry.register(Counter(
+    "prompt_api_llm_tokens_total",
+    "Tokens consumidos por direção (input/output); estimados quando o provedor não informa o uso.",
+    ["provider", "model", "role", "direction"],
+))
+LLM_PROMPT_CACHE_TOKENS = registry.register(Counter(
+    "prompt_api_llm_prompt_cache_tokens_total",
+    "Tokens de entrada por estágio: servidos do cache de prefixo do provedor (hit) ou processados integralmente (miss).",
+    ["stage", "provider", "model", "role", "cache"],
+))
+LLM_COST = registry.register(Counter(
+    "prompt_api_llm_cost_usd_total",
+    "Custo estimado em USD a partir da tabela de preços configurada.",
+    ["provider", "model", "role"],
+))
+JUDGE_JSON_PARSE = registry.register(Counter(
+    "prompt_api_judge_json_parse_total",
+    "Resultados da interpretação da saída do judge (structured, ok, repaired, failed).",
+    ["schema", "outcome"],
+))
+JUDGE_ENSEMBLE_RUNS = registry.register(Counter(
+    "prompt_api_judge_ensemble_runs_total",
+    "Avaliações por ensemble de judges, por desfecho (agreed: parou no acordo; exhausted: sem acordo antes do fim; failed).",
+    ["kind", "outcome"],
+))
+JUDGE_ENSEMBLE_JUDGES = registry.register(Counter(
+    "prompt_api_judge_ensemble_judges_total",
+    "Avaliadores do ensemble por desfecho (answered, failed, cancelled, skipped).",
+    ["kind", "outcome"],
+))
+LOG_RECORDS_DROPPED = registry.register(Gauge(
+    "prompt_api_log_records_dropped",
+    "Registros de log descartados por fila de logging cheia.",
+    collect=lambda: {(): dropped_records()},
+))
+
+# Tempos por estágio da requisição atual, exportados no cabeçalho Server-Timing
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timing() -> Dict[str, float]:
+    """Inicia a coleta de tempos por estágio para a requisição (tarefa) atual e seus filhos."""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_request_timing(stage: str, duration: float) -> None:
+    """Acumula a duração no estágio da requisição atual, se a coleta estiver ativa."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + duration
+
+
+@contextmanager
+def stage_timer(stage: str, provider: str = "", model: str = "", role: str = "") -> Iterator[None]:
+    """
+    Mede o bloco no histograma de estágios e no Server-Timing da requisição atual.
+    Registros de log emitidos dentro do bloco carregam o estágio.
+    """
+    started_at = time.perf_counter()
+    stage_token = stage_var.set(stage)
+    try:
+        yield
+    finally:
+        try:
+            stage_var.reset(stage_token)
+        except ValueError:
+            pass # Gerador finalizado em outro contexto: o contexto original já foi descartado
+        duration = time.perf_counter() - started_at
+        STAGE_LATENCY.observe(duration, stage=stage, provider=provider, model=model, role=role)
+        record_request_timing(stage, duration)
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Formata os tempos (segundos) como cabeçalho Server-Timing (milissegundos)."""
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in timings.items())
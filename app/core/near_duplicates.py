@@ -0,0 +1,210 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+_HASH_MODULUS = (1 << 31) - 1 # a * hash cabe em uint64 sem estouro
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def normalize_for_similarity(text: str) -> str:
+    """Normalização agressiva para similaridade: minúsculas, sem pontuação e com espaços colapsados."""
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+class NearDuplicateIndex:
+    """
+    Índice local de prompts quase duplicados: MinHash sobre shingles de caracteres do texto normalizado,
+    com LSH em faixas (bands) para achar candidatos sem varrer o índice. A similaridade estimada
+    (fração de posições iguais na assinatura ≈ Jaccard dos shingles) decide o acerto.
+
+    Cada entrada guarda o escopo (ex: endpoint + modelos), o prompt e a chave do resultado no cache;
+    só entradas do mesmo escopo são comparadas. O índice vive em memória, limitado a max_entries
+    (as mais antigas saem primeiro), e é persistido no SQLite opcional para ser recarregado com load().
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        num_perm: int,
+        bands: int,
+        shingle_size: int,
+        max_entries: int,
+        sqlite_path: str = "",
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError(f"NearDuplicateIndex: num_perm ({num_perm}) deve ser múltiplo de bands ({bands}).")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self.sqlite_path = sqlite_path
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _HASH_MODULUS, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _HASH_MODULUS, size=(num_perm, 1), dtype=np.uint64)
+        self._powers = np.array([pow(31, exponent, 1 << 64) for exponent in range(shingle_size)], dtype=np.uint64)
+
+        self._lock = threading.Lock()
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self._entries: Dict[int, tuple] = {} # id -> (escopo, chave do cache, prompt, chaves dos buckets)
+        self._ids_by_key: Dict[str, int] = {}
+        self._buckets: Dict[int, set] = {}
+        self._order: "OrderedDict[int, None]" = OrderedDict() # ids por ordem de inserção (evicção)
+        self._free_ids: list = []
+        self._next_id = 0
+        self.stats: Dict[str, Any] = {"lookups": 0, "hits": 0, "candidates": 0, "lookup_seconds": 0.0}
+        self._local = threading.local()
+        if sqlite_path:
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates ("
+                " key TEXT PRIMARY KEY, scope TEXT NOT NULL, prompt TEXT NOT NULL, signature BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.sqlite_path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def signature(self, text: str) -> np.ndarray:
+        """Assinatura MinHash (num_perm valores uint32) dos shingles de caracteres do texto normalizado."""
+        normalized = normalize_for_similarity(text)
+        codepoints = np.frombuffer(normalized.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        if len(codepoints) < self.shingle_size:
+            codepoints = np.pad(codepoints, (0, self.shingle_size - len(codepoints)))
+        windows = np.lib.stride_tricks.sliding_window_view(codepoints, self.shingle_size)
+        # Hash polinomial de cada shingle (aritmética módulo 2^64), reduzido para caber nas permutações
+        shingles = np.unique((windows * self._powers).sum(axis=1, dtype=np.uint64) % np.uint64(_HASH_MODULUS))
+        return ((self._a * shingles + self._b) % np.uint64(_HASH_MODULUS)).min(axis=1).astype(np.uint32)
+
+    def _bucket_keys(self, scope: str, signature: np.ndarray) -> list:
+        return [hash((scope, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())) for band in range(self.bands)]
+
+    def lookup(self, scope: str, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Procura o prompt mais parecido do mesmo escopo. Retorna {'key', 'prompt', 'similarity'}
+        se a similaridade estimada atingir o limiar, ou None.
+        """
+        started_at = time.perf_counter()
+        signature = self.signature(text)
+        with self._lock:
+            candidate_ids = set()
+            for bucket_key in self._bucket_keys(scope, signature):
+                candidate_ids.update(self._buckets.get(bucket_key, ()))
+            candidate_ids = [entry_id for entry_id in candidate_ids if self._entries[entry_id][0] == scope]
+            match = None
+            if candidate_ids:
+                similarities = (self._signatures[candidate_ids] == signature).mean(axis=1)
+                best = int(similarities.argmax())
+                if similarities[best] >= self.threshold:
+                    _, key, prompt, _ = self._entries[candidate_ids[best]]
+                    match = {"key": key, "prompt": prompt, "similarity": round(float(similarities[best]), 4)}
+            self.stats["lookups"] += 1
+            self.stats["hits"] += match is not None
+            self.stats["candidates"] += len(candidate_ids)
+            self.stats["lookup_seconds"] += time.perf_counter() - started_at
+        return match
+
+    def _insert(self, scope: str, key: str, prompt: str, signature: np.ndarray) -> None:
+        """Insere (ou substitui) a entrada em memória. Requer self._lock."""
+        if key in self._ids_by_key:
+            self._remove(self._ids_by_key[key])
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._order)))
+
+        if self._free_ids:
+            entry_id = self._free_ids.pop()
+        else:
+            entry_id = self._next_id
+            self._next_id += 1
+            if entry_id >= len(self._signatures):
+                grown = np.zeros((len(self._signatures) * 2, self.num_perm), dtype=np.uint32)
+                grown[:len(self._signatures)] = self._signatures
+                self._signatures = grown
+        self._signatures[entry_id] = signature
+        bucket_keys = self._bucket_keys(scope, signature)
+        for bucket_key in bucket_keys:
+            self._buckets.setdefault(bucket_key, set()).add(entry_id)
+        self._entries[entry_id] = (scope, key, prompt, bucket_keys)
+        self._ids_by_key[key] = entry_id
+        self._order[entry_id] = None
+
+    def _remove(self, entry_id: int) -> None:
+        """Remove a entrada da memória. Requer self._lock."""
+        _, key, _, bucket_keys = self._entries.pop(entry_id)
+        del self._ids_by_key[key]
+        del self._order[entry_id]
+        for bucket_key in bucket_keys:
+            bucket = self._buckets[bucket_key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[bucket_key]
+        self._free_ids.append(entry_id)
+
+    def add(self, scope: str, text: str, key: str) -> np.ndarray:
+        """Indexa o prompt cujo resultado está no cache sob `key`. Retorna a assinatura calculada."""
+        signature = self.signature(text)
+        with self._lock:
+            self._insert(scope, key, text, signature)
+        return signature
+
+    def discard(self, key: str) -> None:
+        """Remove a entrada de `key` (ex: resultado expirado no cache)."""
+        with self._lock:
+            entry_id = self._ids_by_key.get(key)
+            if entry_id is not None:
+                self._remove(entry_id)
+
+    def _persist(self, scope: str, text: str, key: str, signature: np.ndarray) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO near_duplicates (key, scope, prompt, signature, created_at) VALUES (?, ?, ?, ?, ?)",
+            (key, scope, text, signature.tobytes(), time.time()),
+        )
+
+    async def aadd(self, scope: str, text: str, key: str) -> None:
+        """add() seguido da gravação no SQLite (em thread separada), se configurado."""
+        signature = self.add(scope, text, key)
+        if self.sqlite_path:
+            await asyncio.to_thread(self._persist, scope, text, key, signature)
+
+    def load(self, max_age_seconds: float) -> int:
+        """Recarrega do SQLite as entradas mais recentes que max_age_seconds (as antigas são apagadas). Retorna quantas."""
+        if not self.sqlite_path:
+            return 0
+        conn = self._connect()
+        cutoff = time.time() - max_age_seconds
+        conn.execute("DELETE FROM near_duplicates WHERE created_at < ?", (cutoff,))
+        rows = conn.execute(
+            "SELECT scope, key, prompt, signature FROM near_duplicates ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        with self._lock:
+            for scope, key, prompt, signature in reversed(rows):
+                stored = np.frombuffer(signature, dtype=np.uint32)
+                if len(stored) == self.num_perm: # Assinaturas de outra configuração são ignoradas
+                    self._insert(scope, key, prompt, stored)
+        return len(rows)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Retorna os contadores atuais e o tamanho do índice."""
+        lookups = self.stats["lookups"]
+        return {
+            "entries": len(self._entries),
+            "lookups": lookups,
+            "hits": self.stats["hits"],
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_candidates": round(self.stats["candidates"] / lookups, 2) if lookups else 0.0,
+            "avg_lookup_ms": round(1000 * self.stats["lookup_seconds"] / lookups, 4) if lookups else 0.0,
+            "threshold": self.threshold,
+        }
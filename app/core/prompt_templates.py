@@ -1,6 +1,44 @@
-UNIFIED_REFORMULATION_TEMPLATE = """
-Com base nos seguintes critérios de qualidade para prompts, reformule o prompt original fornecido.
-O objetivo é criar uma versão significativamente melhorada do prompt.
+from app.core.config import settings
+
+# Conjunto de templates em uso: "full" ou "compact" (mesma rubrica em menos tokens)
+TEMPLATE_STYLE = settings.PROMPT_TEMPLATE_STYLE
+_STYLE_SUFFIX = "" if TEMPLATE_STYLE == "full" else f"-{TEMPLATE_STYLE}"
+
+# Incrementar sempre que um template mudar, para invalidar resultados em cache.
+# Os templates são divididos em um bloco de sistema fixo (rubrica e instruções, idêntico em todas as chamadas,
+# o que permite ao provedor reaproveitar o prefixo em cache) e uma parte variável com o texto do usuário no final.
+TEMPLATE_VERSION = "4" + _STYLE_SUFFIX
+
+# Incrementar sempre que os critérios ou a forma de pontuá-los mudarem (invalida o cache de notas por texto).
+RUBRIC_VERSION = "2" + _STYLE_SUFFIX
+
+
+
+def prefix_cache_key(template_name: str) -> str:
+    """Chave de roteamento do cache de prefixo do provedor para as chamadas de um template (muda com TEMPLATE_VERSION)."""
+    return f"prompt-api:{template_name}:v{TEMPLATE_VERSION}"
+
+
+# Linha que antecede cada candidata quando várias reformulações são pedidas em uma única chamada.
+REFORMULATION_SEPARATOR = "### REFORMULAÇÃO ###"
+
+# Os 10 critérios da rubrica, na ordem em que aparecem em evaluationData.
+EVALUATION_CRITERIA = [
+    "Clareza e Especificidade",
+    "Estrutura e Organização",
+    "Consistência Interna",
+    "Contextualização",
+    "Parâmetros de Execução",
+    "Eficiência Linguística",
+    "Robustez",
+    "Adaptabilidade",
+    "Preparação e Enquadramento",
+    "Princípios Éticos",
+]
+
+# Bloco de sistema da geração, compartilhado pela reformulação única e pela de múltiplas variantes
+REFORMULATION_SYSTEM_TEMPLATE = """
+Você reformula prompts para torná-los significativamente melhores, com base nos seguintes critérios de qualidade.
 
 Critérios de Qualidade para Prompts:
 1.  **Clareza e Especificidade**: Reduza ambiguidades, aumente o detalhamento e defina claramente os objetivos.
@@ -14,13 +52,58 @@ Critérios de Qualidade para Prompts:
 9.  **Preparação e Enquadramento**: Use exemplos neutros e enquadre cognitivamente a tarefa.
 10. **Princípios Éticos**: Assegure responsabilidade, transparência e inclusão.
 
+O prompt original vem na mensagem do usuário, entre aspas triplas, seguido da tarefa.
+Aplique os critérios acima para melhorá-lo substancialmente. Para gerar uma variação, você pode, por exemplo,
+focar em diferentes aspectos dos critérios ou explorar diferentes formas de aplicar as melhorias.
+Não inclua nenhuma explicação, introdução, ou qualquer texto além do que a tarefa pede.
+"""
+
+UNIFIED_REFORMULATION_TEMPLATE = """
+Prompt Original a ser Reformulado:
+\"\"\"
+{prompt_original_text}
+\"\"\"
+
+Sua Tarefa:
+Reescreva o prompt original e retorne APENAS o novo prompt reformulado.
+"""
+
+MULTI_REFORMULATION_TEMPLATE = """
 Prompt Original a ser Reformulado:
 \"\"\"
 {prompt_original_text}
 \"\"\"
 
 Sua Tarefa:
-Reescreva o prompt original, aplicando os critérios de qualidade acima para melhorá-lo substancialmente.
-Retorne APENAS o novo prompt reformulado. Não inclua nenhuma explicação, introdução, ou qualquer texto além do prompt reformulado.
-Para gerar uma variação, você pode, por exemplo, focar em diferentes aspectos dos critérios ou explorar diferentes formas de aplicar as melhorias.
+Escreva {num_variants} reformulações DISTINTAS do prompt original, cada uma explorando uma abordagem diferente.
+Antes de cada reformulação, escreva uma linha contendo apenas {separator}
+Não inclua numeração nem qualquer texto além das reformulações.
+"""
+
+# Versões compactas (PROMPT_TEMPLATE_STYLE=compact): mesmos critérios e formato de saída, em menos tokens
+COMPACT_REFORMULATION_SYSTEM_TEMPLATE = """
+Você reformula prompts para melhorá-los substancialmente segundo os critérios: clareza e especificidade;
+estrutura lógica; consistência interna; contexto suficiente; restrições, formato e critérios de sucesso;
+concisão; robustez a casos extremos; adaptabilidade; exemplos neutros e enquadramento; princípios éticos.
+O prompt vem na mensagem do usuário, entre aspas triplas, seguido da tarefa. Não inclua explicações.
+"""
+
+COMPACT_REFORMULATION_TEMPLATE = """
+Prompt:
+\"\"\"
+{prompt_original_text}
+\"\"\"
+
+Retorne APENAS o prompt reformulado.
+"""
+
+COMPACT_MULTI_REFORMULATION_TEMPLATE = """
+Prompt:
+\"\"\"
+{prompt_original_text}
+\"\"\"
+
+Escreva {num_variants} reformulações DISTINTAS, cada uma com uma abordagem diferente.
+Antes de cada uma, escreva uma linha contendo apenas {separator}
+Retorne apenas as reformulações, sem numeração.
 """
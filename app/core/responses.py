@@ -0,0 +1,80 @@
+import json
+from typing import Any, Dict, FrozenSet, Optional, Set, Type, Union
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.core.config import settings
+
+try:
+    import orjson # Dependência opcional: sem ela, serializa com o json da biblioteca padrão
+except ImportError:
+    orjson = None
+
+# Grupos aceitos em ?fields= e ?exclude=: conteúdo ecoado da requisição (o prompt e version1/version2, que
+# repetem as duas primeiras de `variants`) e a saída bruta do judge
+FIELD_GROUPS: Dict[str, FrozenSet[str]] = {
+    "echo": frozenset({"original_prompt", "prompt", "version1", "version2"}),
+    "raw": frozenset({"raw_judge_output"}),
+}
+
+
+def json_dumps(content: Any) -> str:
+    """JSON compacto (UTF-8 sem escapes), com orjson quando instalado. Usado nos eventos SSE."""
+    if orjson is None:
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializada com orjson (várias vezes mais rápido que json.dumps); sem orjson, igual à JSONResponse."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _names(raw: Optional[str]) -> Set[str]:
+    return {name.strip() for name in (raw or "").split(",") if name.strip()}
+
+
+class FieldSelection:
+    """
+    Campos de primeiro nível da resposta pedidos pelo cliente (?fields=, só estes) ou omitidos (?exclude=,
+    ou RESPONSE_DEFAULT_EXCLUDE se ausente), por nome ou pelos grupos de FIELD_GROUPS.
+    Os schemas não mudam: os campos omitidos simplesmente não aparecem no JSON.
+    """
+
+    def __init__(self, fields: Optional[str] = None, exclude: Optional[str] = None):
+        self.fields = _names(fields)
+        self.exclude = _names(exclude if exclude is not None else settings.RESPONSE_DEFAULT_EXCLUDE)
+
+    def excluded(self, model: Type[BaseModel]) -> Set[str]:
+        """Campos de `model` a omitir. Levanta ValueError para nomes que não são campos nem grupos."""
+        known = set(model.model_fields)
+
+        def expand(names: Set[str]) -> Set[str]:
+            expanded: Set[str] = set()
+            for name in names:
+                if name in FIELD_GROUPS:
+                    expanded |= FIELD_GROUPS[name] & known
+                elif name in known:
+                    expanded.add(name)
+                else:
+                    raise ValueError(f"Campo desconhecido '{name}'. Opções: {', '.join(sorted(known | set(FIELD_GROUPS)))}.")
+            return expanded
+
+        excluded = expand(self.exclude)
+        if self.fields:
+            requested = expand(self.fields)
+            excluded = (excluded | (known - requested)) - requested
+        return excluded
+
+
+def model_response(model: BaseModel, exclude: Optional[Union[Set[str], Dict[str, Any]]] = None) -> FastJSONResponse:
+    """
+    Serializa o modelo direto na resposta, sem a revalidação e a segunda serialização do response_model
+    feitas pelo FastAPI (o response_model da rota segue valendo para a documentação).
+    """
+    return FastJSONResponse(model.model_dump(exclude=exclude or None))
@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class _InFlightCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesce chamadas concorrentes com a mesma chave em uma única computação.
+    Todos os chamadores aguardam a mesma tarefa e recebem o mesmo resultado ou exceção.
+    Se todos os chamadores desistirem (cancelamento/desconexão), a tarefa compartilhada é cancelada.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _InFlightCall] = {}
+
+    def _forget(self, key: str, call: _InFlightCall) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa factory() uma única vez por chave enquanto houver uma chamada em andamento."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _InFlightCall(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _task: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            # shield: o cancelamento de um chamador não cancela a tarefa compartilhada
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                # Último interessado saiu: libera a chave imediatamente e cancela o trabalho
+                self._forget(key, call)
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def in_flight(self) -> int:
+        """Número de computações distintas em andamento."""
+        return len(self._calls)
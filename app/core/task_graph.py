@@ -0,0 +1,44 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class TaskGraph:
+    """
+    Pequeno grafo de dependências de tarefas assíncronas: cada nó roda assim que os nós de que depende
+    terminam, recebendo os resultados deles como argumentos (na ordem das dependências).
+    Os nós são adicionados depois das suas dependências, o que impede ciclos. A primeira falha
+    cancela os nós ainda em andamento e é propagada por run().
+    """
+
+    def __init__(self):
+        self._nodes: Dict[str, Tuple[Callable[..., Awaitable[Any]], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]], *dependencies: str) -> None:
+        """Registra o nó `name`, que executa func(*resultados das dependências)."""
+        if name in self._nodes:
+            raise ValueError(f"TaskGraph: nó '{name}' já registrado.")
+        missing = [dependency for dependency in dependencies if dependency not in self._nodes]
+        if missing:
+            raise ValueError(f"TaskGraph: dependências não registradas para '{name}': {', '.join(missing)}.")
+        self._nodes[name] = (func, dependencies)
+
+    async def run(self) -> Dict[str, Any]:
+        """Executa o grafo (as tarefas herdam o contexto, ex: o prazo da requisição) e retorna {nó: resultado}."""
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_node(func: Callable[..., Awaitable[Any]], dependencies: Tuple[asyncio.Task, ...]) -> Any:
+            # A exceção de uma dependência é propagada (e tratada) pela própria dependência em gather
+            results = [await dependency for dependency in dependencies]
+            return await func(*results)
+
+        for name, (func, dependencies) in self._nodes.items():
+            tasks[name] = asyncio.ensure_future(run_node(func, tuple(tasks[dependency] for dependency in dependencies)))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        finally:
+            pending = [task for task in tasks.values() if not task.done()]
+            for task in pending:
+                task.cancel()
+            # Recolhe as exceções dos nós cancelados ou que falharam junto (evita "exception was never retrieved")
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return dict(zip(tasks, results))
@@ -1,8 +1,86 @@
-from fastapi import FastAPI
+import time
+
+# Início da inicialização do worker, antes dos imports pesados (tempo de cold start)
+BOOT_STARTED_AT = time.perf_counter()
+
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.api.v1.endpoints import prompts
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
+from app.core.logging_config import request_id_var, setup_logging, shutdown_logging
+from app.core.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_LATENCY, registry, server_timing_header, start_request_timing
+from app.providers.llm_provider import llm_registry
+from app.services.job_worker import JobWorkerPool
+from app.services.warmup import readiness, run_startup
+
+
+setup_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-up em segundo plano: o worker já responde /health enquanto /ready indica 503
+    startup_task = asyncio.create_task(run_startup(BOOT_STARTED_AT))
+    # Workers da fila de jobs embutidos (opcional; em produção prefira `python -m app.services.job_worker`)
+    job_workers = JobWorkerPool(settings.JOB_WORKER_PROCESSES, settings.JOB_WORKER_CONCURRENCY)
+    job_workers.start()
+    yield
+    startup_task.cancel()
+    await asyncio.to_thread(job_workers.stop)
+    # Fecha o pool de conexões compartilhado pelos clientes LLM
+    await llm_registry.aclose()
+    # Escreve os registros de log ainda na fila
+    shutdown_logging()
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# Compressão das respostas grandes (gzip/brotli conforme o Accept-Encoding). Registrada antes dos demais
+# middlewares para ficar junto das rotas: recebe o corpo inteiro (o middleware "http" abaixo o repassa em partes,
+# o que desativaria o tamanho mínimo e o Content-Length)
+if settings.RESPONSE_COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE,
+        gzip_level=settings.RESPONSE_GZIP_LEVEL,
+        brotli_quality=settings.RESPONSE_BROTLI_QUALITY,
+    )
+
+
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    """
+    Associa um request id (X-Request-ID recebido ou gerado) aos logs da requisição,
+    mede sua duração e, se habilitado, expõe os tempos por estágio no cabeçalho Server-Timing.
+    """
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    timings = start_request_timing()
+    started_at = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        # Em respostas em streaming os cabeçalhos saem antes do corpo: só os estágios já concluídos aparecem
+        if settings.SERVER_TIMING_ENABLED:
+            timings["total"] = time.perf_counter() - started_at
+            response.headers["Server-Timing"] = server_timing_header(timings)
+        return response
+    finally:
+        HTTP_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        HTTP_REQUEST_LATENCY.observe(
+            time.perf_counter() - started_at,
+            method=request.method, route=getattr(route, "path", "unmatched"), status=str(status_code)
+        )
 
 # Liberar o React para consumir a API
 app.add_middleware(
@@ -15,3 +93,21 @@ app.add_middleware(
 
 # Incluir as rotas
 app.include_router(prompts.router, prefix="/api/v1", tags=["Prompts"])
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas do processo no formato texto do Prometheus."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/health", include_in_schema=False)
+async def health():
+    """Liveness: o processo está de pé e atendendo."""
+    return {"status": "ok"}
+
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness: 200 após o warm-up (clientes, chains e pool HTTP prontos); 503 enquanto inicializa."""
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
@@ -0,0 +1,355 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import Gauge, registry
+
+
+class ProviderOverloadedError(Exception):
+    """
+    Levantada quando uma chamada não é admitida (circuito aberto ou cota do provedor
+    esgotada por mais tempo do que a espera máxima permitida) ou quando o provedor responde 429.
+    """
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token)."""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Identifica respostas 429 / cota esgotada dos SDKs OpenAI, Groq e Gemini."""
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429:
+        return True
+    name = type(error).__name__
+    return "RateLimit" in name or "ResourceExhausted" in name or "429" in str(error)
+
+
+def rate_limit_retry_after(error: BaseException, default: float = 1.0) -> float:
+    """Espera sugerida pelo provedor no 429 (cabeçalhos Retry-After / retry-after-ms), ou `default`."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            value = float(headers.get(header)) * scale
+        except (TypeError, ValueError):
+            continue # Ausente ou no formato de data HTTP
+        if value > 0:
+            return value
+    return default
+
+
+class TokenBucket:
+    """
+    Balde de fichas com reposição contínua. Admite saldo negativo para que o consumo
+    real (ex: tokens de saída) possa ser reconciliado depois da chamada (ver reconcile).
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def time_until_available(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate_per_second if self.rate_per_second > 0 else float("inf")
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """Devolve fichas consumidas por uma chamada que não chegou a ser feita."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def reconcile(self, reserved: float, actual: float) -> None:
+        """Troca a reserva estimada pelo consumo real: cobra a diferença ou devolve o excesso."""
+        if actual >= reserved:
+            self.consume(actual - reserved)
+        else:
+            self.refund(reserved - actual)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limite de concorrência AIMD: cresce aditivamente a cada sucesso e encolhe
+    multiplicativamente diante de 429 ou de picos de latência (amostra muito acima da média móvel).
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_spike_factor: float):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_spike_factor = latency_spike_factor
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, timeout: float) -> None:
+        async with self._condition:
+            if self.in_flight >= int(self.limit):
+                await asyncio.wait_for(self._condition.wait_for(lambda: self.in_flight < int(self.limit)), timeout)
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        if self.latency_ewma is not None and latency > self.latency_ewma * self.latency_spike_factor:
+            self.limit = max(self.minimum, self.limit * 0.7)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+
+    def on_overload(self) -> None:
+        self.limit = max(self.minimum, self.limit * 0.5)
+
+
+class CircuitBreaker:
+    """
+    Disjuntor clássico: abre após N falhas consecutivas, rejeita chamadas durante o
+    período de espera e então libera uma única chamada de teste (meio-aberto).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def release_probe(self) -> None:
+        """Libera a vaga de teste quando a chamada não chegou a produzir sucesso ou falha."""
+        self._probe_in_flight = False
+
+    def on_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def on_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Janela deslizante das latências bem-sucedidas mais recentes de um (provedor, modelo)."""
+
+    def __init__(self, window: int):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Percentil q (0-100) pelo método nearest-rank; None se ainda não houver amostras."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(0, math.ceil(q / 100.0 * len(ordered)) - 1)
+        return ordered[rank]
+
+
+class ProviderGuard:
+    """
+    Controle de admissão de um par (provedor, modelo): limites de requisições e tokens por minuto,
+    concorrência adaptativa e disjuntor. Usado pelos papéis de geração e de judge do mesmo modelo.
+    """
+
+    def __init__(self, provider: str, model_name: str, requests_per_minute: float, tokens_per_minute: float):
+        self.provider = provider
+        self.model_name = model_name
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial=settings.LLM_ADAPTIVE_INITIAL_CONCURRENCY,
+            minimum=settings.LLM_ADAPTIVE_MIN_CONCURRENCY,
+            maximum=settings.LLM_ADAPTIVE_MAX_CONCURRENCY,
+            latency_spike_factor=settings.LLM_LATENCY_SPIKE_FACTOR,
+        )
+        self.breaker = CircuitBreaker(settings.LLM_BREAKER_FAILURE_THRESHOLD, settings.LLM_BREAKER_RESET_SECONDS)
+        self.latency = LatencyTracker(settings.LLM_LATENCY_WINDOW)
+        self._bucket_lock = asyncio.Lock()
+
+    def _label(self) -> str:
+        return f"{self.provider}/{self.model_name}"
+
+    async def _admit(self, estimated_tokens: int) -> None:
+        if not self.breaker.allow():
+            raise ProviderOverloadedError(
+                f"Provedor {self._label()} indisponível (circuito aberto).", retry_after=self.breaker.retry_after() or 1.0
+            )
+
+        max_wait = settings.LLM_ADMISSION_MAX_WAIT_SECONDS
+        deadline = time.monotonic() + max_wait
+        consumed = False
+        try:
+            async with self._bucket_lock:
+                wait = max(self.request_bucket.time_until_available(1), self.token_bucket.time_until_available(estimated_tokens))
+                if wait > max_wait:
+                    raise ProviderOverloadedError(f"Cota do provedor {self._label()} esgotada.", retry_after=wait)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.request_bucket.consume(1)
+                self.token_bucket.consume(estimated_tokens)
+                consumed = True
+
+            try:
+                await self.concurrency.acquire(timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise ProviderOverloadedError(f"Concorrência do provedor {self._label()} saturada.", retry_after=1.0)
+        except BaseException:
+            if consumed: # Recusada (ou cancelada) depois de reservar a cota: a chamada não acontece
+                self.request_bucket.refund(1)
+                self.token_bucket.refund(estimated_tokens)
+            self.breaker.release_probe()
+            raise
+
+    def reconcile_tokens(self, reserved_tokens: int, actual_tokens: int) -> None:
+        """Ajusta a cota de tokens com o uso real informado pelo provedor depois da chamada."""
+        self.token_bucket.reconcile(reserved_tokens, actual_tokens)
+
+    def _overloaded_from(self, error: BaseException) -> Optional[ProviderOverloadedError]:
+        """
+        Converte um 429 do provedor (que a estimativa dos baldes não evitou) em ProviderOverloadedError,
+        para que chegue ao cliente como 503 + Retry-After em vez de uma falha genérica.
+        """
+        if not isinstance(error, Exception) or not is_rate_limit_error(error):
+            return None
+        return ProviderOverloadedError(
+            f"Provedor {self._label()} recusou a chamada por limite de taxa (429).", retry_after=rate_limit_retry_after(error)
+        )
+
+    def _record_outcome(self, started_at: float, error: Optional[BaseException]) -> None:
+        if error is None:
+            latency = time.monotonic() - started_at
+            self.latency.record(latency)
+            self.concurrency.on_success(latency)
+            self.breaker.on_success()
+        elif is_rate_limit_error(error):
+            self.concurrency.on_overload()
+            self.breaker.release_probe()
+        elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            self.breaker.release_probe()
+        else:
+            self.breaker.on_failure()
+
+    async def run(self, call: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Any:
+        """
+        Executa call() depois de admitida, registrando o resultado nos limitadores.
+        Levanta ProviderOverloadedError se a chamada não for admitida ou se o provedor responder 429.
+        """
+        await self._admit(estimated_tokens)
+        started_at = time.monotonic()
+        error: Optional[BaseException] = None
+        try:
+            return await call()
+        except BaseException as e:
+            error = e
+            overloaded = self._overloaded_from(e)
+            if overloaded is not None:
+                raise overloaded from e
+            raise
+        finally:
+            self._record_outcome(started_at, error)
+            await self.concurrency.release()
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[Any]], estimated_tokens: int) -> AsyncIterator[Any]:
+        """Versão em streaming de run(): a vaga é mantida até o fim do fluxo."""
+        await self._admit(estimated_tokens)
+        started_at = time.monotonic()
+        error: Optional[BaseException] = None
+        try:
+            async for item in open_stream():
+                yield item
+        except BaseException as e:
+            error = e
+            overloaded = self._overloaded_from(e)
+            if overloaded is not None:
+                raise overloaded from e
+            raise
+        finally:
+            self._record_outcome(started_at, error)
+            await self.concurrency.release()
+
+
+_guards: Dict[Tuple[str, str], ProviderGuard] = {}
+
+
+def get_provider_guard(provider: str, model_name: str) -> ProviderGuard:
+    """Retorna o ProviderGuard compartilhado do par (provedor, modelo)."""
+    key = (provider, model_name)
+    guard = _guards.get(key)
+    if guard is None:
+        requests_per_minute, tokens_per_minute = settings.provider_rate_limits(provider)
+        guard = ProviderGuard(provider, model_name, requests_per_minute, tokens_per_minute)
+        _guards[key] = guard
+    return guard
+
+
+def find_provider_guard(provider: str, model_name: str) -> Optional[ProviderGuard]:
+    """ProviderGuard do par, se já existir (consulta de estatísticas sem criar um novo)."""
+    return _guards.get((provider, model_name))
+
+
+def _collect_from_guards(read: Callable[[ProviderGuard], float]) -> Dict[Tuple[str, str], float]:
+    return {(guard.provider, guard.model_name): read(guard) for guard in list(_guards.values())}
+
+
+registry.register(Gauge(
+    "prompt_api_provider_admitted_in_flight", "Chamadas admitidas e em execução por (provedor, modelo).",
+    ["provider", "model"], collect=lambda: _collect_from_guards(lambda guard: guard.concurrency.in_flight),
+))
+registry.register(Gauge(
+    "prompt_api_provider_concurrency_limit", "Limite atual da concorrência adaptativa por (provedor, modelo).",
+    ["provider", "model"], collect=lambda: _collect_from_guards(lambda guard: int(guard.concurrency.limit)),
+))
+registry.register(Gauge(
+    "prompt_api_provider_circuit_open", "1 se o disjuntor do (provedor, modelo) não está fechado.",
+    ["provider", "model"], collect=lambda: _collect_from_guards(lambda guard: float(guard.breaker.state != CircuitBreaker.CLOSED)),
+))
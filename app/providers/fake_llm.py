@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+from app.core.prompt_templates import EVALUATION_CRITERIA, REFORMULATION_SEPARATOR
+from app.providers.admission import estimate_tokens
+
+
+class FakeProviderError(Exception):
+    """Falha genérica injetada pelo provedor falso."""
+
+
+class FakeRateLimitError(Exception):
+    """Resposta 429 injetada pelo provedor falso (reconhecida por is_rate_limit_error)."""
+
+    status_code = 429
+
+
+def _messages_text(messages: List[BaseMessage]) -> str:
+    return "\n".join(message.content if isinstance(message.content, str) else str(message.content) for message in messages)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Modelo de chat offline para desenvolvimento e benchmarks (model_type="fake").
+    Latência com distribuição log-normal, streaming com velocidade configurável em tokens/s,
+    injeção de falhas e de 429, suporte ao parâmetro `n` e respostas JSON canônicas para todos os formatos do judge.
+    As notas canônicas são derivadas do hash do texto, então o mesmo prompt recebe as mesmas notas.
+    Simula o cache de prefixo dos provedores: a partir da segunda chamada com o mesmo bloco de sistema,
+    os tokens dele são informados como lidos do cache (input_token_details.cache_read).
+    """
+
+    model_name: str = "fake"
+    latency_median_seconds: float = 0.5
+    latency_sigma: float = 0.3 # Desvio do log da latência; 0 deixa a latência fixa
+    tokens_per_second: float = 200.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: Optional[int] = None
+    max_tokens: Optional[int] = None # Limite de saída (~4 caracteres por token), como o dos SDKs reais
+
+    _rng: random.Random = PrivateAttr(default=None)
+    _cached_prefixes: set = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    def _cached_tokens(self, messages: List[BaseMessage]) -> int:
+        """Tokens do bloco de sistema já visto antes (lido do "cache"); registra o bloco para as próximas chamadas."""
+        if not messages or not isinstance(messages[0], SystemMessage):
+            return 0
+        prefix = hashlib.sha256(str(messages[0].content).encode("utf-8")).digest()
+        if prefix in self._cached_prefixes:
+            return estimate_tokens(str(messages[0].content))
+        self._cached_prefixes.add(prefix)
+        return 0
+
+    @classmethod
+    def from_settings(cls, model_name: str) -> "FakeChatModel":
+        """Instância configurada pelas variáveis FAKE_LLM_*."""
+        return cls(
+            model_name=model_name,
+            latency_median_seconds=settings.FAKE_LLM_LATENCY_MS / 1000.0,
+            latency_sigma=settings.FAKE_LLM_LATENCY_SIGMA,
+            tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND,
+            error_rate=settings.FAKE_LLM_ERROR_RATE,
+            rate_limit_rate=settings.FAKE_LLM_RATE_LIMIT_RATE,
+            seed=settings.FAKE_LLM_SEED,
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _sample_latency(self) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_median_seconds
+        return self.latency_median_seconds * self._rng.lognormvariate(0.0, self.latency_sigma)
+
+    def _maybe_fail(self) -> None:
+        draw = self._rng.random()
+        if draw < self.rate_limit_rate:
+            raise FakeRateLimitError("fake: 429 Too Many Requests (injetado)")
+        if draw < self.rate_limit_rate + self.error_rate:
+            raise FakeProviderError("fake: falha injetada")
+
+    def _scores(self, text: str, count: int) -> List[int]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [4 + digest[index % len(digest)] % 6 for index in range(count)]
+
+    def _answer(self, prompt_text: str) -> str:
+        """Escolhe a resposta canônica pelo formato JSON pedido no template."""
+        if "JSON com problema" in prompt_text:
+            # Reparo: devolve um JSON válido do formato descrito no schema
+            if '"original"' in prompt_text:
+                prompt_text = '"original" "winningVersion"'
+            elif '"score"' in prompt_text:
+                prompt_text = '"score"'
+            else:
+                prompt_text = '"winningVersion"'
+
+        if '"winningVersion"' in prompt_text and '"original"' in prompt_text:
+            scores = self._scores(prompt_text, 3 * len(EVALUATION_CRITERIA))
+            rows = [
+                {"subject": criterion, "original": scores[3 * i], "version1": scores[3 * i + 1], "version2": scores[3 * i + 2], "fullMark": 10}
+                for i, criterion in enumerate(EVALUATION_CRITERIA)
+            ]
+            winner = 1 if sum(row["version1"] for row in rows) >= sum(row["version2"] for row in rows) else 2
+            return json.dumps({
+                "evaluationData": rows, "winningVersion": winner,
+                "justification": f"A Reformulação {winner} obteve notas mais altas (resposta do provedor falso)."
+            }, ensure_ascii=False)
+        if '"score"' in prompt_text:
+            scores = self._scores(prompt_text, len(EVALUATION_CRITERIA))
+            return json.dumps({
+                "evaluationData": [{"subject": c, "score": s, "fullMark": 10} for c, s in zip(EVALUATION_CRITERIA, scores)],
+                "justification": "Avaliação canônica do provedor falso."
+            }, ensure_ascii=False)
+        if '"winningVersion"' in prompt_text:
+            # Confronto entre duas reformulações numeradas (1 e 2 no reparo, sem os textos)
+            labels = [int(label) for label in re.findall(r"Notas da Reformulação (\d+)", prompt_text)] or [1, 2]
+            winner = labels[self._scores(prompt_text, 1)[0] % len(labels)]
+            return json.dumps({"winningVersion": winner, "justification": f"A Reformulação {winner} é mais clara (provedor falso)."}, ensure_ascii=False)
+        reformulation = "Você é um assistente especialista. Reescreva com clareza, contexto e formato definido:\n" + prompt_text[-200:].strip()
+        if REFORMULATION_SEPARATOR in prompt_text:
+            count = int(re.search(r"Escreva (\d+) reformulações", prompt_text).group(1))
+            return "\n".join(f"{REFORMULATION_SEPARATOR}\n{reformulation}\n(variante {index})" for index in range(1, count + 1))
+        return reformulation
+
+    def _limited_answer(self, prompt_text: str) -> str:
+        """Resposta cortada em max_tokens, como um provedor real que para por limite de tamanho."""
+        content = self._answer(prompt_text)
+        return content[:self.max_tokens * 4] if self.max_tokens else content
+
+    def _chunks(self, text: str) -> List[str]:
+        # ~4 caracteres por token, como estimate_tokens
+        return [text[index:index + 4] for index in range(0, len(text), 4)]
+
+    def _result(self, prompt_text: str, contents: List[str], cached_tokens: int = 0) -> ChatResult:
+        generations = []
+        for content in contents:
+            message = AIMessage(content=content, usage_metadata={
+                "input_tokens": estimate_tokens(prompt_text),
+                "output_tokens": estimate_tokens(content),
+                "total_tokens": estimate_tokens(prompt_text) + estimate_tokens(content),
+                "input_token_details": {"cache_read": cached_tokens},
+            })
+            generations.append(ChatGeneration(message=message))
+        return ChatResult(generations=generations)
+
+    def _contents(self, prompt_text: str, n: int) -> List[str]:
+        """Uma resposta por completion pedida (parâmetro `n`), distintas entre si."""
+        content = self._limited_answer(prompt_text)
+        return [content] if n <= 1 else [f"{content}\n(completion {index})" for index in range(1, n + 1)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt_text = _messages_text(messages)
+        time.sleep(self._sample_latency())
+        self._maybe_fail()
+        contents = self._contents(prompt_text, kwargs.get("n", 1))
+        time.sleep(len(self._chunks(max(contents, key=len))) / self.tokens_per_second)
+        return self._result(prompt_text, contents, self._cached_tokens(messages))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt_text = _messages_text(messages)
+        await asyncio.sleep(self._sample_latency())
+        self._maybe_fail()
+        contents = self._contents(prompt_text, kwargs.get("n", 1))
+        await asyncio.sleep(len(self._chunks(max(contents, key=len))) / self.tokens_per_second)
+        return self._result(prompt_text, contents, self._cached_tokens(messages))
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt_text = _messages_text(messages)
+        await asyncio.sleep(self._sample_latency()) # Tempo até o primeiro token
+        self._maybe_fail()
+        for token in self._chunks(self._limited_answer(prompt_text)):
+            await asyncio.sleep(1.0 / self.tokens_per_second)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
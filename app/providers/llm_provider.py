@@ -1,94 +1,450 @@
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.language_models import BaseLanguageModel
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError, enforce_deadline
+from app.core.metrics import LLM_CALLS, LLM_COST, LLM_IN_FLIGHT, LLM_PROMPT_CACHE_TOKENS, LLM_TOKENS, stage_timer
+from app.providers.admission import ProviderOverloadedError, get_provider_guard
+from app.providers.fake_llm import FakeChatModel
+from app.providers.model_router import model_router
+from app.providers.record_replay import REPLAY, RecordReplayChatModel
+from app.providers.token_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+ROLE_GENERATION = "generation"
+ROLE_JUDGE = "judge"
+
+# Parâmetro de limite de tokens de saída de cada SDK (campo "sdk" do provedor na tabela de roteamento)
+_MAX_OUTPUT_TOKENS_FIELDS = {"openai": "max_tokens", "groq": "max_tokens", "gemini": "max_output_tokens", "fake": "max_tokens"}
+
+# SDKs que aceitam uma chave de roteamento para o cache automático de prefixo (prompt_cache_key da OpenAI).
+# Gemini faz cache implícito de prefixos repetidos sem parâmetro; Groq não expõe cache de prompt.
+_PREFIX_CACHE_KEY_PROVIDERS = {"openai"}
+
+
+def _sends_prefix_cache_key(sdk: str, provider_config: Dict[str, Any]) -> bool:
+    """
+    O provedor recebe prompt_cache_key? Por padrão só a API da OpenAI: provedores compatíveis (com base_url
+    própria) podem recusar campos desconhecidos no corpo e precisam de "prefix_cache_key": true na configuração.
+    """
+    default = sdk in _PREFIX_CACHE_KEY_PROVIDERS and not provider_config.get("base_url")
+    return bool(provider_config.get("prefix_cache_key", default))
+
 
-from app.core.config import settings 
+class _UsageMetricsCallback(BaseCallbackHandler):
+    """
+    Registra tokens de entrada/saída, tokens servidos do cache de prefixo do provedor e custo estimado
+    de cada chamada ao modelo e reconcilia a cota de tokens do provedor (reserved_tokens reservados na admissão)
+    com esse uso. Usa o usage_metadata informado pelo provedor; na falta dele, estima pelo tamanho do texto.
+    """
+
+    run_inline = True # Executa no event loop, sem despachar para thread
+
+    def __init__(self, provider: "LLMProvider", estimated_input_tokens: int, stage: str, reserved_tokens: int):
+        self.provider = provider
+        self.estimated_input_tokens = estimated_input_tokens
+        self.stage = stage
+        self.reserved_tokens = reserved_tokens
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        input_tokens = output_tokens = cached_input_tokens = 0
+        output_text = ""
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+                cached_input_tokens += (usage.get("input_token_details") or {}).get("cache_read") or 0
+                output_text += generation.text
+        input_tokens = input_tokens or self.estimated_input_tokens
+        output_tokens = output_tokens or count_tokens(output_text, self.provider.model_type, self.provider.model_name)
+        cached_input_tokens = min(cached_input_tokens, input_tokens)
+        self.provider.guard.reconcile_tokens(self.reserved_tokens, input_tokens + output_tokens)
+
+        labels = {"provider": self.provider.model_type, "model": self.provider.model_name, "role": self.provider.role}
+        LLM_TOKENS.inc(input_tokens, direction="input", **labels)
+        LLM_TOKENS.inc(output_tokens, direction="output", **labels)
+        LLM_PROMPT_CACHE_TOKENS.inc(cached_input_tokens, stage=self.stage, cache="hit", **labels)
+        LLM_PROMPT_CACHE_TOKENS.inc(input_tokens - cached_input_tokens, stage=self.stage, cache="miss", **labels)
+        input_price, output_price = settings.model_pricing(self.provider.model_name)
+        cached_price = input_price * settings.DEFAULT_CACHED_INPUT_PRICE_FACTORS.get(self.provider.model_type, 1.0)
+        LLM_COST.inc(
+            ((input_tokens - cached_input_tokens) * input_price + cached_input_tokens * cached_price + output_tokens * output_price) / 1_000_000,
+            **labels
+        )
+        logger.debug(
+            "Uso da chamada: %d tokens de entrada (%d do cache do provedor), %d de saída.", input_tokens, cached_input_tokens, output_tokens,
+            extra={"stage": self.stage, **labels, "input_tokens": input_tokens, "cached_input_tokens": cached_input_tokens, "output_tokens": output_tokens}
+        )
 
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
 
 class LLMProvider:
-    def __init__(self, model_type: str, api_key_override: str = None):
+    def __init__(
+        self,
+        model_type: str,
+        role: str,
+        api_key_override: str = None,
+        model_name: Optional[str] = None,
+        http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None,
+    ):
         """
         Inicializa o LLMProvider e carrega o modelo de linguagem especificado.
         Se api_key_override for fornecida, ela será usada. Caso contrário,
         as chaves de API padrão são obtidas de 'settings'.
+        O papel ('generation' ou 'judge') define modelo e temperatura padrão na tabela de roteamento.
+        Em produção prefira `get_llm_provider`, que reaproveita instâncias já construídas.
         """
         self.model_type = model_type # Pode ser útil para logging ou debug
-        self.llm: BaseLanguageModel = self._load_model(model_type, api_key_override)
-        print(f"LLMProvider: Instância LLM '{self.model_type}' carregada (modelo específico: {self.llm.model_name if hasattr(self.llm, 'model_name') else getattr(self.llm, 'model', 'N/A')}).")
+        self.sdk = model_router.sdk(model_type) # SDK do provedor (ex: "openai" também para provedores compatíveis)
+        self.sends_prefix_cache_key = _sends_prefix_cache_key(self.sdk, model_router.provider_config(model_type))
+        self.role = role
+        self.api_key_override = api_key_override
+        self.model_name, self.temperature = resolve_model_config(model_type, self.role, model_name)
+        self.llm: BaseLanguageModel = self._load_recorded_model(model_type, api_key_override, http_clients)
+        self._configured_llms: Dict[tuple, BaseLanguageModel] = {} # Cópias com limite de saída e chave de cache de prefixo
+        # Cotas, concorrência adaptativa e disjuntor são compartilhados por todos os papéis do mesmo modelo
+        self.guard = get_provider_guard(model_type, self.model_name)
+        logger.info(
+            "LLMProvider: Instância LLM '%s' carregada (papel: %s, modelo específico: %s).", self.model_type, self.role, self.model_name,
+            extra={"provider": self.model_type, "model": self.model_name, "role": self.role}
+        )
 
 
-    def _load_model(self, model_type: str, api_key_override: str = None) -> BaseLanguageModel:
+    def _load_recorded_model(
+        self,
+        model_type: str,
+        api_key_override: str = None,
+        http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None,
+    ) -> BaseLanguageModel:
         """
-        Carrega e retorna a instância do modelo de linguagem com base no model_type.
-        Usa api_key_override se fornecida, caso contrário, usa as chaves de settings.
+        Carrega o modelo e, com LLM_RECORD_REPLAY_MODE, envolve-o no gravador/reprodutor de respostas.
+        No modo replay o modelo real não é construído (dispensa chave de API e rede).
         """
-        selected_api_key = None
-        model_name_to_load = None 
-        temperature_to_set = 0.7 # Temperatura padrão para geração
+        mode = settings.LLM_RECORD_REPLAY_MODE
+        if not mode or self.sdk == "fake":
+            return self._load_model(model_type, api_key_override, http_clients)
+        inner = None if mode == REPLAY else self._load_model(model_type, api_key_override, http_clients)
+        return RecordReplayChatModel(
+            inner=inner, mode=mode, directory=settings.LLM_RECORD_REPLAY_DIR, provider=model_type, model_name=self.model_name
+        )
+
+    def _load_model(
+        self,
+        model_type: str,
+        api_key_override: str = None,
+        http_clients: Optional[Tuple[httpx.Client, httpx.AsyncClient]] = None,
+    ) -> BaseLanguageModel:
+        """
+        Carrega e retorna a instância do modelo de linguagem com base no model_type, usando o SDK e a
+        variável de chave de API configurados para o provedor (DEFAULT_PROVIDERS/MODEL_ROUTES_PATH).
+        Usa api_key_override se fornecida, caso contrário, usa a chave da configuração.
+        Quando http_clients é fornecido, os clientes OpenAI/Groq reutilizam esse pool de conexões.
+        """
+        provider_config = model_router.provider_config(model_type) # Levanta ValueError para provedor desconhecido
+        loader = _SDK_LOADERS.get(self.sdk)
         # Definir prefixo para mensagens de log/print dentro deste método
         log_prefix = f"LLMProvider._load_model ({model_type}):"
+        if loader is None:
+            raise ValueError(f"{log_prefix} SDK '{self.sdk}' não suportado. Opções: {', '.join(_SDK_LOADERS)}.")
 
-        if model_type == "openai":
-            selected_api_key = api_key_override if api_key_override else settings.API_KEY_OPENAI
-            if not selected_api_key:
-                raise ValueError(f"{log_prefix} API key para OpenAI ('API_KEY_OPENAI' ou override) não encontrada.")
-            
-            model_name_to_load = "gpt-3.5-turbo" # Modelo padrão para geração
-            temperature_to_set = 0.7
-            if api_key_override and api_key_override == settings.API_KEY_JUDGE:
-                model_name_to_load = "gpt-4o" # Usando o modelo mais recente e capaz para judge
-                temperature_to_set = 0.2
-            
-            print(f"{log_prefix} Carregando OpenAI model: {model_name_to_load}, temp: {temperature_to_set}, key_override: {'Sim' if api_key_override else 'Não'}")
-            return ChatOpenAI(
-                openai_api_key=selected_api_key,
-                model=model_name_to_load,
-                temperature=temperature_to_set
-            )
-        elif model_type == "groq":
-            selected_api_key = api_key_override if api_key_override else settings.API_KEY_GROQ
-            if not selected_api_key:
-                raise ValueError(f"{log_prefix} API key para Groq ('API_KEY_GROQ' ou override) não encontrada.")
-            
-            model_name_to_load = "mixtral-8x7b-32768" # Modelo padrão para geração
-            temperature_to_set = 0.7
-            if api_key_override and api_key_override == settings.API_KEY_JUDGE:
-                # Para Groq, podemos manter o mesmo modelo mas ajustar a temperatura,
-                # ou escolher outro se disponível e mais adequado para avaliação.
-                # model_name_to_load = "outromodelo_groq_para_judge" 
-                temperature_to_set = 0.2
-            
-            print(f"{log_prefix} Carregando Groq model: {model_name_to_load}, temp: {temperature_to_set}, key_override: {'Sim' if api_key_override else 'Não'}")
-            return ChatGroq(
-                groq_api_key=selected_api_key,
-                model_name=model_name_to_load,
-                temperature=temperature_to_set
-            )
-        elif model_type == "gemini":
-            selected_api_key = api_key_override if api_key_override else settings.API_KEY_GEMINI
+        selected_api_key = None
+        if self.sdk != "fake":
+            api_key_env = provider_config.get("api_key_env", "")
+            selected_api_key = api_key_override or getattr(settings, api_key_env, "") or os.getenv(api_key_env, "")
             if not selected_api_key:
-                raise ValueError(f"{log_prefix} API key para Gemini ('API_KEY_GEMINI' ou override) não encontrada.")
-            
-            model_name_to_load = "gemini-1.5-flash-latest" # Modelo padrão para geração
-            temperature_to_set = 0.7
-            if api_key_override and api_key_override == settings.API_KEY_JUDGE:
-                model_name_to_load = "gemini-1.5-pro-latest" # Modelo mais robusto para judge
-                temperature_to_set = 0.2
-            
-            print(f"{log_prefix} Carregando Gemini model: {model_name_to_load}, temp: {temperature_to_set}, key_override: {'Sim' if api_key_override else 'Não'}")
-            return ChatGoogleGenerativeAI(
-                google_api_key=selected_api_key,
-                model=model_name_to_load,
-                temperature=temperature_to_set,
-                # convert_system_message_to_human=True # Pode ser útil para alguns modelos Gemini se usar mensagens de sistema
-            )
-        else:
-            raise ValueError(f"{log_prefix} Modelo '{model_type}' não suportado. Opções: openai, groq, gemini.")
+                raise ValueError(f"{log_prefix} API key para {model_type} ('{api_key_env}' ou override) não encontrada.")
+        logger.debug(
+            "%s Carregando modelo %s (sdk: %s), temp: %s, key_override: %s",
+            log_prefix, self.model_name, self.sdk, self.temperature, 'Sim' if api_key_override else 'Não'
+        )
+        http_client, http_async_client = http_clients if http_clients else (None, None)
+        return loader(self.model_name, self.temperature, selected_api_key, provider_config, http_client, http_async_client)
 
-    def get_llm_instance(self) -> BaseLanguageModel:
-        """Retorna a instância LLM carregada."""
+    def get_llm_instance(self, max_output_tokens: Optional[int] = None, prefix_cache_key: Optional[str] = None) -> BaseLanguageModel:
+        """
+        Retorna a instância LLM carregada. Com max_output_tokens e/ou prefix_cache_key, retorna uma cópia
+        (criada uma vez por combinação) que compartilha os clientes HTTP, limita a saída a esse número de tokens
+        e envia a chave de roteamento do cache de prefixo (nos provedores que a aceitam, ver _sends_prefix_cache_key,
+        com PROVIDER_PROMPT_CACHE_ENABLED).
+        """
         if not self.llm:
             # Isso não deveria acontecer se o construtor funcionar, mas é uma verificação de segurança.
             raise RuntimeError("LLMProvider: Instância LLM não foi carregada corretamente.")
-        return self.llm
+        if not settings.PROVIDER_PROMPT_CACHE_ENABLED or not self.sends_prefix_cache_key:
+            prefix_cache_key = None
+        if not max_output_tokens and not prefix_cache_key:
+            return self.llm
+        key = (max_output_tokens, prefix_cache_key)
+        configured = self._configured_llms.get(key)
+        if configured is None:
+            configured = self._configured_llms[key] = _configured_copy(self.llm, self.sdk, max_output_tokens, prefix_cache_key)
+        return configured
+
+    def hedge_delay(self) -> float:
+        """Tempo de espera antes de uma cópia 'hedged': p95 observado ou o padrão enquanto houver poucas amostras."""
+        if len(self.guard.latency) >= settings.HEDGE_MIN_SAMPLES:
+            return self.guard.latency.percentile(95)
+        return settings.HEDGE_DEFAULT_DELAY_SECONDS
+
+    def _estimate_input_tokens(self, runnable: Runnable, inputs: Dict[str, Any]) -> int:
+        """Conta os tokens de entrada da chamada (template + variáveis) com o tokenizer do modelo."""
+        prompt = getattr(runnable, "first", None)
+        template = getattr(prompt, "template", None)
+        if template is None: # ChatPromptTemplate: texto fixo de cada mensagem (sistema + usuário)
+            template = "".join(str(getattr(getattr(message, "prompt", None), "template", "")) for message in getattr(prompt, "messages", ()))
+        prompt_text = str(template) + "".join(str(value) for value in inputs.values())
+        return count_tokens(prompt_text, self.model_type, self.model_name)
+
+    def _metric_labels(self) -> Dict[str, str]:
+        return {"provider": self.model_type, "model": self.model_name, "role": self.role}
+
+    def _record_call(self, stage: str, error: Optional[BaseException]) -> None:
+        if error is None:
+            outcome = "ok"
+        elif isinstance(error, ProviderOverloadedError):
+            outcome = "overloaded"
+        elif isinstance(error, DeadlineExceededError):
+            outcome = "deadline"
+        elif isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            outcome = "cancelled" # Ex: cliente desconectou ou a cópia 'hedged' perdeu
+        else:
+            outcome = "error"
+        LLM_CALLS.inc(stage=stage, outcome=outcome, **self._metric_labels())
+
+    async def ainvoke(
+        self, runnable: Runnable, inputs: Dict[str, Any], stage: Optional[str] = None, estimated_output_tokens: Optional[int] = None
+    ) -> Any:
+        """
+        Executa uma chain que usa este LLM passando pelo controle de admissão do provedor.
+        `stage` identifica o estágio nas métricas (padrão: o papel do provedor).
+        `estimated_output_tokens` substitui LLM_ESTIMATED_OUTPUT_TOKENS na reserva da cota (ex: várias candidatas).
+        A chamada (incluindo a espera na admissão) é limitada pelo prazo da requisição atual.
+        Levanta ProviderOverloadedError se a chamada não for admitida e DeadlineExceededError se o prazo expirar.
+        """
+        stage = stage or self.role
+        input_tokens = self._estimate_input_tokens(runnable, inputs)
+        output_tokens = estimated_output_tokens or settings.LLM_ESTIMATED_OUTPUT_TOKENS
+        config = {"callbacks": [_UsageMetricsCallback(self, input_tokens, stage, input_tokens + output_tokens)]}
+        error: Optional[BaseException] = None
+        LLM_IN_FLIGHT.inc(**self._metric_labels())
+        try:
+            with stage_timer(stage, **self._metric_labels()):
+                async with enforce_deadline(stage):
+                    return await self.guard.run(lambda: runnable.ainvoke(inputs, config=config), input_tokens + output_tokens)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            LLM_IN_FLIGHT.dec(**self._metric_labels())
+            self._record_call(stage, error)
+
+    async def astream(self, runnable: Runnable, inputs: Dict[str, Any], stage: Optional[str] = None) -> AsyncIterator[Any]:
+        """
+        Versão em streaming de ainvoke: a vaga de concorrência é mantida até o fim do fluxo.
+        O prazo da requisição vale para a espera de cada trecho (o fluxo é interrompido quando ele expira).
+        """
+        stage = stage or self.role
+        input_tokens = self._estimate_input_tokens(runnable, inputs)
+        reserved_tokens = input_tokens + settings.LLM_ESTIMATED_OUTPUT_TOKENS
+        config = {"callbacks": [_UsageMetricsCallback(self, input_tokens, stage, reserved_tokens)]}
+        error: Optional[BaseException] = None
+        LLM_IN_FLIGHT.inc(**self._metric_labels())
+        chunks = self.guard.stream(lambda: runnable.astream(inputs, config=config), reserved_tokens)
+        try:
+            with stage_timer(stage, **self._metric_labels()):
+                while True:
+                    # O prazo cobre só a espera pelo próximo trecho, nunca o `yield` (que roda no código de quem consome)
+                    async with enforce_deadline(stage):
+                        try:
+                            chunk = await chunks.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    yield chunk
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            await chunks.aclose()
+            LLM_IN_FLIGHT.dec(**self._metric_labels())
+            self._record_call(stage, error)
+
+
+def _configured_copy(
+    llm: BaseLanguageModel, sdk: str, max_output_tokens: Optional[int], prefix_cache_key: Optional[str]
+) -> BaseLanguageModel:
+    """
+    Cópia rasa do modelo com o limite de saída e a chave de cache de prefixo nos parâmetros do SDK;
+    parâmetros que o modelo não tem são ignorados.
+    """
+    if isinstance(llm, RecordReplayChatModel):
+        if llm.inner is None:
+            return llm # Replay: a resposta gravada não depende dos parâmetros
+        return llm.model_copy(update={"inner": _configured_copy(llm.inner, sdk, max_output_tokens, prefix_cache_key)})
+    update: Dict[str, Any] = {}
+    field = _MAX_OUTPUT_TOKENS_FIELDS.get(sdk)
+    if max_output_tokens and field in type(llm).model_fields:
+        update[field] = max_output_tokens
+    if prefix_cache_key and "model_kwargs" in type(llm).model_fields:
+        update["model_kwargs"] = {**llm.model_kwargs, "prompt_cache_key": prefix_cache_key}
+    return llm.model_copy(update=update) if update else llm
+
+
+def _load_openai(model_name, temperature, api_key, provider_config, http_client, http_async_client) -> BaseLanguageModel:
+    from langchain_openai import ChatOpenAI # SDKs importados só no primeiro uso do provedor
+    return ChatOpenAI(
+        openai_api_key=api_key,
+        model=model_name,
+        temperature=temperature,
+        timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        base_url=provider_config.get("base_url"), # Provedores compatíveis com a API da OpenAI
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def _load_groq(model_name, temperature, api_key, provider_config, http_client, http_async_client) -> BaseLanguageModel:
+    from langchain_groq import ChatGroq
+    return ChatGroq(
+        groq_api_key=api_key,
+        model_name=model_name,
+        temperature=temperature,
+        timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+
+
+def _load_gemini(model_name, temperature, api_key, provider_config, http_client, http_async_client) -> BaseLanguageModel:
+    # O SDK do Gemini usa o próprio transporte (gRPC); a instância é reaproveitada
+    # pelo registro, o que mantém o canal aberto entre requisições.
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        google_api_key=api_key,
+        model=model_name,
+        temperature=temperature,
+        timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+        max_retries=settings.LLM_MAX_RETRIES,
+        # convert_system_message_to_human=True # Pode ser útil para alguns modelos Gemini se usar mensagens de sistema
+    )
+
+
+def _load_fake(model_name, temperature, api_key, provider_config, http_client, http_async_client) -> BaseLanguageModel:
+    # Provedor offline: latência, streaming e falhas configurados por FAKE_LLM_*
+    return FakeChatModel.from_settings(model_name)
+
+
+_SDK_LOADERS = {"openai": _load_openai, "groq": _load_groq, "gemini": _load_gemini, "fake": _load_fake}
+
+
+def resolve_model_config(model_type: str, role: str, model_name: Optional[str] = None) -> Tuple[str, float]:
+    """
+    Retorna (nome do modelo, temperatura) padrão para o provedor e papel informados, conforme a tabela de roteamento.
+    Um model_name explícito substitui o modelo padrão, mantendo a temperatura do papel. Levanta ValueError.
+    """
+    route = model_router.resolve(model_type, role, model_name)
+    return route.model_name, route.temperature
+
+
+class LLMClientRegistry:
+    """
+    Registro de processo que mantém instâncias LLMProvider de longa duração,
+    indexadas por (model_type, papel, nome do modelo, temperatura).
+    Todas as instâncias OpenAI/Groq compartilham o mesmo pool HTTP keep-alive.
+    """
+
+    def __init__(self):
+        self._providers: Dict[Tuple[str, str, str, float], LLMProvider] = {}
+        self._lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def _get_http_clients(self) -> Tuple[httpx.Client, httpx.AsyncClient]:
+        if self._http_async_client is None:
+            limits = httpx.Limits(
+                max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=settings.LLM_POOL_KEEPALIVE_EXPIRY_SECONDS,
+            )
+            timeout = httpx.Timeout(settings.LLM_REQUEST_TIMEOUT_SECONDS, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+            self._http_client = httpx.Client(limits=limits, timeout=timeout)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return self._http_client, self._http_async_client
+
+    def get(self, model_type: str, role: str, model_name: Optional[str] = None) -> LLMProvider:
+        """
+        Retorna o LLMProvider do registro, construindo-o na primeira solicitação. Sem model_name, o modelo
+        vem da tabela de roteamento (escolhido pelo tamanho do prompt e prazo da requisição com MODEL_ROUTING_ENABLED).
+        """
+        route = model_router.resolve(model_type, role, model_name) if model_name else model_router.route(model_type, role)
+        resolved_model, temperature = route.model_name, route.temperature
+        key = (model_type, role, resolved_model, temperature)
+        provider = self._providers.get(key)
+        if provider is not None:
+            return provider
+
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is None:
+                api_key_override = settings.API_KEY_JUDGE if role == ROLE_JUDGE else None
+                with stage_timer("provider_init", model_type, resolved_model, role):
+                    provider = LLMProvider(
+                        model_type=model_type,
+                        api_key_override=api_key_override,
+                        role=role,
+                        model_name=resolved_model,
+                        http_clients=self._get_http_clients(),
+                    )
+                self._providers[key] = provider
+        return provider
+
+    async def aclose(self) -> None:
+        """Fecha o pool de conexões compartilhado e descarta as instâncias registradas."""
+        with self._lock:
+            http_client, http_async_client = self._http_client, self._http_async_client
+            self._providers.clear()
+            self._http_client = None
+            self._http_async_client = None
+        if http_async_client is not None:
+            await http_async_client.aclose()
+        if http_client is not None:
+            http_client.close()
+
+
+llm_registry = LLMClientRegistry()
+
+
+def get_llm_provider(model_type: str, role: str, model_name: Optional[str] = None) -> LLMProvider:
+    """Atalho para obter um LLMProvider reutilizável do registro global."""
+    return llm_registry.get(model_type, role, model_name)
+
+
+def select_hedge_model_type(primary_model_type: str, role: str = ROLE_GENERATION) -> Optional[str]:
+    """
+    Escolhe o provedor de uma cópia 'hedged': entre os candidatos configurados
+    (HEDGE_CANDIDATE_MODEL_TYPES, com chave de API válida) diferentes do primário,
+    o de menor p95 observado; provedores ainda sem amostras ficam por último.
+    """
+    ranked = []
+    candidates = [name.strip() for name in settings.HEDGE_CANDIDATE_MODEL_TYPES.split(",") if name.strip()]
+    for position, model_type in enumerate(candidates):
+        if model_type == primary_model_type:
+            continue
+        try:
+            provider = get_llm_provider(model_type, role)
+        except ValueError:
+            continue # Provedor sem chave configurada
+        p95 = provider.guard.latency.percentile(95)
+        ranked.append((p95 is None, p95 or 0.0, position, model_type))
+    return min(ranked)[3] if ranked else None
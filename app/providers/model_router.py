@@ -0,0 +1,174 @@
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadline import remaining_time
+from app.providers.admission import CircuitBreaker, find_provider_guard
+
+logger = logging.getLogger(__name__)
+
+# Tokens do prompt da requisição atual, usados para escolher o modelo de cada chamada (ver routing_scope)
+_prompt_tokens_var: ContextVar[Optional[int]] = ContextVar("routing_prompt_tokens", default=None)
+
+
+class ModelRoute:
+    """Modelo candidato de um (provedor, papel) na tabela de roteamento."""
+
+    def __init__(self, provider: str, role: str, entry: Dict[str, Any]):
+        self.provider = provider
+        self.role = role
+        self.model_name: str = entry["model"]
+        self.temperature = float(entry.get("temperature", 0.7))
+        self.max_prompt_tokens = int(entry.get("max_prompt_tokens", 0)) # 0 = limitado só pela janela de contexto
+        self.latency_target_seconds = float(entry.get("latency_target_seconds", 0.0)) # 0 = desconhecida
+        self.context_window = int(entry.get("context_window") or settings.model_context_window(self.model_name))
+        price = entry.get("price")
+        self.input_price, self.output_price = (float(price[0]), float(price[1])) if price else settings.model_pricing(self.model_name)
+
+    def fits(self, prompt_tokens: int) -> bool:
+        """O prompt cabe neste modelo (limite próprio e janela de contexto com a saída reservada)?"""
+        if self.max_prompt_tokens and prompt_tokens > self.max_prompt_tokens:
+            return False
+        return prompt_tokens + settings.LLM_ESTIMATED_OUTPUT_TOKENS <= self.context_window
+
+    def estimated_cost(self, prompt_tokens: int) -> float:
+        return (prompt_tokens * self.input_price + settings.LLM_ESTIMATED_OUTPUT_TOKENS * self.output_price) / 1_000_000
+
+    def estimated_latency(self) -> float:
+        """p95 observado do modelo ou, sem guard ou com poucas amostras, latency_target_seconds."""
+        guard = find_provider_guard(self.provider, self.model_name)
+        tracker = guard.latency if guard is not None else None
+        observed = tracker.percentile(95) if tracker is not None and len(tracker) >= settings.HEDGE_MIN_SAMPLES else None
+        return self.latency_target_seconds if observed is None else observed
+
+    def available(self) -> bool:
+        """Falso enquanto o disjuntor do modelo está aberto (modelo ainda sem guard: disponível)."""
+        guard = find_provider_guard(self.provider, self.model_name)
+        if guard is None:
+            return True
+        return not (guard.breaker.state == CircuitBreaker.OPEN and guard.breaker.retry_after() > 0)
+
+
+class ModelRouter:
+    """
+    Tabela declarativa de provedores e modelos por (provedor, papel), carregada da configuração
+    (DEFAULT_PROVIDERS/DEFAULT_MODEL_ROUTES, mesclados com o JSON de MODEL_ROUTES_PATH).
+    Resolve o modelo padrão de cada papel e, com MODEL_ROUTING_ENABLED, escolhe por chamada o candidato
+    mais barato (ou mais rápido) que comporta o prompt e o prazo restante da requisição.
+    """
+
+    def __init__(self, providers: Dict[str, Dict[str, Any]], routes: Dict[str, Dict[str, List[Dict[str, Any]]]]):
+        self._providers = providers
+        self._routes: Dict[Tuple[str, str], List[ModelRoute]] = {
+            (provider, role): [ModelRoute(provider, role, entry) for entry in entries]
+            for provider, roles in routes.items() for role, entries in roles.items() if entries
+        }
+
+    @classmethod
+    def from_settings(cls) -> "ModelRouter":
+        providers = {name: dict(config) for name, config in settings.DEFAULT_PROVIDERS.items()}
+        routes = {name: dict(roles) for name, roles in settings.DEFAULT_MODEL_ROUTES.items()}
+        if settings.MODEL_ROUTES_PATH:
+            with open(settings.MODEL_ROUTES_PATH, encoding="utf-8") as f:
+                overrides = json.load(f)
+            for name, config in overrides.get("providers", {}).items():
+                providers[name] = {**providers.get(name, {}), **config}
+            for name, roles in overrides.get("routes", {}).items():
+                routes[name] = {**routes.get(name, {}), **roles}
+        return cls(providers, routes)
+
+    def provider_names(self) -> List[str]:
+        return list(self._providers)
+
+    def provider_config(self, provider: str) -> Dict[str, Any]:
+        """Configuração do provedor (sdk, api_key_env, base_url...). Levanta ValueError se ele não existir."""
+        config = self._providers.get(provider)
+        if config is None:
+            raise ValueError(
+                f"ModelRouter ({provider}): Modelo '{provider}' não suportado. Opções: {', '.join(self._providers)}."
+            )
+        return config
+
+    def sdk(self, provider: str) -> str:
+        return self.provider_config(provider).get("sdk", provider)
+
+    def candidates(self, provider: str, role: str) -> List[ModelRoute]:
+        """Candidatos do (provedor, papel), o padrão primeiro. Levanta ValueError se não houver rota."""
+        self.provider_config(provider)
+        candidates = self._routes.get((provider, role))
+        if not candidates:
+            raise ValueError(f"ModelRouter ({provider}): nenhum modelo configurado para o papel '{role}'.")
+        return candidates
+
+    def resolve(self, provider: str, role: str, model_name: Optional[str] = None) -> ModelRoute:
+        """
+        Rota do modelo explícito (model_name) ou, sem ele, o candidato padrão do papel.
+        Um modelo fora da tabela herda a temperatura do papel.
+        """
+        candidates = self.candidates(provider, role)
+        if not model_name:
+            return candidates[0]
+        for route in candidates:
+            if route.model_name == model_name:
+                return route
+        return ModelRoute(provider, role, {"model": model_name, "temperature": candidates[0].temperature})
+
+    def largest(self, provider: str, role: str) -> ModelRoute:
+        """Candidato que aceita os maiores prompts: o limite do orçamento de tokens quando o roteamento está ativo."""
+        candidates = self.candidates(provider, role)
+        if not settings.MODEL_ROUTING_ENABLED:
+            return candidates[0]
+        return max(candidates, key=lambda route: (route.max_prompt_tokens == 0, route.max_prompt_tokens, route.context_window))
+
+    def select(self, provider: str, role: str, prompt_tokens: int, latency_budget: Optional[float] = None) -> ModelRoute:
+        """
+        Escolhe o candidato para um prompt de prompt_tokens tokens: entre os que o comportam (e estão com o
+        disjuntor fechado), os que cabem em latency_budget segundos; destes, o mais barato ou o mais rápido
+        (MODEL_ROUTING_OBJECTIVE). Se nenhum cabe no prazo, o mais rápido; se nenhum comporta o prompt, o de maior capacidade.
+        """
+        candidates = self.candidates(provider, role)
+        fitting = [route for route in candidates if route.fits(prompt_tokens) and route.available()]
+        if not fitting:
+            return self.largest(provider, role)
+        if latency_budget is not None:
+            in_time = [route for route in fitting if route.estimated_latency() <= latency_budget]
+            if not in_time:
+                return min(fitting, key=lambda route: route.estimated_latency())
+            fitting = in_time
+        if settings.MODEL_ROUTING_OBJECTIVE == "latency":
+            return min(fitting, key=lambda route: route.estimated_latency())
+        return min(fitting, key=lambda route: route.estimated_cost(prompt_tokens))
+
+    def route(self, provider: str, role: str) -> ModelRoute:
+        """
+        Candidato para a chamada atual: com MODEL_ROUTING_ENABLED e dentro de routing_scope, escolhido por select()
+        com o tamanho do prompt e o prazo restante da requisição; caso contrário, o padrão do papel.
+        """
+        prompt_tokens = _prompt_tokens_var.get()
+        if not settings.MODEL_ROUTING_ENABLED or prompt_tokens is None:
+            return self.resolve(provider, role)
+        selected = self.select(provider, role, prompt_tokens, remaining_time())
+        logger.debug(
+            "Modelo %s escolhido para %s/%s (prompt de ~%d tokens).", selected.model_name, provider, role, prompt_tokens,
+            extra={"stage": "routing"}
+        )
+        return selected
+
+
+@contextmanager
+def routing_scope(prompt_tokens: int) -> Iterator[None]:
+    """Informa o tamanho do prompt da requisição ao roteamento das chamadas feitas dentro do bloco."""
+    token = _prompt_tokens_var.set(prompt_tokens)
+    try:
+        yield
+    finally:
+        try:
+            _prompt_tokens_var.reset(token)
+        except ValueError:
+            pass # Gerador finalizado em outro contexto: o contexto original já foi descartado
+
+
+model_router = ModelRouter.from_settings()
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+RECORD = "record"
+REPLAY = "replay"
+
+
+class ReplayMissError(Exception):
+    """Levantada no modo replay quando não há gravação para a chamada."""
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """
+    Envolve um modelo de chat real gravando suas respostas em disco (mode="record")
+    ou reproduzindo-as deterministicamente sem rede (mode="replay").
+    Cada chamada é identificada pelo hash de (provedor, modelo, mensagens) e salva como
+    um arquivo JSON em `directory`. Chamadas repetidas com a mesma entrada reproduzem a mesma resposta.
+    A saída estruturada nativa não é exposta: o judge usa o caminho de texto + parser tolerante.
+    """
+
+    inner: Optional[BaseChatModel] = None # Dispensável no modo replay
+    mode: str = REPLAY
+    directory: str
+    provider: str
+    model_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        return f"record-replay-{self.provider}"
+
+    def _key(self, messages: List[BaseMessage]) -> str:
+        payload = json.dumps([self.provider, self.model_name, messages_to_dict(messages)], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key: str) -> dict:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ReplayMissError(
+                f"Sem gravação para a chamada {key[:12]} ({self.provider}/{self.model_name}) em {self.directory}."
+            )
+
+    def _save(self, key: str, content: str, usage: Optional[dict]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f"{self._path(key)}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump({"provider": self.provider, "model": self.model_name, "content": content, "usage_metadata": usage}, f, ensure_ascii=False)
+        os.replace(temporary_path, self._path(key)) # Escrita atômica: leitores nunca veem arquivo parcial
+
+    def _result(self, recording: dict) -> ChatResult:
+        message = AIMessage(content=recording["content"], usage_metadata=recording.get("usage_metadata"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        if self.mode == REPLAY:
+            return self._result(self._load(key))
+        message = self.inner.invoke(messages, stop=stop, **kwargs)
+        self._save(key, message.content, getattr(message, "usage_metadata", None))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        key = self._key(messages)
+        if self.mode == REPLAY:
+            return self._result(await asyncio.to_thread(self._load, key))
+        message = await self.inner.ainvoke(messages, stop=stop, **kwargs)
+        await asyncio.to_thread(self._save, key, message.content, getattr(message, "usage_metadata", None))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._key(messages)
+        if self.mode == REPLAY:
+            recording = await asyncio.to_thread(self._load, key)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=recording["content"]))
+            return
+
+        content = ""
+        async for chunk in self.inner.astream(messages, stop=stop, **kwargs):
+            content += chunk.content if isinstance(chunk.content, str) else ""
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk.content))
+        await asyncio.to_thread(self._save, key, content, None)
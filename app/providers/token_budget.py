@@ -0,0 +1,163 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, Iterable, Tuple
+
+from langchain_core.prompts import BasePromptTemplate
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Palavras e sinais isolados: base da contagem aproximada quando não há tokenizer local
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Codificações tiktoken: exatas para os modelos OpenAI; cl100k_base aproxima os demais provedores (com TOKEN_COUNT_MARGIN)
+_ENCODING_NAMES = ("o200k_base", "cl100k_base")
+_DEFAULT_ENCODING = "cl100k_base"
+
+_encodings: Dict[str, Any] = {} # nome da codificação -> tiktoken.Encoding já carregada
+_encodings_lock = threading.Lock()
+_template_overheads: Dict[Tuple[int, str, str], int] = {} # (id do template, model_type, modelo) -> tokens
+
+
+class PromptTooLargeError(Exception):
+    """Levantada quando o prompt excede o orçamento de tokens (MAX_PROMPT_TOKENS ou a janela de contexto de um estágio)."""
+
+    def __init__(self, message: str, tokens: int, limit: int):
+        super().__init__(message)
+        self.tokens = tokens
+        self.limit = limit
+
+
+def _encoding_name(model_type: str, model_name: str) -> str:
+    legacy_openai_model = model_name.startswith(("gpt-3.5", "gpt-4")) and not model_name.startswith("gpt-4o")
+    return "o200k_base" if model_type == "openai" and not legacy_openai_model else _DEFAULT_ENCODING
+
+
+def load_tokenizers() -> Dict[str, bool]:
+    """
+    Carrega as codificações tiktoken. Bloqueante: na primeira vez o tiktoken baixa o arquivo BPE
+    (ou o lê de TIKTOKEN_CACHE_DIR), então chame fora do event loop (ex: no startup).
+    Retorna {codificação: carregada}. Sem tiktoken ou sem o arquivo, a contagem segue aproximada.
+    """
+    if not settings.TOKENIZER_ENABLED:
+        return {}
+    try:
+        import tiktoken # Dependência opcional
+    except ImportError:
+        logger.warning("tiktoken não instalado; contagem de tokens aproximada.", extra={"stage": "startup"})
+        return {}
+
+    results = {}
+    for name in _ENCODING_NAMES:
+        if name in _encodings:
+            results[name] = True
+            continue
+        try:
+            encoding = tiktoken.get_encoding(name)
+        except Exception as e: # Sem rede e sem cache local do arquivo BPE
+            logger.warning("Codificação %s indisponível (%s); contagem de tokens aproximada.", name, e, extra={"stage": "startup"})
+            results[name] = False
+            continue
+        with _encodings_lock:
+            _encodings[name] = encoding
+        results[name] = True
+    _template_overheads.clear() # Recalculadas com a contagem exata
+    return results
+
+
+def _approximate_count(text: str) -> int:
+    """~1 token por palavra curta ou sinal, mais 1 a cada 4 caracteres extras de palavras longas."""
+    return sum(1 + max(0, len(piece) - 4) // 4 for piece in _PIECE_PATTERN.findall(text))
+
+
+def count_tokens(text: str, model_type: str, model_name: str) -> int:
+    """
+    Conta os tokens do texto para o modelo: exata com a codificação tiktoken do provedor OpenAI,
+    aproximada (com TOKEN_COUNT_MARGIN de folga) para os demais provedores ou sem tokenizer carregado.
+    """
+    if not text:
+        return 0
+    encoding = _encodings.get(_encoding_name(model_type, model_name))
+    if encoding is not None:
+        tokens = len(encoding.encode(text, disallowed_special=()))
+        return tokens if model_type == "openai" else int(tokens * settings.TOKEN_COUNT_MARGIN) + 1
+    return int(_approximate_count(text) * settings.TOKEN_COUNT_MARGIN) + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model_type: str, model_name: str) -> str:
+    """Corta o texto para caber em max_tokens do modelo, preservando o início."""
+    tokens = count_tokens(text, model_type, model_name)
+    if tokens <= max_tokens:
+        return text
+    encoding = _encodings.get(_encoding_name(model_type, model_name))
+    if encoding is not None and model_type == "openai":
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    # Busca binária pelo maior prefixo que cabe, partindo de um corte proporcional com folga
+    low, high = 0, min(len(text), int(len(text) * max_tokens / tokens * 1.25) + 16)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle], model_type, model_name) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def template_overhead(template: BasePromptTemplate, model_type: str, model_name: str) -> int:
+    """Tokens fixos do template (texto e mensagens sem as variáveis), calculados uma vez por modelo."""
+    key = (id(template), model_type, model_name) # Templates são constantes de módulo, compilados uma única vez
+    overhead = _template_overheads.get(key)
+    if overhead is None:
+        fixed_text = template.format(**{variable: "" for variable in template.input_variables})
+        overhead = _template_overheads[key] = count_tokens(fixed_text, model_type, model_name)
+    return overhead
+
+
+def stage_prompt_budget(
+    model_type: str,
+    model_name: str,
+    template: BasePromptTemplate,
+    prompt_copies: int = 1,
+    other_input_tokens: int = 0,
+    max_output_tokens: int = 0,
+) -> int:
+    """
+    Tokens disponíveis para o prompt do usuário em um estágio: janela de contexto do modelo menos o
+    template, as demais entradas e a saída reservada, dividido pelo número de cópias do prompt no template.
+    """
+    available = (
+        settings.model_context_window(model_name)
+        - template_overhead(template, model_type, model_name)
+        - other_input_tokens
+        - (max_output_tokens or settings.LLM_ESTIMATED_OUTPUT_TOKENS)
+    )
+    return max(0, available // max(1, prompt_copies))
+
+
+def fit_prompt(prompt: str, budgets: Iterable[Tuple[str, str, int]]) -> Tuple[str, bool]:
+    """
+    Confere o prompt contra MAX_PROMPT_TOKENS e os orçamentos (model_type, model_name, limite) de cada estágio.
+    Retorna (prompt, truncado). Conforme PROMPT_OVERFLOW_POLICY, corta o prompt para caber em todos
+    ("truncate") ou levanta PromptTooLargeError ("reject").
+    """
+    checks = list(budgets)
+    if settings.MAX_PROMPT_TOKENS > 0 and checks:
+        model_type, model_name, _ = checks[0]
+        checks.insert(0, (model_type, model_name, settings.MAX_PROMPT_TOKENS))
+
+    truncated = False
+    for model_type, model_name, limit in checks:
+        tokens = count_tokens(prompt, model_type, model_name)
+        if tokens <= limit:
+            continue
+        if settings.PROMPT_OVERFLOW_POLICY != "truncate":
+            raise PromptTooLargeError(
+                f"O prompt tem ~{tokens} tokens e o limite para {model_type}/{model_name} é {limit}.", tokens, limit
+            )
+        prompt = truncate_to_tokens(prompt, limit, model_type, model_name)
+        truncated = True
+    if truncated:
+        logger.warning("Prompt truncado para caber no orçamento de tokens.", extra={"stage": "token_budget"})
+    return prompt, truncated
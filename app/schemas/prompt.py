@@ -1,10 +1,32 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from pydantic import BaseModel, Field
 
 class PromptRequest(BaseModel):
     prompt: str = Field(..., min_length=1, description="O prompt original a ser processado.")
     generation_model_type: str = Field("gemini", description="Tipo de modelo para gerar reformulações (ex: 'gemini', 'openai', 'groq').")
     judge_model_type: str = Field("gemini", description="Tipo de modelo para avaliar as reformulações (ex: 'gemini', 'openai', 'groq').")
+    bypass_cache: bool = Field(False, description="Ignora o cache de resultados e força novas chamadas às LLMs.")
+    allow_near_duplicate: bool = Field(True, description="Aceita o resultado de um prompt já processado quase idêntico a este.")
+    hedge: bool = Field(False, description="Dispara uma cópia da geração em um segundo provedor se a primeira passar do p95 observado.")
+    hedge_model_type: Optional[str] = Field(None, description="Provedor da cópia 'hedged'. Se omitido, usa o de menor p95 observado.")
+    num_variants: int = Field(2, ge=2, le=8, description="Quantidade de reformulações geradas e comparadas.")
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="Prazo total da requisição; ao expirar, as chamadas pendentes são canceladas.")
+    judge_ensemble: Optional[List[str]] = Field(
+        None, description="Avaliadores do ensemble ('provedor' ou 'provedor:modelo'); substitui judge_model_type. Se omitido, usa JUDGE_ENSEMBLE."
+    )
+
+class NearDuplicateMatch(BaseModel):
+    """Indica que o resultado foi reaproveitado de um prompt quase idêntico já processado."""
+    prompt: str = Field(..., description="Prompt já processado cujo resultado foi reaproveitado.")
+    similarity: float = Field(..., description="Similaridade estimada (Jaccard dos shingles) entre os dois prompts.")
+
+class JudgeEnsembleInfo(BaseModel):
+    """Resumo da avaliação por ensemble de judges."""
+    judges: List[str] = Field(..., description="Avaliadores cujas notas entraram no resultado, na ordem em que responderam.")
+    judge_count: int = Field(..., description="Quantidade de avaliadores que responderam.")
+    agreement: float = Field(..., description="Fração dos avaliadores que concordam com o veredito (vencedora ou nota média).")
+    early_stopped: bool = Field(..., description="O acordo foi atingido antes de consultar todos os avaliadores.")
+    aggregation: str = Field(..., description="Agregação das notas por critério ('mean' ou 'median').")
 
 class VersionInfo(BaseModel):
     title: str
@@ -15,32 +37,108 @@ class EvaluationDataItem(BaseModel):
     original: float 
     version1: float 
     version2: float 
+    versions: Optional[List[float]] = Field(None, description="Notas de todas as variantes, na ordem de `variants`.")
     fullMark: float = Field(10.0)
+    variance: Optional[List[float]] = Field(None, description="Com ensemble, variância das notas entre os avaliadores: original e cada variante.")
 
 class PromptResponse(BaseModel):
     original_prompt: str
     version1: Optional[VersionInfo] = None
     version2: Optional[VersionInfo] = None
+    variants: Optional[List[VersionInfo]] = Field(None, description="Todas as reformulações; version1/version2 são as duas primeiras.")
     evaluationData: Optional[List[EvaluationDataItem]] = None
     winningVersion: Optional[int] = None
     justification: Optional[str] = None
     error: Optional[str] = None
     raw_judge_output: Optional[str] = None 
+    near_duplicate: Optional[NearDuplicateMatch] = None
+    prompt_truncated: bool = Field(False, description="O prompt excedia o orçamento de tokens e foi cortado (PROMPT_OVERFLOW_POLICY=truncate).")
+    ensemble: Optional[JudgeEnsembleInfo] = None
 
 
 
 class SinglePromptRequest(BaseModel):
     prompt: str
     judge_model_type: Optional[str] = "gemini"
+    bypass_cache: bool = Field(False, description="Ignora o cache de resultados e força uma nova avaliação.")
+    allow_near_duplicate: bool = Field(True, description="Aceita a avaliação de um prompt já avaliado quase idêntico a este.")
+    timeout_seconds: Optional[float] = Field(None, gt=0, description="Prazo total da avaliação; ao expirar, as chamadas pendentes são canceladas.")
+    judge_ensemble: Optional[List[str]] = Field(
+        None, description="Avaliadores do ensemble ('provedor' ou 'provedor:modelo'); substitui judge_model_type. Se omitido, usa JUDGE_ENSEMBLE."
+    )
+    mode: Literal["llm", "fast"] = Field(
+        "llm", description="'llm' usa o modelo avaliador; 'fast' usa a pontuação heurística local, sem chamadas externas."
+    )
 
 
 class EvaluationItem(BaseModel):
     subject: str
     score: int
     fullMark: int
+    variance: Optional[float] = Field(None, description="Com ensemble, variância das notas entre os avaliadores.")
 
 
 class SinglePromptResponse(BaseModel):
     prompt: str
     evaluationData: List[EvaluationItem]
-    justification: str
\ No newline at end of file
+    justification: str
+    near_duplicate: Optional[NearDuplicateMatch] = None
+    prompt_truncated: bool = Field(False, description="O prompt excedia o orçamento de tokens e foi cortado (PROMPT_OVERFLOW_POLICY=truncate).")
+    ensemble: Optional[JudgeEnsembleInfo] = None
+
+
+class ComparisonJudgeOutput(BaseModel):
+    """Saída esperada do judge na avaliação comparativa (original + duas reformulações)."""
+    evaluationData: List[EvaluationDataItem]
+    winningVersion: int = Field(..., ge=1, le=2)
+    justification: str = "Sem justificativa fornecida pela LLM."
+
+
+class SingleJudgeOutput(BaseModel):
+    """Saída esperada do judge na avaliação de um único prompt."""
+    evaluationData: List[EvaluationItem]
+    justification: str = "Sem justificativa fornecida pela LLM."
+
+
+class WinnerJudgeOutput(BaseModel):
+    """Saída esperada do judge na comparação entre duas reformulações já pontuadas (número da vencedora)."""
+    winningVersion: int = Field(..., ge=1)
+    justification: str = "Sem justificativa fornecida pela LLM."
+
+
+class BatchPromptRequest(BaseModel):
+    items: List[PromptRequest] = Field(..., min_length=1, description="Prompts a processar, na ordem desejada.")
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    result: Optional[PromptResponse] = None
+    error: Optional[str] = None
+
+
+class BatchPromptResponse(BaseModel):
+    results: List[BatchItemResult]
+    succeeded: int
+    failed: int
+
+
+class JobSubmitRequest(PromptRequest):
+    priority: int = Field(5, ge=0, le=9, description="Prioridade na fila (9 é a mais alta).")
+
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    deduplicated: bool = Field(False, description="Verdadeiro se um job idêntico já existente foi reaproveitado.")
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str # queued, running, succeeded ou failed
+    priority: int
+    attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[PromptResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,73 @@
+import asyncio
+from typing import AsyncContextManager, Dict, List
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError
+from app.providers.admission import ProviderOverloadedError
+from app.providers.token_budget import PromptTooLargeError
+from app.schemas.prompt import BatchItemResult, BatchPromptResponse, PromptRequest
+from app.services.prompt_engineering import ReformulationError
+from app.services.prompt_pipeline import run_prompt_pipeline
+
+
+def _parse_provider_limits(raw: str) -> Dict[str, int]:
+    """Converte 'gemini=4,openai=16' em {'gemini': 4, 'openai': 16}, ignorando entradas inválidas."""
+    limits: Dict[str, int] = {}
+    for entry in raw.split(","):
+        name, _, value = entry.partition("=")
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = int(value.strip())
+    return limits
+
+
+class BatchScheduler:
+    """
+    Escalonador de concorrência limitada para processamento em lote.
+    Um limite global controla quantos itens estão no pipeline ao mesmo tempo e
+    semáforos por provedor controlam as chamadas simultâneas de cada estágio
+    (geração e avaliação), de modo que a vazão fique limitada pelos provedores.
+    Compartilhado por todos os lotes do processo.
+    """
+
+    def __init__(self, max_concurrency: int, provider_concurrency: int, provider_limits: Dict[str, int]):
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._provider_concurrency = provider_concurrency
+        self._provider_limits = provider_limits
+        self._provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def provider_slot(self, model_type: str) -> AsyncContextManager:
+        """Contexto que admite uma chamada ao provedor model_type."""
+        semaphore = self._provider_semaphores.get(model_type)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._provider_limits.get(model_type, self._provider_concurrency))
+            self._provider_semaphores[model_type] = semaphore
+        return semaphore
+
+    async def _run_item(self, index: int, item: PromptRequest) -> BatchItemResult:
+        async with self._global:
+            try:
+                result = await run_prompt_pipeline(item, stage_gate=self.provider_slot)
+            except ProviderOverloadedError as e:
+                return BatchItemResult(index=index, error=f"Provedor LLM sobrecarregado: {str(e)}")
+            except ReformulationError as e:
+                return BatchItemResult(index=index, error=f"Falha ao gerar reformulações: {str(e)}")
+            except (DeadlineExceededError, PromptTooLargeError) as e:
+                return BatchItemResult(index=index, error=str(e))
+            except Exception as e:
+                return BatchItemResult(index=index, error=f"Erro inesperado ({type(e).__name__}): {str(e)}")
+        if result.error:
+            return BatchItemResult(index=index, result=result, error=result.error)
+        return BatchItemResult(index=index, result=result)
+
+    async def run(self, items: List[PromptRequest]) -> BatchPromptResponse:
+        """Processa todos os itens e devolve os resultados na ordem de entrada, com erros por item."""
+        results = await asyncio.gather(*(self._run_item(index, item) for index, item in enumerate(items)))
+        failed = sum(1 for result in results if result.error)
+        return BatchPromptResponse(results=list(results), succeeded=len(results) - failed, failed=failed)
+
+
+batch_scheduler = BatchScheduler(
+    max_concurrency=settings.BATCH_MAX_CONCURRENCY,
+    provider_concurrency=settings.BATCH_PROVIDER_CONCURRENCY,
+    provider_limits=_parse_provider_limits(settings.BATCH_PROVIDER_LIMITS),
+)
@@ -0,0 +1,137 @@
+import re
+from typing import List, Sequence
+
+import numpy as np
+
+from app.core.prompt_templates import EVALUATION_CRITERIA
+
+# Marcadores textuais (pt/en) contados por prompt. Cada grupo vira uma coluna de features.
+_MARKERS = {
+    "format": r"\b(formato|format|json|tabela|table|lista|list|markdown|bullet|t[óo]picos|csv|yaml|par[áa]grafos?)\b",
+    "constraint": r"\b(n[ãa]o|deve|devem|evite|m[áa]ximo|m[íi]nimo|limite|exatamente|apenas|somente|must|avoid|never|at most|at least|only)\b",
+    "context": r"\b(contexto|p[úu]blico|objetivo|cen[áa]rio|background|audience|context|goal|prop[óo]sito|situa[çc][ãa]o)\b",
+    "role": r"\b(voc[êe] [ée]|atue como|aja como|assuma o papel|you are|act as)\b",
+    "example": r"\b(exemplos?|por exemplo|examples?|e\.g\.|ex:)",
+    "success": r"\b(crit[ée]rios?|sucesso|verifique|valide|confira|success|verify|validate|check)\b",
+    "ambiguous": r"\b(algo|coisa|coisas|etc|talvez|qualquer|something|stuff|things|maybe|whatever)\b",
+    "ethics": r"\b([ée]tic[oa]s?|vi[ée]s|inclusiv\w*|respeit\w*|segur\w*|privacidade|bias|fair\w*|privacy|safe\w*|respons[áa]vel)\b",
+}
+_COMPILED_MARKERS = [re.compile(pattern, re.IGNORECASE) for pattern in _MARKERS.values()]
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_PATTERN = re.compile(r"[.!?]+(\s|$)")
+_LIST_LINE_PATTERN = re.compile(r"^\s*([-*•]|\d+[.)])\s+", re.MULTILINE)
+_HEADER_LINE_PATTERN = re.compile(r"^\s*(#+\s|\*\*[^*]+\*\*|[^\n]{1,60}:\s*$)", re.MULTILINE)
+_PLACEHOLDER_PATTERN = re.compile(r"\{[^{}\n]+\}|\[[^\[\]\n]+\]|<[^<>\n]+>")
+
+# Colunas: chars, words, avg_sentence_len, lines, list_lines, headers, placeholders, digits,
+# type_token_ratio, repeated_trigram_ratio, seguidas dos grupos de _MARKERS.
+_FEATURE_NAMES = [
+    "chars", "words", "avg_sentence_len", "lines", "list_lines", "headers", "placeholders", "digits",
+    "type_token_ratio", "repeated_trigram_ratio", *_MARKERS.keys(),
+]
+_COLUMN = {name: index for index, name in enumerate(_FEATURE_NAMES)}
+
+
+def _raw_features(text: str) -> List[float]:
+    words = [word.lower() for word in _WORD_PATTERN.findall(text)]
+    n_words = len(words)
+    n_sentences = max(1, len(_SENTENCE_PATTERN.findall(text)))
+    trigrams = list(zip(words, words[1:], words[2:]))
+    repeated_trigrams = len(trigrams) - len(set(trigrams))
+    return [
+        len(text),
+        n_words,
+        n_words / n_sentences,
+        text.count("\n") + 1,
+        len(_LIST_LINE_PATTERN.findall(text)),
+        len(_HEADER_LINE_PATTERN.findall(text)),
+        len(_PLACEHOLDER_PATTERN.findall(text)),
+        sum(char.isdigit() for char in text),
+        len(set(words)) / n_words if n_words else 0.0,
+        repeated_trigrams / len(trigrams) if trigrams else 0.0,
+        *(len(pattern.findall(text)) for pattern in _COMPILED_MARKERS),
+    ]
+
+
+def extract_features(texts: Sequence[str]) -> np.ndarray:
+    """Matriz (n_textos, n_features) com as contagens e razões brutas de cada texto."""
+    return np.array([_raw_features(text) for text in texts], dtype=np.float64).reshape(len(texts), len(_FEATURE_NAMES))
+
+
+# Valor a partir do qual cada contagem é considerada "saturada" (feature normalizada = 1)
+_SATURATION = {
+    "chars": 2000, "words": 400, "avg_sentence_len": 40, "lines": 40, "list_lines": 15, "headers": 8,
+    "placeholders": 5, "digits": 20, "format": 6, "constraint": 8, "context": 4, "role": 2,
+    "example": 3, "success": 4, "ambiguous": 4, "ethics": 3,
+}
+_RATIO_COLUMNS = [_COLUMN["type_token_ratio"], _COLUMN["repeated_trigram_ratio"]]
+_LOG_SATURATION = np.log1p([_SATURATION.get(name, 1.0) for name in _FEATURE_NAMES])
+
+
+def _normalize(features: np.ndarray) -> np.ndarray:
+    """Comprime contagens com log1p e satura em [0, 1] para que nenhum marcador domine a nota."""
+    normalized = np.log1p(features) / _LOG_SATURATION
+    normalized[:, _RATIO_COLUMNS] = features[:, _RATIO_COLUMNS] # Razões já estão em [0, 1]
+    return np.clip(normalized, 0.0, 1.0)
+
+
+def _weights() -> np.ndarray:
+    """Matriz (10 critérios, n_features) de pesos, na ordem de EVALUATION_CRITERIA."""
+    rows = [
+        {"words": 2.0, "digits": 1.5, "type_token_ratio": 2.0, "format": 1.0, "ambiguous": -4.0},       # Clareza e Especificidade
+        {"lines": 2.0, "list_lines": 3.5, "headers": 3.0, "avg_sentence_len": -1.0},                     # Estrutura e Organização
+        {"type_token_ratio": 1.5, "repeated_trigram_ratio": -4.0, "ambiguous": -1.5},                    # Consistência Interna
+        {"words": 2.5, "context": 4.0, "role": 1.5},                                                     # Contextualização
+        {"format": 4.0, "constraint": 3.5, "success": 1.0},                                              # Parâmetros de Execução
+        {"type_token_ratio": 3.0, "repeated_trigram_ratio": -5.0, "avg_sentence_len": -2.5},             # Eficiência Linguística
+        {"constraint": 3.0, "success": 3.5, "example": 1.5},                                             # Robustez
+        {"placeholders": 5.0, "words": 1.0, "ambiguous": -1.0},                                          # Adaptabilidade
+        {"role": 4.5, "example": 3.0, "context": 1.0},                                                   # Preparação e Enquadramento
+        {"ethics": 3.0},                                                                                  # Princípios Éticos
+    ]
+    weights = np.zeros((len(EVALUATION_CRITERIA), len(_FEATURE_NAMES)))
+    for criterion_index, row in enumerate(rows):
+        for feature, weight in row.items():
+            weights[criterion_index, _COLUMN[feature]] = weight
+    return weights
+
+
+_WEIGHTS = _weights()
+# Nota de partida de cada critério antes das contribuições das features
+_BIAS = np.array([3.0, 3.0, 7.0, 3.0, 2.0, 5.0, 3.0, 4.0, 3.0, 7.0])
+
+
+def score_prompts_fast(texts: Sequence[str]) -> np.ndarray:
+    """
+    Pontua um lote de textos nos 10 critérios sem chamar LLM.
+    Retorna uma matriz (n_textos, 10) de notas inteiras entre 0 e 10.
+    """
+    if not texts:
+        return np.zeros((0, len(EVALUATION_CRITERIA)), dtype=np.int64)
+    scores = _BIAS + _normalize(extract_features(texts)) @ _WEIGHTS.T
+    return np.clip(np.rint(scores), 0, 10).astype(np.int64)
+
+
+def _justification(scores: np.ndarray) -> str:
+    order = np.argsort(scores, kind="stable")
+    strongest = [EVALUATION_CRITERIA[index] for index in order[::-1][:2]]
+    weakest = [EVALUATION_CRITERIA[index] for index in order[:2]]
+    return (
+        "Avaliação heurística local (modo rápido), sem uso de LLM. "
+        f"Pontos fortes: {', '.join(strongest)}. Pontos a melhorar: {', '.join(weakest)}."
+    )
+
+
+def evaluate_prompts_fast(texts: Sequence[str]) -> List[dict]:
+    """Versão em lote de evaluate_single_prompt no modo rápido, no mesmo formato de saída."""
+    return [
+        {
+            "prompt": text,
+            "evaluationData": [
+                {"subject": criterion, "score": int(score), "fullMark": 10}
+                for criterion, score in zip(EVALUATION_CRITERIA, row)
+            ],
+            "justification": _justification(row),
+        }
+        for text, row in zip(texts, score_prompts_fast(texts))
+    ]
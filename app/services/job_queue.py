@@ -0,0 +1,207 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.schemas.prompt import PromptRequest
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+
+class JobQueueFullError(Exception):
+    """Levantada quando a fila atingiu JOB_QUEUE_MAX_DEPTH jobs aguardando execução."""
+
+    def __init__(self, message: str, retry_after: float = 5.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """
+    Fila de jobs persistente em SQLite (modo WAL), compartilhada pela API e pelos processos worker.
+    Jobs são deduplicados pelo hash de conteúdo da requisição, retirados por prioridade (maior primeiro)
+    e ordem de chegada, e executados sob um lease renovado pelo worker: se ele morrer, o job volta para a fila
+    quando o lease expira, até JOB_MAX_ATTEMPTS tentativas. Só o worker dono do lease grava o desfecho.
+    As operações são síncronas; use os wrappers assíncronos no event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, content_hash TEXT NOT NULL, status TEXT NOT NULL, priority INTEGER NOT NULL,"
+            " request TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, available_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+            " lease_expires_at REAL, worker_id TEXT);"
+            "CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, created_at);"
+            "CREATE INDEX IF NOT EXISTS jobs_content_hash ON jobs (content_hash, status);"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["request"] = json.loads(job["request"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, request: PromptRequest, content_hash: str, priority: int) -> Tuple[Dict[str, Any], bool]:
+        """
+        Enfileira a requisição e retorna (job, deduplicado). Um job com o mesmo hash na fila,
+        em execução ou concluído dentro do TTL de resultados é reaproveitado, salvo com bypass_cache.
+        Levanta JobQueueFullError quando a fila está cheia.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not request.bypass_cache:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE content_hash = ? AND (status IN (?, ?) OR (status = ? AND finished_at >= ?))"
+                    " ORDER BY created_at DESC LIMIT 1",
+                    (content_hash, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED, now - settings.RESULT_CACHE_TTL_SECONDS),
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return self._row_to_job(row), True
+
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (STATUS_QUEUED,)).fetchone()[0]
+            if queued >= settings.JOB_QUEUE_MAX_DEPTH:
+                raise JobQueueFullError(f"Fila de jobs cheia ({queued} aguardando).")
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, content_hash, status, priority, request, created_at, available_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, content_hash, STATUS_QUEUED, priority, request.model_dump_json(), now, now),
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+            return self._row_to_job(row), False
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retira atomicamente o próximo job disponível (maior prioridade, mais antigo), incluindo
+        jobs cujo lease expirou, e o marca como em execução por worker_id. Jobs com lease expirado
+        que já esgotaram JOB_MAX_ATTEMPTS (ex: o worker morre sempre no mesmo job) são marcados como falhos.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL"
+                " WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                (
+                    STATUS_FAILED, f"Job abandonado após {settings.JOB_MAX_ATTEMPTS} tentativas (lease expirado).", now,
+                    STATUS_RUNNING, now, settings.JOB_MAX_ATTEMPTS,
+                ),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_expires_at < ?)"
+                " ORDER BY priority DESC, created_at LIMIT 1",
+                (STATUS_QUEUED, now, STATUS_RUNNING, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, lease_expires_at = ?, worker_id = ?, attempts = attempts + 1"
+                " WHERE id = ?",
+                (STATUS_RUNNING, now, now + settings.JOB_LEASE_SECONDS, worker_id, row["id"]),
+            )
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._row_to_job(job)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # As gravações abaixo só valem para o worker dono do lease: retornam False se o job foi retomado por outro
+
+    def renew_lease(self, job_id: str, worker_id: str) -> bool:
+        """Estende o lease do job em execução por worker_id (heartbeat)."""
+        return self._connect().execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker_id = ? AND status = ?",
+            (time.time() + settings.JOB_LEASE_SECONDS, job_id, worker_id, STATUS_RUNNING),
+        ).rowcount > 0
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        return self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ?, lease_expires_at = NULL"
+            " WHERE id = ? AND worker_id = ? AND status = ?",
+            (STATUS_SUCCEEDED, json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id, STATUS_RUNNING),
+        ).rowcount > 0
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        return self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires_at = NULL"
+            " WHERE id = ? AND worker_id = ? AND status = ?",
+            (STATUS_FAILED, error, time.time(), job_id, worker_id, STATUS_RUNNING),
+        ).rowcount > 0
+
+    def retry_later(self, job_id: str, worker_id: str, error: str, delay_seconds: float) -> bool:
+        """Devolve o job à fila após delay_seconds (ex: provedor sobrecarregado)."""
+        return self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_expires_at = NULL, worker_id = NULL"
+            " WHERE id = ? AND worker_id = ? AND status = ?",
+            (STATUS_QUEUED, error, time.time() + delay_seconds, job_id, worker_id, STATUS_RUNNING),
+        ).rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._row_to_job(self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def counts(self) -> Dict[str, int]:
+        """Número de jobs por status."""
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED, STATUS_FAILED)} | {row[0]: row[1] for row in rows}
+
+    def purge_finished(self, older_than_seconds: float) -> int:
+        """Remove jobs concluídos ou falhos há mais de older_than_seconds. Retorna quantos foram removidos."""
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (STATUS_SUCCEEDED, STATUS_FAILED, time.time() - older_than_seconds),
+        )
+        return cursor.rowcount
+
+    # Wrappers assíncronos: SQLite roda em thread separada para não bloquear o event loop
+    async def asubmit(self, request: PromptRequest, content_hash: str, priority: int) -> Tuple[Dict[str, Any], bool]:
+        return await asyncio.to_thread(self.submit, request, content_hash, priority)
+
+    async def aget(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, job_id)
+
+    async def acounts(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self.counts)
+
+
+_job_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """JobStore do processo, criado no primeiro uso (cada processo abre as próprias conexões)."""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore(settings.JOB_QUEUE_SQLITE_PATH)
+    return _job_store
@@ -0,0 +1,189 @@
+"""
+Processos worker da fila de jobs de /processar-prompt.
+
+Execução avulsa (recomendada com vários workers do uvicorn):
+    python -m app.services.job_worker --processes 4 --concurrency 8
+
+Ou embutida na API com JOB_WORKER_PROCESSES > 0 (iniciada e encerrada pelo lifespan).
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError
+from app.providers.admission import ProviderOverloadedError
+from app.providers.token_budget import PromptTooLargeError
+from app.schemas.prompt import PromptRequest
+from app.services.job_queue import get_job_store
+from app.services.prompt_engineering import ReformulationError
+
+logger = logging.getLogger(__name__)
+
+
+async def _keep_lease(store, job_id: str, worker_id: str, work: asyncio.Future) -> None:
+    """Heartbeat do lease: renova a cada JOB_LEASE_RENEW_SECONDS e cancela `work` se o job passou a outro worker."""
+    while True:
+        await asyncio.sleep(min(settings.JOB_LEASE_RENEW_SECONDS, settings.JOB_LEASE_SECONDS / 3))
+        try:
+            renewed = await asyncio.to_thread(store.renew_lease, job_id, worker_id)
+        except Exception:
+            logger.exception("Falha ao renovar o lease do job %s", job_id, extra={"worker_id": worker_id})
+            continue
+        if not renewed:
+            logger.warning("Lease do job %s perdido; execução abandonada.", job_id, extra={"worker_id": worker_id})
+            work.cancel()
+            return
+
+
+async def _process_job(job: dict, worker_id: str) -> None:
+    """
+    Executa o pipeline de um job e grava o resultado, a falha ou o reagendamento, renovando o lease
+    enquanto ele roda. Se o job for retomado por outro worker (lease perdido), a execução é abandonada.
+    """
+    # Importado aqui: o processo pai (API) não precisa carregar o pipeline por causa do worker
+    from app.services.prompt_pipeline import run_prompt_pipeline
+
+    store = get_job_store()
+    job_id = job["id"]
+
+    async def record(write, *args) -> None:
+        if not await asyncio.to_thread(write, job_id, worker_id, *args):
+            logger.warning("Desfecho do job %s descartado: o lease pertence a outro worker.", job_id, extra={"worker_id": worker_id})
+
+    work = asyncio.ensure_future(run_prompt_pipeline(PromptRequest.model_validate(job["request"])))
+    heartbeat = asyncio.create_task(_keep_lease(store, job_id, worker_id, work))
+    try:
+        response = await work
+    except asyncio.CancelledError:
+        if heartbeat.done(): # Cancelado pelo heartbeat: o job já pertence a outro worker
+            return
+        raise
+    except ProviderOverloadedError as e:
+        if job["attempts"] < settings.JOB_MAX_ATTEMPTS:
+            logger.warning("Job %s adiado %.1fs: %s", job_id, e.retry_after, e, extra={"worker_id": worker_id})
+            await record(store.retry_later, f"Provedor LLM sobrecarregado: {e}", e.retry_after)
+        else:
+            await record(store.fail, f"Provedor LLM sobrecarregado: {e}")
+        return
+    except ReformulationError as e:
+        await record(store.fail, f"Falha ao gerar reformulações: {e}")
+        return
+    except (DeadlineExceededError, PromptTooLargeError) as e:
+        await record(store.fail, str(e))
+        return
+    except Exception as e:
+        logger.exception("Erro inesperado no job %s", job_id, extra={"worker_id": worker_id})
+        await record(store.fail, f"Erro inesperado ({type(e).__name__}): {e}")
+        return
+    finally:
+        heartbeat.cancel()
+
+    if response.error:
+        await record(store.fail, response.error)
+    else:
+        await record(store.complete, response.model_dump())
+
+
+async def run_worker(concurrency: int, stop_event: Optional[asyncio.Event] = None) -> None:
+    """
+    Laço de um processo worker: mantém até `concurrency` jobs em execução, buscando novos
+    na fila por prioridade e aguardando JOB_POLL_INTERVAL_SECONDS quando ela está vazia.
+    """
+    store = get_job_store()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop_event = stop_event or asyncio.Event()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+
+    def _release_slot(finished: asyncio.Task) -> None:
+        running.discard(finished)
+        slots.release()
+
+    purged = await asyncio.to_thread(store.purge_finished, settings.JOB_RETENTION_SECONDS)
+    if purged:
+        logger.info("%d jobs antigos removidos da fila.", purged)
+    logger.info("Worker de jobs iniciado (%s, concorrência %d).", worker_id, concurrency)
+
+    while not stop_event.is_set():
+        await slots.acquire()
+        job = await asyncio.to_thread(store.claim, worker_id)
+        if job is None:
+            slots.release()
+            try:
+                await asyncio.wait_for(stop_event.wait(), settings.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(_process_job(job, worker_id))
+        running.add(task)
+        task.add_done_callback(_release_slot)
+
+    # Encerramento gracioso: termina os jobs em andamento (os não concluídos voltam à fila pelo lease)
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+    logger.info("Worker de jobs encerrado (%s).", worker_id)
+
+
+def _worker_process_main(concurrency: int) -> None:
+    from app.core.logging_config import setup_logging, shutdown_logging
+
+    setup_logging()
+    loop = asyncio.new_event_loop()
+    stop_event = asyncio.Event()
+    # SIGTERM/SIGINT pedem encerramento gracioso em vez de matar jobs no meio
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+    try:
+        loop.run_until_complete(run_worker(concurrency, stop_event))
+    finally:
+        loop.close()
+        shutdown_logging()
+
+
+class JobWorkerPool:
+    """Conjunto de processos worker (spawn), cada um com seu próprio event loop e clientes LLM."""
+
+    def __init__(self, processes: int, concurrency: int):
+        self.processes = processes
+        self.concurrency = concurrency
+        self._children: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        for index in range(self.processes):
+            process = context.Process(
+                target=_worker_process_main, args=(self.concurrency,), name=f"job-worker-{index}", daemon=True
+            )
+            process.start()
+            self._children.append(process)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        for process in self._children:
+            if process.is_alive():
+                process.terminate() # SIGTERM: encerramento gracioso
+        for process in self._children:
+            process.join(timeout)
+        self._children.clear()
+
+    def join(self) -> None:
+        for process in self._children:
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processos worker da fila de jobs.")
+    parser.add_argument("--processes", type=int, default=max(1, settings.JOB_WORKER_PROCESSES))
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    arguments = parser.parse_args()
+    pool = JobWorkerPool(arguments.processes, arguments.concurrency)
+    pool.start()
+    try:
+        pool.join()
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import statistics
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError
+from app.core.metrics import JUDGE_ENSEMBLE_JUDGES, JUDGE_ENSEMBLE_RUNS
+from app.providers.admission import ProviderOverloadedError
+from app.services.prompt_judge import evaluate_reformulations, evaluate_single_prompt
+
+logger = logging.getLogger(__name__)
+
+KIND_COMPARISON = "comparison"
+KIND_SINGLE = "single"
+
+# Relatório de um avaliador: (rótulo "provedor[:modelo]", relatório sem 'error')
+JudgeReport = Tuple[str, Dict[str, Any]]
+
+
+def parse_judge_spec(spec: str) -> Tuple[str, Optional[str]]:
+    """Converte 'provedor' ou 'provedor:modelo' em (judge_model_type, judge_model_name)."""
+    model_type, _, model_name = spec.strip().partition(":")
+    return model_type, model_name or None
+
+
+def resolve_judge_ensemble(judge_ensemble: Optional[List[str]]) -> List[str]:
+    """Avaliadores do ensemble da requisição ou, se omitidos, de JUDGE_ENSEMBLE. Lista vazia = um só judge."""
+    specs = judge_ensemble if judge_ensemble is not None else settings.JUDGE_ENSEMBLE.split(",")
+    return [spec.strip() for spec in specs if spec.strip()]
+
+
+def _aggregate(values: List[float]) -> float:
+    if settings.JUDGE_ENSEMBLE_AGGREGATION == "median":
+        return float(statistics.median(values))
+    return float(statistics.fmean(values))
+
+
+def _variance(values: List[float]) -> float:
+    return round(statistics.pvariance(values), 4) if len(values) > 1 else 0.0
+
+
+def _variant_means(report: Dict[str, Any]) -> List[float]:
+    """Nota média de cada variante nos critérios do relatório de um avaliador."""
+    rows = report.get("evaluationData") or []
+    if not rows:
+        return []
+    return [statistics.fmean(row["versions"][position] for row in rows) for position in range(len(rows[0]["versions"]))]
+
+
+def _confident_vote(report: Dict[str, Any]) -> Optional[int]:
+    """Vencedora do avaliador se as notas dele a sustentam com JUDGE_ENSEMBLE_MIN_MARGIN de folga sobre as demais."""
+    winner = report.get("winningVersion")
+    means = _variant_means(report)
+    if not isinstance(winner, int) or not 1 <= winner <= len(means):
+        return None
+    runner_up = max((mean for version, mean in enumerate(means, start=1) if version != winner), default=0.0)
+    return winner if means[winner - 1] - runner_up >= settings.JUDGE_ENSEMBLE_MIN_MARGIN else None
+
+
+def _comparison_agreed(reports: List[JudgeReport]) -> bool:
+    votes: Dict[int, int] = {}
+    for _, report in reports:
+        vote = _confident_vote(report)
+        if vote is not None:
+            votes[vote] = votes.get(vote, 0) + 1
+    return max(votes.values(), default=0) >= settings.JUDGE_ENSEMBLE_QUORUM
+
+
+def _overall_score(report: Dict[str, Any]) -> float:
+    return statistics.fmean(float(item.get("score", 0)) for item in report["evaluationData"]) if report["evaluationData"] else 0.0
+
+
+def _single_agreed(reports: List[JudgeReport]) -> bool:
+    """JUDGE_ENSEMBLE_QUORUM avaliadores com notas médias a até JUDGE_ENSEMBLE_SCORE_TOLERANCE pontos entre si?"""
+    quorum = settings.JUDGE_ENSEMBLE_QUORUM
+    scores = sorted(_overall_score(report) for _, report in reports)
+    return any(
+        scores[position + quorum - 1] - scores[position] <= settings.JUDGE_ENSEMBLE_SCORE_TOLERANCE
+        for position in range(len(scores) - quorum + 1)
+    )
+
+
+async def _run_ensemble(
+    kind: str,
+    judges: List[str],
+    evaluate: Callable[[str, Optional[str]], Awaitable[Dict[str, Any]]],
+    agreed: Callable[[List[JudgeReport]], bool],
+) -> Tuple[List[JudgeReport], List[Dict[str, Any]], bool]:
+    """
+    Consulta os avaliadores em paralelo, começando por JUDGE_ENSEMBLE_INITIAL_JUDGES e acionando os seguintes só
+    enquanto não houver acordo (e os que ainda estão em andamento não bastarem para o quórum).
+    Para no acordo, cancelando os avaliadores restantes. Retorna (relatórios, erros, parou antes de consultar todos).
+    Falha de um avaliador (relatório com erro ou qualquer exceção, ex: provedor sobrecarregado, sem chave de API
+    ou erro HTTP) não interrompe os demais; DeadlineExceededError sim.
+    """
+    pending = list(judges)
+    running: Dict[asyncio.Task, str] = {}
+    reports: List[JudgeReport] = []
+    errors: List[Dict[str, Any]] = []
+    overloaded: Optional[ProviderOverloadedError] = None
+    early_stopped = False
+
+    def launch() -> None:
+        spec = pending.pop(0)
+        running[asyncio.create_task(evaluate(*parse_judge_spec(spec)))] = spec
+
+    for _ in range(min(len(pending), max(1, settings.JUDGE_ENSEMBLE_INITIAL_JUDGES))):
+        launch()
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                spec = running.pop(task)
+                try:
+                    report = task.result()
+                except DeadlineExceededError:
+                    raise
+                except ProviderOverloadedError as e:
+                    overloaded = overloaded or e
+                    report = {"error": f"{spec}: {e}", "raw_output": ""}
+                except Exception as e:
+                    report = {"error": f"{spec}: {type(e).__name__}: {e}", "raw_output": ""}
+                if "error" in report:
+                    JUDGE_ENSEMBLE_JUDGES.inc(kind=kind, outcome="failed")
+                    logger.warning("Avaliador %s do ensemble falhou: %s", spec, report["error"], extra={"stage": "judge_ensemble"})
+                    errors.append(report)
+                    continue
+                JUDGE_ENSEMBLE_JUDGES.inc(kind=kind, outcome="answered")
+                reports.append((spec, report))
+            if len(reports) >= settings.JUDGE_ENSEMBLE_QUORUM and agreed(reports):
+                early_stopped = bool(running or pending)
+                break
+            # Sem acordo: mantém em andamento avaliadores suficientes para completar o quórum
+            while pending and len(running) < max(1, settings.JUDGE_ENSEMBLE_QUORUM - len(reports)):
+                launch()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    JUDGE_ENSEMBLE_JUDGES.inc(len(running), kind=kind, outcome="cancelled")
+    JUDGE_ENSEMBLE_JUDGES.inc(len(pending), kind=kind, outcome="skipped")
+    if not reports:
+        JUDGE_ENSEMBLE_RUNS.inc(kind=kind, outcome="failed")
+        if overloaded is not None:
+            raise overloaded
+    else:
+        JUDGE_ENSEMBLE_RUNS.inc(kind=kind, outcome="agreed" if agreed(reports) else "exhausted")
+    return reports, errors, early_stopped
+
+
+def _ensemble_info(judges: List[str], agreeing: int, early_stopped: bool) -> Dict[str, Any]:
+    return {
+        "judges": judges,
+        "judge_count": len(judges),
+        "agreement": round(agreeing / len(judges), 4),
+        "early_stopped": early_stopped,
+        "aggregation": settings.JUDGE_ENSEMBLE_AGGREGATION,
+    }
+
+
+def _ensemble_error(prefix: str, errors: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "error": f"{prefix} Nenhum avaliador do ensemble respondeu: " + " | ".join(error["error"] for error in errors),
+        "raw_output": errors[0].get("raw_output", "") if errors else "",
+    }
+
+
+async def evaluate_reformulations_ensemble(
+    prompt_original: str,
+    reformulations: List[str],
+    judges: List[str],
+    use_cache: bool = True
+) -> Dict[str, Any]:
+    """
+    Versão de evaluate_reformulations com vários avaliadores: agrega as notas de cada critério (média ou mediana,
+    com a variância entre avaliadores) e escolhe a vencedora por maioria dos votos (empate: maior nota agregada).
+    Retorna o relatório de avaliação com 'ensemble' ou {'error', 'raw_output'} se nenhum avaliador responder.
+    """
+    error_msg_prefix = f"evaluate_reformulations_ensemble (judges: {', '.join(judges)}):"
+
+    async def evaluate(judge_model_type: str, judge_model_name: Optional[str]) -> Dict[str, Any]:
+        return await evaluate_reformulations(prompt_original, reformulations, judge_model_type, judge_model_name, use_cache)
+
+    reports, errors, early_stopped = await _run_ensemble(KIND_COMPARISON, judges, evaluate, _comparison_agreed)
+    if not reports:
+        return _ensemble_error(error_msg_prefix, errors)
+
+    first_report = reports[0][1]
+    evaluation_rows = []
+    for position, row in enumerate(first_report["evaluationData"]):
+        judge_rows = [report["evaluationData"][position] for _, report in reports if position < len(report["evaluationData"])]
+        originals = [float(judge_row["original"]) for judge_row in judge_rows]
+        versions = [[float(judge_row["versions"][index]) for judge_row in judge_rows] for index in range(len(reformulations))]
+        aggregated_versions = [_aggregate(scores) for scores in versions]
+        evaluation_rows.append({
+            **row,
+            "original": _aggregate(originals),
+            "version1": aggregated_versions[0],
+            "version2": aggregated_versions[1],
+            "versions": aggregated_versions,
+            "variance": [_variance(originals)] + [_variance(scores) for scores in versions],
+        })
+
+    votes: Dict[int, int] = {}
+    for _, report in reports:
+        votes[report["winningVersion"]] = votes.get(report["winningVersion"], 0) + 1
+    totals = [sum(row["versions"][index] for row in evaluation_rows) for index in range(len(reformulations))]
+    winner = max(votes, key=lambda version: (votes[version], totals[version - 1] if 1 <= version <= len(totals) else 0.0))
+    justification = next(report["justification"] for _, report in reports if report["winningVersion"] == winner)
+    logger.info(
+        "Ensemble: reformulação %d venceu com %d de %d votos.", winner, votes[winner], len(reports),
+        extra={"stage": "judge_ensemble", "early_stopped": early_stopped}
+    )
+    return {
+        **first_report,
+        "evaluationData": evaluation_rows,
+        "winningVersion": winner,
+        "justification": justification,
+        "ensemble": _ensemble_info([spec for spec, _ in reports], votes[winner], early_stopped),
+    }
+
+
+async def evaluate_single_prompt_ensemble(prompt: str, judges: List[str], use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Versão de evaluate_single_prompt com vários avaliadores: agrega as notas de cada critério (média ou mediana,
+    arredondada, com a variância entre avaliadores). A concordância é a fração de avaliadores cuja nota média fica
+    a até JUDGE_ENSEMBLE_SCORE_TOLERANCE da nota agregada. Retorna o relatório com 'ensemble' ou {'error', 'raw_output'}.
+    """
+    error_msg_prefix = f"evaluate_single_prompt_ensemble (judges: {', '.join(judges)}):"
+
+    async def evaluate(judge_model_type: str, judge_model_name: Optional[str]) -> Dict[str, Any]:
+        return await evaluate_single_prompt(prompt, judge_model_type, judge_model_name, use_cache)
+
+    reports, errors, early_stopped = await _run_ensemble(KIND_SINGLE, judges, evaluate, _single_agreed)
+    if not reports:
+        return _ensemble_error(error_msg_prefix, errors)
+
+    first_report = reports[0][1]
+    evaluation_items = []
+    for position, item in enumerate(first_report["evaluationData"]):
+        scores = [
+            float(report["evaluationData"][position].get("score", 0))
+            for _, report in reports if position < len(report["evaluationData"])
+        ]
+        evaluation_items.append({**item, "score": round(_aggregate(scores)), "variance": _variance(scores)})
+
+    overall = _aggregate([_overall_score(report) for _, report in reports])
+    agreeing = [
+        (spec, report) for spec, report in reports
+        if abs(_overall_score(report) - overall) <= settings.JUDGE_ENSEMBLE_SCORE_TOLERANCE
+    ]
+    justification = (agreeing or reports)[0][1]["justification"]
+    return {
+        **first_report,
+        "evaluationData": evaluation_items,
+        "justification": justification,
+        "ensemble": _ensemble_info([spec for spec, _ in reports], len(agreeing), early_stopped),
+    }
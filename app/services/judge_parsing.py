@@ -0,0 +1,62 @@
+import json
+from typing import Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """
+    Extrai o primeiro objeto JSON balanceado de um texto ruidoso (prosa, cercas ```json, etc.),
+    respeitando chaves dentro de strings. Retorna None se nenhum objeto for fechado.
+    """
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    candidate = text[start:index + 1]
+                    try:
+                        json.loads(candidate)
+                        return candidate
+                    except json.JSONDecodeError:
+                        break # Objeto balanceado mas inválido: tenta o próximo '{'
+        else:
+            return None # Texto terminou com o objeto aberto (saída truncada)
+        start = text.find("{", start + 1)
+    return None
+
+
+def broken_json_fragment(text: str) -> str:
+    """Recorta o trecho a partir do primeiro '{' para enviar ao reparo sem a prosa ao redor."""
+    start = text.find("{")
+    return text[start:].strip().rstrip("`").strip() if start != -1 else text.strip()
+
+
+def parse_judge_output(text: str, schema: Type[BaseModel]) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Extrai e valida a saída do judge contra o schema pydantic.
+    Retorna (dados, None) em caso de sucesso ou (None, descrição do erro).
+    """
+    candidate = extract_json_object(text)
+    if candidate is None:
+        return None, "Nenhum objeto JSON completo encontrado na saída da LLM."
+    try:
+        return schema.model_validate_json(candidate).model_dump(), None
+    except ValidationError as e:
+        return None, f"JSON não corresponde ao formato esperado: {e.errors()[:3]}"
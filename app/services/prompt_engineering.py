@@ -1,96 +1,345 @@
-from app.providers.llm_provider import LLMProvider
-from langchain.prompts import PromptTemplate
-from langchain_core.runnables import RunnableSequence 
+import asyncio
+import logging
+import re
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError
+from app.core.prompt_templates import (
+    COMPACT_MULTI_REFORMULATION_TEMPLATE, COMPACT_REFORMULATION_SYSTEM_TEMPLATE, COMPACT_REFORMULATION_TEMPLATE,
+    MULTI_REFORMULATION_TEMPLATE, REFORMULATION_SEPARATOR, REFORMULATION_SYSTEM_TEMPLATE, TEMPLATE_STYLE,
+    UNIFIED_REFORMULATION_TEMPLATE, prefix_cache_key,
+)
+from app.providers.admission import ProviderOverloadedError
+from app.providers.llm_provider import ROLE_GENERATION, LLMProvider, get_llm_provider
+from app.providers.model_router import model_router
+from app.providers.token_budget import stage_prompt_budget
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 
+logger = logging.getLogger(__name__)
+
 class ReformulationError(Exception):
     """Exceção customizada para erros na geração de reformulações."""
     pass
 
 
-UNIFIED_REFORMULATION_TEMPLATE = """
-Com base nos seguintes critérios de qualidade para prompts, reformule o prompt original fornecido.
-O objetivo é criar uma versão significativamente melhorada do prompt.
-
-Critérios de Qualidade para Prompts:
-1.  **Clareza e Especificidade**: Reduza ambiguidades, aumente o detalhamento e defina claramente os objetivos.
-2.  **Estrutura e Organização**: Organize as informações de maneira lógica e hierárquica.
-3.  **Consistência Interna**: Remova contradições e preserve coerência e terminologia uniforme.
-4.  **Contextualização**: Forneça contexto suficiente, relevante e bem balanceado.
-5.  **Parâmetros de Execução**: Inclua restrições, diretivas de formato e critérios claros de sucesso.
-6.  **Eficiência Linguística**: Use linguagem concisa, precisa e econômica em tokens.
-7.  **Robustez**: Adapte o prompt para prevenir falhas e ser verificável em casos extremos.
-8.  **Adaptabilidade**: Torne o prompt flexível, reutilizável e aplicável a diferentes modelos.
-9.  **Preparação e Enquadramento**: Use exemplos neutros e enquadre cognitivamente a tarefa.
-10. **Princípios Éticos**: Assegure responsabilidade, transparência e inclusão.
-
-Prompt Original a ser Reformulado:
-\"\"\"
-{prompt_original_text}
-\"\"\"
-
-Sua Tarefa:
-Reescreva o prompt original, aplicando os critérios de qualidade acima para melhorá-lo substancialmente.
-Retorne APENAS o novo prompt reformulado. Não inclua nenhuma explicação, introdução, ou qualquer texto além do prompt reformulado.
-Para gerar uma variação, você pode, por exemplo, focar em diferentes aspectos dos critérios ou explorar diferentes formas de aplicar as melhorias.
-"""
-
-def generate_reformulations(original_prompt: str, generation_model_type: str = "gemini") -> tuple[str, str]:
-    """
-    Gera duas reformulações para o prompt original usando a MESMA orientação
-    baseada em critérios de qualidade.
-    Levanta ReformulationError em caso de falha.
+_COMPACT = TEMPLATE_STYLE == "compact"
+
+
+def _reformulation_prompt(system_template: str, task_template: str) -> ChatPromptTemplate:
+    """Bloco de sistema fixo (rubrica, reaproveitável pelo cache de prefixo do provedor) seguido da tarefa com o prompt do usuário."""
+    return ChatPromptTemplate.from_messages([("system", system_template), ("human", task_template)])
+
+
+# Templates compilados uma única vez e reaproveitados por todas as chains; os dois compartilham o bloco de sistema
+_REFORMULATION_SYSTEM = COMPACT_REFORMULATION_SYSTEM_TEMPLATE if _COMPACT else REFORMULATION_SYSTEM_TEMPLATE
+UNIFIED_REFORMULATION_PROMPT = _reformulation_prompt(
+    _REFORMULATION_SYSTEM, COMPACT_REFORMULATION_TEMPLATE if _COMPACT else UNIFIED_REFORMULATION_TEMPLATE
+)
+MULTI_REFORMULATION_PROMPT = _reformulation_prompt(
+    _REFORMULATION_SYSTEM, COMPACT_MULTI_REFORMULATION_TEMPLATE if _COMPACT else MULTI_REFORMULATION_TEMPLATE
+).partial(separator=REFORMULATION_SEPARATOR)
+
+# Chave do cache de prefixo no provedor: o mesmo bloco de sistema serve às duas formas de geração
+_PREFIX_CACHE_KEY = prefix_cache_key("reformulation")
+
+# Estratégias de geração das N variantes (ver REFORMULATION_STRATEGY)
+STRATEGY_PARALLEL = "parallel" # Uma chamada por variante, em paralelo
+STRATEGY_SINGLE_CALL = "single_call" # Uma chamada que devolve todas as candidatas separadas por REFORMULATION_SEPARATOR
+STRATEGY_N_PARAM = "n" # Uma chamada com o parâmetro `n` do provedor (várias completions)
+
+_SEPARATOR_PATTERN = re.compile(r"^\s*#{2,}\s*REFORMULA[ÇC][ÃA]O\b.*$", re.IGNORECASE | re.MULTILINE)
+
+# Chains já montadas por (provedor, estratégia, n) — instâncias de longa duração do registro
+_reformulation_chains: dict[tuple, Runnable] = {}
+
+# Recebe o model_type e devolve (provedor, chain) prontos para a chamada
+ChainBuilder = Callable[[str], tuple[LLMProvider, Runnable]]
+
+
+def split_candidates(text: str) -> list[str]:
+    """Separa a saída de MULTI_REFORMULATION_TEMPLATE nas reformulações candidatas (sem vazias)."""
+    return [candidate.strip() for candidate in _SEPARATOR_PATTERN.split(text) if candidate.strip()]
+
+
+def _build_reformulation_chain(generation_model_type: str) -> tuple[LLMProvider, Runnable]:
     """
-    print(f"Iniciando geração de DUAS reformulações para o prompt com modelo: {generation_model_type} usando orientação unificada.")
-    error_msg_prefix = f"generate_reformulations (modelo: {generation_model_type}):"
+    Monta (uma vez por provedor) a chain template | LLM | parser da reformulação unificada
+    e devolve o provedor que a executa.
+    Levanta ValueError se o provedor não estiver configurado.
+    """
+    # Obtém o provedor LLM reutilizável do registro.
+    # LLMProvider usa a chave de API padrão do .env para o generation_model_type
+    # e seleciona um modelo/temperatura apropriados para geração.
+    provider = get_llm_provider(generation_model_type, ROLE_GENERATION)
+    key = (provider, STRATEGY_PARALLEL, 1)
+    chain = _reformulation_chains.get(key)
+    if chain is None:
+        # Instância LLM configurada, com a saída limitada ao tamanho de uma reformulação
+        llm_instance = provider.get_llm_instance(settings.MAX_OUTPUT_TOKENS_REFORMULATION, _PREFIX_CACHE_KEY)
+        chain = _reformulation_chains[key] = UNIFIED_REFORMULATION_PROMPT | llm_instance | StrOutputParser()
+    return provider, chain
 
+
+def _build_candidates_chain(generation_model_type: str, strategy: str, num_variants: int) -> tuple[LLMProvider, Runnable]:
+    """
+    Monta a chain que produz várias candidatas em UMA chamada e devolve uma lista de textos:
+    com STRATEGY_N_PARAM, o template unificado com `n` completions; com STRATEGY_SINGLE_CALL,
+    o template de múltiplas reformulações seguido da separação das candidatas.
+    Levanta ValueError se o provedor não estiver configurado.
+    """
+    provider = get_llm_provider(generation_model_type, ROLE_GENERATION)
+    n = num_variants if strategy == STRATEGY_N_PARAM else 1
+    key = (provider, strategy, num_variants)
+    chain = _reformulation_chains.get(key)
+    if chain is not None:
+        return provider, chain
+
+    # Com `n`, o limite vale por completion; na chamada única, a saída traz todas as candidatas
+    output_copies = 1 if strategy == STRATEGY_N_PARAM else num_variants
+    llm_instance = provider.get_llm_instance(output_copies * settings.MAX_OUTPUT_TOKENS_REFORMULATION, _PREFIX_CACHE_KEY)
+    if strategy == STRATEGY_N_PARAM:
+        async def generate_n(prompt_value: Any, config: RunnableConfig) -> list[str]:
+            # ainvoke devolveria só a primeira completion; agenerate_prompt expõe todas
+            result = await llm_instance.agenerate_prompt([prompt_value], callbacks=config.get("callbacks"), n=n)
+            return [generation.text for generation in result.generations[0]]
+
+        chain = UNIFIED_REFORMULATION_PROMPT | RunnableLambda(generate_n)
+    else:
+        chain = MULTI_REFORMULATION_PROMPT | llm_instance | StrOutputParser() | RunnableLambda(split_candidates)
+    _reformulation_chains[key] = chain
+    return provider, chain
+
+
+def resolve_generation_strategy(generation_model_type: str) -> str:
+    """Estratégia efetiva de geração para o provedor, conforme REFORMULATION_STRATEGY."""
+    if settings.REFORMULATION_STRATEGY != "auto":
+        return settings.REFORMULATION_STRATEGY
+    n_param_providers = {name.strip() for name in settings.REFORMULATION_N_PARAM_PROVIDERS.split(",") if name.strip()}
+    return STRATEGY_N_PARAM if generation_model_type in n_param_providers else STRATEGY_SINGLE_CALL
+
+
+def generation_prompt_budget(generation_model_type: str, num_variants: int) -> tuple[str, str, int]:
+    """
+    Orçamento de tokens do prompt do usuário na geração: (model_type, nome do modelo, limite).
+    Considera o template e a saída reservada da estratégia em uso. Levanta ValueError se o provedor não existir.
+    """
+    model_name = model_router.largest(generation_model_type, ROLE_GENERATION).model_name # Maior prompt que o roteamento aceita
+    if resolve_generation_strategy(generation_model_type) == STRATEGY_SINGLE_CALL:
+        template, max_output_tokens = MULTI_REFORMULATION_PROMPT, num_variants * settings.MAX_OUTPUT_TOKENS_REFORMULATION
+    else:
+        template, max_output_tokens = UNIFIED_REFORMULATION_PROMPT, settings.MAX_OUTPUT_TOKENS_REFORMULATION
+    limit = stage_prompt_budget(generation_model_type, model_name, template, max_output_tokens=max_output_tokens)
+    return generation_model_type, model_name, limit
+
+
+def warm_up_generation(generation_model_type: str) -> LLMProvider:
+    """
+    Constrói o provedor de geração e sua chain antes da primeira requisição e pré-calcula
+    o custo em tokens dos templates. Levanta ValueError.
+    """
+    provider, _ = _build_reformulation_chain(generation_model_type)
+    generation_prompt_budget(generation_model_type, 2)
+    return provider
+
+async def _hedged_reformulation(
+    inputs: dict,
+    primary: tuple[LLMProvider, Runnable],
+    hedge_model_type: str,
+    stage: str = None,
+    build_chain: ChainBuilder = _build_reformulation_chain,
+    estimated_output_tokens: int = None
+) -> Any:
+    """
+    Executa uma chamada de geração no provedor primário e, se ela não responder dentro do p95
+    observado (ou falhar), dispara a mesma chamada em hedge_model_type (chain montada por build_chain).
+    A primeira resposta bem-sucedida vence e a outra chamada é cancelada. Se o primário for cancelado
+    (ex: prazo ou desconexão do cliente), o cancelamento é propagado sem disparar a cópia.
+    """
+    provider, chain = primary
+    hedge_delay = provider.hedge_delay()
+    primary_task = asyncio.ensure_future(provider.ainvoke(chain, inputs, stage, estimated_output_tokens))
+    tasks = {primary_task}
     try:
-        # Instancia o provedor LLM.
-        # LLMProvider usa a chave de API padrão do .env para o generation_model_type
-        # e seleciona um modelo/temperatura apropriados para geração.
-        provider = LLMProvider(model_type=generation_model_type)
-        llm_instance = provider.get_llm_instance() # Obtém a instância LLM configurada
-
-        # Cria o template e a chain para a reformulação unificada
-        unified_prompt_template = PromptTemplate(
-            template=UNIFIED_REFORMULATION_TEMPLATE,
-            input_variables=["prompt_original_text"] 
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+        if primary_task in done:
+            if primary_task.cancelled():
+                raise asyncio.CancelledError()
+            if primary_task.exception() is None:
+                return primary_task.result()
+
+        try:
+            hedge_provider, hedge_chain = build_chain(hedge_model_type)
+        except ValueError:
+            return await primary_task # Sem provedor alternativo utilizável: aguarda (ou propaga) o primário
+        logger.info(
+            "_hedged_reformulation: %s passou de %.2fs, disparando cópia em %s.", provider.model_type, hedge_delay, hedge_model_type,
+            extra={"stage": stage or provider.role}
         )
-        
-        unified_reformulation_chain: RunnableSequence = unified_prompt_template | llm_instance | StrOutputParser()
-        
-        print(f"{error_msg_prefix} Gerando a primeira reformulação...")
-        reformulation_1 = unified_reformulation_chain.invoke({
-            "prompt_original_text": original_prompt
-        })
-        print(f"{error_msg_prefix} Primeira reformulação gerada.")
-
-        if not reformulation_1 or not reformulation_1.strip():
-            raise ReformulationError("A primeira reformulação resultou em uma string vazia ou None.")
-
-        print(f"{error_msg_prefix} Gerando a segunda reformulação...")
-  
-        reformulation_2 = unified_reformulation_chain.invoke({
-            "prompt_original_text": original_prompt
-        })
-        print(f"{error_msg_prefix} Segunda reformulação gerada.")
-
-        if not reformulation_2 or not reformulation_2.strip():
-            raise ReformulationError("A segunda reformulação resultou em uma string vazia ou None.")
-
-        print(f"{error_msg_prefix} Ambas as reformulações geradas com sucesso.")
-        return reformulation_1, reformulation_2
-        
+        tasks.add(asyncio.ensure_future(hedge_provider.ainvoke(hedge_chain, inputs, stage, estimated_output_tokens)))
+
+        last_error: BaseException = None
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.cancelled():
+                    last_error = asyncio.CancelledError()
+                elif task.exception() is None:
+                    return task.result()
+                else:
+                    last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _invoke_generation(
+    build_chain: ChainBuilder,
+    generation_model_type: str,
+    hedge_model_type: Optional[str],
+    inputs: dict,
+    stage: str,
+    estimated_output_tokens: int = None
+) -> Any:
+    """Executa a chain de build_chain no provedor de geração, com cópia 'hedged' se hedge_model_type for informado."""
+    primary = build_chain(generation_model_type)
+    if hedge_model_type and hedge_model_type != generation_model_type:
+        return await _hedged_reformulation(inputs, primary, hedge_model_type, stage, build_chain, estimated_output_tokens)
+    provider, chain = primary
+    return await provider.ainvoke(chain, inputs, stage, estimated_output_tokens)
+
+
+async def _generate_in_parallel(
+    original_prompt: str, generation_model_type: str, hedge_model_type: Optional[str], first_version: int, count: int
+) -> list[str]:
+    """Gera `count` reformulações com uma chamada independente por variante, disparadas em paralelo."""
+    inputs = {"prompt_original_text": original_prompt}
+    return list(await asyncio.gather(*(
+        _invoke_generation(_build_reformulation_chain, generation_model_type, hedge_model_type, inputs, f"reformulation_{version}")
+        for version in range(first_version, first_version + count)
+    )))
+
+
+@contextmanager
+def _reformulation_errors(generation_model_type: str, error_msg_prefix: str) -> Iterator[None]:
+    """Converte falhas de configuração e erros inesperados da geração em ReformulationError (com log)."""
+    try:
+        yield
     except ValueError as ve:
         error_msg = f"Erro de configuração do provedor LLM para geração ({generation_model_type}): {ve}"
-        print(f"{error_msg_prefix} {error_msg}")
+        logger.error("%s %s", error_msg_prefix, error_msg, extra={"stage": "reformulation"})
         raise ReformulationError(error_msg)
-    except ReformulationError: # Relança a exceção já tratada (ex: string vazia)
+    except (ReformulationError, ProviderOverloadedError, DeadlineExceededError): # Relança exceções já tratadas (ex: string vazia, provedor saturado, prazo esgotado)
         raise
     except Exception as e:
         error_msg = f"Erro inesperado ({type(e).__name__}) durante a geração das reformulações: {e}"
-        print(f"{error_msg_prefix} {error_msg}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("%s %s", error_msg_prefix, error_msg, extra={"stage": "reformulation"})
+        raise ReformulationError(error_msg)
+
+
+async def generate_reformulations(
+    original_prompt: str,
+    generation_model_type: str = "gemini",
+    hedge_model_type: str = None,
+    num_variants: int = 2
+) -> list[str]:
+    """
+    Gera `num_variants` reformulações para o prompt original usando a MESMA orientação
+    baseada em critérios de qualidade, no menor número de chamadas que o provedor permite
+    (ver resolve_generation_strategy). Se a chamada única devolver menos candidatas distintas
+    que o pedido, as que faltam são completadas com chamadas individuais em paralelo.
+    Com hedge_model_type, cada chamada lenta recebe uma cópia nesse segundo provedor.
+    Levanta ReformulationError em caso de falha.
+    """
+    strategy = resolve_generation_strategy(generation_model_type)
+    logger.info(
+        "Iniciando geração de %d reformulações para o prompt com modelo: %s (estratégia: %s).", num_variants, generation_model_type, strategy,
+        extra={"stage": "reformulation"}
+    )
+    error_msg_prefix = f"generate_reformulations (modelo: {generation_model_type}):"
+
+    with _reformulation_errors(generation_model_type, error_msg_prefix):
+        if strategy == STRATEGY_PARALLEL:
+            reformulations = await _generate_in_parallel(original_prompt, generation_model_type, hedge_model_type, 1, num_variants)
+        else:
+            candidates = await _invoke_generation(
+                lambda model_type: _build_candidates_chain(model_type, strategy, num_variants),
+                generation_model_type, hedge_model_type,
+                {"prompt_original_text": original_prompt, "num_variants": num_variants},
+                "reformulation_candidates", num_variants * settings.LLM_ESTIMATED_OUTPUT_TOKENS
+            )
+            # Descarta vazias e repetidas; o excedente é ignorado
+            reformulations = list(dict.fromkeys(candidate.strip() for candidate in candidates if candidate and candidate.strip()))[:num_variants]
+            missing = num_variants - len(reformulations)
+            if missing:
+                logger.warning(
+                    "%s chamada única devolveu %d de %d candidatas; gerando %d individualmente.",
+                    error_msg_prefix, len(reformulations), num_variants, missing, extra={"stage": "reformulation"}
+                )
+                reformulations += await _generate_in_parallel(
+                    original_prompt, generation_model_type, hedge_model_type, len(reformulations) + 1, missing
+                )
+
+        for version, reformulation in enumerate(reformulations, start=1):
+            if not reformulation or not reformulation.strip():
+                raise ReformulationError(f"A reformulação {version} resultou em uma string vazia ou None.")
+
+        logger.info("%s %d reformulações geradas com sucesso.", error_msg_prefix, len(reformulations), extra={"stage": "reformulation"})
+        return reformulations
+
+
+async def generate_reformulation(
+    original_prompt: str,
+    generation_model_type: str = "gemini",
+    hedge_model_type: str = None,
+    version: int = 1
+) -> str:
+    """
+    Gera UMA reformulação (a de número `version`) com uma chamada própria, como na estratégia "parallel".
+    Permite a quem a chama usar cada variante assim que ela fica pronta. Levanta ReformulationError.
+    """
+    error_msg_prefix = f"generate_reformulation (modelo: {generation_model_type}, versão {version}):"
+    with _reformulation_errors(generation_model_type, error_msg_prefix):
+        reformulation = await _invoke_generation(
+            _build_reformulation_chain, generation_model_type, hedge_model_type,
+            {"prompt_original_text": original_prompt}, f"reformulation_{version}"
+        )
+        if not reformulation or not reformulation.strip():
+            raise ReformulationError(f"A reformulação {version} resultou em uma string vazia ou None.")
+        return reformulation
+
+async def stream_reformulation(
+    original_prompt: str, generation_model_type: str = "gemini", stage: str = "reformulation"
+) -> AsyncIterator[str]:
+    """
+    Gera UMA reformulação emitindo os trechos de texto à medida que a LLM os produz.
+    `stage` identifica a chamada nas métricas (ex: 'reformulation_1').
+    Levanta ReformulationError em caso de falha ou de saída vazia.
+    """
+    error_msg_prefix = f"stream_reformulation (modelo: {generation_model_type}):"
+    try:
+        provider, unified_reformulation_chain = _build_reformulation_chain(generation_model_type)
+    except ValueError as ve:
+        error_msg = f"Erro de configuração do provedor LLM para geração ({generation_model_type}): {ve}"
+        logger.error("%s %s", error_msg_prefix, error_msg, extra={"stage": stage})
+        raise ReformulationError(error_msg)
+
+    received_content = False
+    try:
+        async for chunk in provider.astream(unified_reformulation_chain, {"prompt_original_text": original_prompt}, stage):
+            if chunk:
+                received_content = received_content or bool(chunk.strip())
+                yield chunk
+    except (ProviderOverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        error_msg = f"Erro inesperado ({type(e).__name__}) durante o streaming da reformulação: {e}"
+        logger.exception("%s %s", error_msg_prefix, error_msg, extra={"stage": stage})
         raise ReformulationError(error_msg)
 
+    if not received_content:
+        raise ReformulationError("A reformulação resultou em uma string vazia ou None.")
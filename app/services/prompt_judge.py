@@ -1,13 +1,38 @@
+import asyncio
 import json
-from app.providers.llm_provider import LLMProvider
+import logging
+from typing import Any, AsyncIterator, Optional, Type
+
+from pydantic import BaseModel
+
+from app.providers.admission import ProviderOverloadedError
+from app.providers.llm_provider import ROLE_JUDGE, LLMProvider, get_llm_provider, resolve_model_config
+from app.providers.model_router import model_router
+from app.providers.token_budget import stage_prompt_budget
+from app.core.cache import TieredCache, make_cache_key, normalize_text
 from app.core.config import settings
-from langchain.prompts import PromptTemplate
+from app.core.deadline import DeadlineExceededError
+from app.core.logging_config import sample_payload, truncate
+from app.core.metrics import JUDGE_JSON_PARSE, stage_timer
+from app.core.prompt_templates import EVALUATION_CRITERIA, RUBRIC_VERSION, TEMPLATE_STYLE, prefix_cache_key
+from app.core.singleflight import SingleFlight
+from app.schemas.prompt import ComparisonJudgeOutput, SingleJudgeOutput, WinnerJudgeOutput
+from app.services.heuristic_scorer import evaluate_prompts_fast
+from app.services.judge_parsing import broken_json_fragment, parse_judge_output
+from langchain_core.prompts import BasePromptTemplate, ChatPromptTemplate, PromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_core.output_parsers import StrOutputParser
 
-EVALUATION_TEMPLATE = """
+logger = logging.getLogger(__name__)
+
+class EvaluationError(Exception):
+    """Exceção customizada para falhas na avaliação feita pelo LLM avaliador."""
+    pass
+
+
+EVALUATION_SYSTEM_TEMPLATE = """
 Você é um avaliador especialista em engenharia de prompts. Sua tarefa é avaliar três versões de um prompt
-(o original, a reformulação 1 e a reformulação 2) com base em 10 critérios rigorosos.
+(o original, a reformulação 1 e a reformulação 2), enviadas na mensagem do usuário, com base em 10 critérios rigorosos.
 Forneça uma pontuação de 0 a 10 para cada critério em cada um dos três prompts.
 Adicionalmente, determine qual das DUAS REFORMULAÇÕES (Reformulação 1 ou Reformulação 2) é a melhor entre si e forneça uma justificativa concisa para essa escolha.
 
@@ -23,21 +48,6 @@ Critérios de Avaliação (aplique a cada prompt individualmente):
 9.  **Preparação e Enquadramento (Priming/Framing)**: O prompt prepara adequadamente a LLM para a resposta desejada?
 10. **Princípios Éticos**: O prompt adere a princípios éticos, evitando vieses e conteúdo prejudicial?
 
-Prompt Original:
-\"\"\"
-{prompt_original}
-\"\"\"
-
-Reformulação 1:
-\"\"\"
-{reformulation_1}
-\"\"\"
-
-Reformulação 2:
-\"\"\"
-{reformulation_2}
-\"\"\"
-
 RESPONDA EXCLUSIVAMENTE NO SEGUINTE FORMATO JSON. NÃO ADICIONE NENHUM TEXTO ANTES OU DEPOIS DO JSON.
 O JSON DEVE SER COMPLETO E VÁLIDO.
 
@@ -60,17 +70,561 @@ Exemplo de formato de saída JSON esperado, não inclua o exemplo abaixo na sua
 }}
 """
 
-def evaluate_reformulations(
-    prompt_original: str, 
+EVALUATION_TEMPLATE = """
+Prompt Original:
+\"\"\"
+{prompt_original}
+\"\"\"
+
+Reformulação 1:
+\"\"\"
+{reformulation_1}
+\"\"\"
+
+Reformulação 2:
+\"\"\"
+{reformulation_2}
+\"\"\"
+"""
+
+
+# Template específico para avaliação de 1 prompt
+SINGLE_EVAL_SYSTEM_TEMPLATE = """
+Você é um avaliador especialista em engenharia de prompts. Avalie o texto enviado na mensagem do usuário
+com base nos 10 critérios listados.
+
+Critérios de Avaliação:
+1. Clareza e Especificidade
+2. Estrutura e Organização
+3. Consistência Interna
+4. Contextualização
+5. Parâmetros de Execução
+6. Eficiência Linguística
+7. Robustez
+8. Adaptabilidade
+9. Preparação e Enquadramento
+10. Princípios Éticos
+
+Responda EXCLUSIVAMENTE em JSON no seguinte formato:
+{{
+  "evaluationData": [
+    {{ "subject": "Clareza e Especificidade", "score": 8, "fullMark": 10 }},
+    ...
+  ],
+  "justification": "O prompt apresentou excelente clareza, organização e especificidade, porém faltou contextualização e definição de parâmetros."
+}}
+"""
+
+SINGLE_EVAL_TEMPLATE = """
+Texto:
+\"\"\"
+{prompt}
+\"\"\"
+"""
+
+# Reparo barato: reenvia apenas o JSON quebrado, sem repetir os prompts avaliados
+JSON_REPAIR_TEMPLATE = """
+O texto abaixo deveria ser um JSON válido no formato descrito, mas está malformado ou incompleto.
+Corrija-o e responda APENAS com o JSON corrigido, sem nenhum texto antes ou depois.
+Preserve as notas e textos existentes; complete campos ausentes somente se for inevitável.
+
+Formato esperado (JSON Schema):
+{schema}
+
+JSON com problema:
+{broken_json}
+"""
+
+# Comparação entre duas reformulações já pontuadas (um confronto do mata-mata): não repete a rubrica nem o prompt original
+COMPARISON_SYSTEM_TEMPLATE = """
+Você é um avaliador especialista em engenharia de prompts. As duas reformulações enviadas na mensagem do usuário
+já foram pontuadas de 0 a 10 em 10 critérios de qualidade. Com base nos textos e nas notas, determine qual das
+DUAS REFORMULAÇÕES é a melhor e forneça uma justificativa concisa.
+
+RESPONDA EXCLUSIVAMENTE NO SEGUINTE FORMATO JSON. NÃO ADICIONE NENHUM TEXTO ANTES OU DEPOIS DO JSON.
+Em "winningVersion", use o número da reformulação vencedora, como indicado no título de cada uma.
+{{ "winningVersion": 1, "justification": "A Reformulação x é superior à Reformulação y porque <justificativas encontradas e relevantes>." }}
+"""
+
+COMPARISON_TEMPLATE = """
+Reformulação {label_1}:
+\"\"\"
+{reformulation_1}
+\"\"\"
+Notas da Reformulação {label_1}: {scores_1}
+
+Reformulação {label_2}:
+\"\"\"
+{reformulation_2}
+\"\"\"
+Notas da Reformulação {label_2}: {scores_2}
+"""
+
+# Versões compactas (PROMPT_TEMPLATE_STYLE=compact): mesma rubrica e mesmo JSON de saída, sem o exemplo completo
+_CRITERIA_LIST = "; ".join(EVALUATION_CRITERIA)
+
+COMPACT_EVALUATION_SYSTEM_TEMPLATE = """
+Avalie de 0 a 10 o prompt original e as reformulações 1 e 2, enviados na mensagem do usuário, em cada critério: """ + _CRITERIA_LIST + """.
+Depois escolha a melhor entre as DUAS reformulações e justifique em uma frase.
+Responda APENAS com JSON válido, com um item por critério, na ordem acima:
+{{"evaluationData": [{{"subject": "<critério>", "original": 0, "version1": 0, "version2": 0, "fullMark": 10}}], "winningVersion": 1, "justification": "<texto>"}}
+"""
+
+COMPACT_EVALUATION_TEMPLATE = """
+Original:
+\"\"\"
+{prompt_original}
+\"\"\"
+
+Reformulação 1:
+\"\"\"
+{reformulation_1}
+\"\"\"
+
+Reformulação 2:
+\"\"\"
+{reformulation_2}
+\"\"\"
+"""
+
+COMPACT_SINGLE_EVAL_SYSTEM_TEMPLATE = """
+Avalie de 0 a 10 o texto enviado na mensagem do usuário em cada critério: """ + _CRITERIA_LIST + """.
+Responda APENAS com JSON válido, com um item por critério, na ordem acima:
+{{"evaluationData": [{{"subject": "<critério>", "score": 0, "fullMark": 10}}], "justification": "<texto>"}}
+"""
+
+_COMPACT = TEMPLATE_STYLE == "compact"
+
+criterion_score_cache = TieredCache(
+    namespace="criterion_scores",
+    max_entries=settings.SCORE_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SCORE_CACHE_TTL_SECONDS,
+    sqlite_path=settings.RESULT_CACHE_SQLITE_PATH,
+    disk_max_entries=settings.RESULT_CACHE_SQLITE_MAX_ENTRIES,
+    purge_interval_seconds=settings.RESULT_CACHE_PURGE_INTERVAL_SECONDS,
+)
+_inflight_scores = SingleFlight()
+
+
+# Templates compilados uma única vez e reaproveitados por todas as chains
+# Rubrica e formato no bloco de sistema (prefixo idêntico em todas as chamadas); textos avaliados na mensagem do usuário
+EVALUATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", COMPACT_EVALUATION_SYSTEM_TEMPLATE if _COMPACT else EVALUATION_SYSTEM_TEMPLATE),
+    ("human", COMPACT_EVALUATION_TEMPLATE if _COMPACT else EVALUATION_TEMPLATE),
+])
+SINGLE_EVAL_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", COMPACT_SINGLE_EVAL_SYSTEM_TEMPLATE if _COMPACT else SINGLE_EVAL_SYSTEM_TEMPLATE),
+    ("human", SINGLE_EVAL_TEMPLATE),
+])
+JSON_REPAIR_PROMPT = PromptTemplate(template=JSON_REPAIR_TEMPLATE, input_variables=["schema", "broken_json"])
+COMPARISON_PROMPT = ChatPromptTemplate.from_messages([("system", COMPARISON_SYSTEM_TEMPLATE), ("human", COMPARISON_TEMPLATE)])
+
+# Combinações (template, schema de saída) usadas pelo judge; pré-montadas no warm-up
+_JUDGE_CHAIN_SPECS = [
+    (EVALUATION_PROMPT, ComparisonJudgeOutput),
+    (EVALUATION_PROMPT, None),
+    (SINGLE_EVAL_PROMPT, SingleJudgeOutput),
+    (JSON_REPAIR_PROMPT, None),
+    (COMPARISON_PROMPT, WinnerJudgeOutput),
+]
+
+# Por template: (limite de tokens de saída, chave do cache de prefixo no provedor).
+# A resposta do judge é um JSON de tamanho conhecido; o reparo não tem prefixo fixo relevante.
+_CHAIN_OPTIONS = {
+    id(EVALUATION_PROMPT): (settings.MAX_OUTPUT_TOKENS_JUDGE, prefix_cache_key("evaluation")),
+    id(SINGLE_EVAL_PROMPT): (settings.MAX_OUTPUT_TOKENS_SCORE, prefix_cache_key("single_eval")),
+    id(JSON_REPAIR_PROMPT): (settings.MAX_OUTPUT_TOKENS_JUDGE, None),
+    id(COMPARISON_PROMPT): (settings.MAX_OUTPUT_TOKENS_WINNER, prefix_cache_key("comparison")),
+}
+
+# Chains já montadas por (provedor, template, schema)
+_judge_chains: dict[tuple, RunnableSequence] = {}
+
+
+def _get_judge_provider(judge_model_type: str, judge_model_name: str = None) -> LLMProvider:
+    """Levanta ValueError se o LLM avaliador não puder ser inicializado."""
+    # judge_model_name faz parte da chave do registro, então a instância compartilhada
+    # nunca é alterada por uma requisição.
+    return get_llm_provider(judge_model_type, role=ROLE_JUDGE, model_name=judge_model_name)
+
+
+def _build_judge_chain(
+    judge_llm_provider: LLMProvider,
+    prompt_template: BasePromptTemplate,
+    output_schema: Type[BaseModel] = None
+) -> RunnableSequence:
+    """
+    Monta (uma vez por provedor) a chain do judge. Com output_schema, usa a saída estruturada
+    nativa do provedor (tool calling / JSON schema) quando disponível; caso contrário, texto livre.
+    """
+    key = (judge_llm_provider, id(prompt_template), output_schema)
+    chain = _judge_chains.get(key)
+    if chain is not None:
+        return chain
+
+    judge_llm = judge_llm_provider.get_llm_instance(*_CHAIN_OPTIONS.get(id(prompt_template), (None, None)))
+    chain = None
+    if output_schema is not None and settings.JUDGE_STRUCTURED_OUTPUT:
+        try:
+            chain = prompt_template | judge_llm.with_structured_output(output_schema, include_raw=True)
+        except NotImplementedError:
+            pass # Provedor sem suporte: segue com texto livre + parser tolerante
+    if chain is None:
+        chain = prompt_template | judge_llm | StrOutputParser()
+    _judge_chains[key] = chain
+    return chain
+
+
+def judge_prompt_budget(judge_model_type: str, num_variants: int, judge_model_name: str = None) -> tuple[str, str, int]:
+    """
+    Orçamento de tokens do prompt do usuário na avaliação: (model_type, nome do modelo, limite).
+    A avaliação conjunta leva o original e as duas reformulações (cada uma até MAX_OUTPUT_TOKENS_REFORMULATION);
+    a pontuação por texto leva um texto por chamada. Levanta ValueError se o provedor não existir.
+    """
+    if judge_model_name:
+        model_name, _ = resolve_model_config(judge_model_type, ROLE_JUDGE, judge_model_name)
+    else: # Maior prompt que o roteamento aceita
+        model_name = model_router.largest(judge_model_type, ROLE_JUDGE).model_name
+    if uses_per_text_scoring(num_variants):
+        limit = stage_prompt_budget(judge_model_type, model_name, SINGLE_EVAL_PROMPT, max_output_tokens=settings.MAX_OUTPUT_TOKENS_SCORE)
+    else:
+        limit = stage_prompt_budget(
+            judge_model_type, model_name, EVALUATION_PROMPT,
+            other_input_tokens=2 * settings.MAX_OUTPUT_TOKENS_REFORMULATION, max_output_tokens=settings.MAX_OUTPUT_TOKENS_JUDGE
+        )
+    return judge_model_type, model_name, limit
+
+
+def warm_up_judge(judge_model_type: str) -> LLMProvider:
+    """
+    Constrói o provedor avaliador e todas as suas chains antes da primeira requisição
+    e pré-calcula o custo em tokens dos templates. Levanta ValueError.
+    """
+    judge_llm_provider = _get_judge_provider(judge_model_type)
+    for prompt_template, output_schema in _JUDGE_CHAIN_SPECS:
+        _build_judge_chain(judge_llm_provider, prompt_template, output_schema)
+    judge_prompt_budget(judge_model_type, 1)
+    judge_prompt_budget(judge_model_type, 2)
+    return judge_llm_provider
+
+
+def _unpack_judge_output(output: Any) -> tuple[Optional[dict], str]:
+    """
+    Normaliza a saída da chain do judge em (dados já validados ou None, texto bruto).
+    A saída estruturada traz {'raw', 'parsed', 'parsing_error'}; a de texto livre é uma string.
+    """
+    if not isinstance(output, dict) or "raw" not in output:
+        return None, output
+
+    raw_message = output["raw"]
+    raw_text = raw_message.content if isinstance(raw_message.content, str) else json.dumps(raw_message.content, ensure_ascii=False)
+    if not raw_text and getattr(raw_message, "tool_calls", None):
+        raw_text = json.dumps(raw_message.tool_calls[0]["args"], ensure_ascii=False)
+    parsed = output.get("parsed")
+    if isinstance(parsed, BaseModel):
+        JUDGE_JSON_PARSE.inc(schema=type(parsed).__name__, outcome="structured")
+    return (parsed.model_dump() if isinstance(parsed, BaseModel) else None), raw_text
+
+
+async def _parse_or_repair(
+    judge_llm_provider: LLMProvider,
+    raw_output: str,
+    output_schema: Type[BaseModel],
+    error_msg_prefix: str
+) -> tuple[Optional[dict], Optional[str]]:
+    """
+    Extrai e valida o JSON da saída do judge. Se falhar, envia um prompt curto de reparo
+    contendo apenas o JSON quebrado. Retorna (dados, None) ou (None, erro).
+    """
+    schema_name = output_schema.__name__
+    with stage_timer("json_parse", judge_llm_provider.model_type, judge_llm_provider.model_name, judge_llm_provider.role):
+        evaluation_result, parse_error = parse_judge_output(raw_output, output_schema)
+    if evaluation_result is not None:
+        JUDGE_JSON_PARSE.inc(schema=schema_name, outcome="ok")
+        logger.debug("%s JSON decodificado com sucesso.", error_msg_prefix, extra={"stage": "json_parse"})
+        return evaluation_result, None
+    if not settings.JUDGE_REPAIR_ENABLED:
+        JUDGE_JSON_PARSE.inc(schema=schema_name, outcome="failed")
+        return None, parse_error
+
+    logger.warning("%s %s Tentando reparo do JSON...", error_msg_prefix, parse_error, extra={"stage": "json_parse"})
+    repair_chain = _build_judge_chain(judge_llm_provider, JSON_REPAIR_PROMPT)
+    try:
+        repaired_output = await judge_llm_provider.ainvoke(repair_chain, {
+            "schema": json.dumps(output_schema.model_json_schema(), ensure_ascii=False),
+            "broken_json": broken_json_fragment(raw_output)
+        }, "judge_repair")
+    except (ProviderOverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        JUDGE_JSON_PARSE.inc(schema=schema_name, outcome="failed")
+        return None, f"{parse_error} Reparo falhou ({type(e).__name__}): {e}"
+
+    evaluation_result, repair_error = parse_judge_output(repaired_output, output_schema)
+    if evaluation_result is None:
+        JUDGE_JSON_PARSE.inc(schema=schema_name, outcome="failed")
+        return None, f"{parse_error} Reparo também falhou: {repair_error}"
+    JUDGE_JSON_PARSE.inc(schema=schema_name, outcome="repaired")
+    logger.info("%s JSON reparado com sucesso.", error_msg_prefix, extra={"stage": "judge_repair"})
+    return evaluation_result, None
+
+
+def _comparison_report(evaluation_result: dict, prompt_original: str, reformulations: list[str]) -> dict:
+    """
+    Monta o relatório de avaliação de N variantes. Cada linha de evaluationData traz as notas de todas
+    as variantes em 'versions' e, por compatibilidade, as duas primeiras em 'version1'/'version2'.
+    """
+    evaluation_rows = []
+    for row in evaluation_result.get("evaluationData", []):
+        versions = row.get("versions") or [row.get("version1"), row.get("version2")]
+        evaluation_rows.append({**row, "version1": versions[0], "version2": versions[1], "versions": versions})
+    variants = [
+        {"title": f"Reformulação {version}", "content": reformulation}
+        for version, reformulation in enumerate(reformulations, start=1)
+    ]
+    return {
+        "original_prompt_content": prompt_original, 
+        "version1": variants[0],
+        "version2": variants[1],
+        "variants": variants,
+        "evaluationData": evaluation_rows,
+        "winningVersion": evaluation_result.get("winningVersion"), 
+        "justification": evaluation_result.get("justification", "Sem justificativa fornecida pela LLM.")
+    }
+
+
+async def build_evaluation_report(
+    raw_json_output_str: str,
+    prompt_original: str,
+    reformulations: list[str],
+    judge_model_type: str = "gemini",
+    judge_model_name: str = None,
+    error_msg_prefix: str = "build_evaluation_report:"
+) -> dict:
+    """
+    Converte a saída bruta (texto) do judge no relatório de avaliação, com reparo se necessário.
+    Em caso de JSON inválido retorna um dicionário com 'error' e 'raw_output'.
+    """
+    try:
+        judge_llm_provider = _get_judge_provider(judge_model_type, judge_model_name)
+    except ValueError as ve:
+        return {
+            "error": f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}",
+            "raw_output": raw_json_output_str
+        }
+
+    evaluation_result, parse_error = await _parse_or_repair(
+        judge_llm_provider, raw_json_output_str, ComparisonJudgeOutput, error_msg_prefix
+    )
+    if evaluation_result is None:
+        error_message = f"{error_msg_prefix} Falha ao decodificar JSON da LLM. Erro: {parse_error}"
+        logger.warning(error_message, extra={"stage": "json_parse", "raw_output": sample_payload(raw_json_output_str)})
+        return {
+            "error": error_message,
+            "raw_output": raw_json_output_str 
+        }
+    return _comparison_report(evaluation_result, prompt_original, reformulations)
+
+
+def _scores_by_criterion(scores: dict) -> dict[str, float]:
+    """Indexa as notas de score_text pelo nome do critério (ou pela posição, se o nome divergir)."""
+    by_criterion = {criterion: 0.0 for criterion in EVALUATION_CRITERIA}
+    for position, item in enumerate(scores.get("evaluationData", [])):
+        subject = item.get("subject")
+        if subject not in by_criterion and position < len(EVALUATION_CRITERIA):
+            subject = EVALUATION_CRITERIA[position]
+        if subject in by_criterion:
+            by_criterion[subject] = float(item.get("score", 0))
+    return by_criterion
+
+
+def _format_scores(scores: dict[str, float]) -> str:
+    return "; ".join(f"{criterion}={score:g}" for criterion, score in scores.items())
+
+
+async def decide_winner(
+    judge_llm_provider: LLMProvider,
     reformulation_1: str,
     reformulation_2: str,
+    scores_1: dict[str, float],
+    scores_2: dict[str, float],
+    error_msg_prefix: str,
+    labels: tuple[int, int] = (1, 2)
+) -> dict:
+    """
+    Chamada curta ao judge que escolhe a melhor de duas reformulações já pontuadas,
+    identificadas pelos números em `labels`.
+    Retorna {'winningVersion' (um dos labels), 'justification'} ou {'error', 'raw_output'}.
+    """
+    raw_output = ""
+    try:
+        comparison_chain = _build_judge_chain(judge_llm_provider, COMPARISON_PROMPT, WinnerJudgeOutput)
+        judge_output = await judge_llm_provider.ainvoke(comparison_chain, {
+            "reformulation_1": reformulation_1,
+            "reformulation_2": reformulation_2,
+            "scores_1": _format_scores(scores_1),
+            "scores_2": _format_scores(scores_2),
+            "label_1": labels[0],
+            "label_2": labels[1]
+        }, "judge_winner")
+        decision, raw_output = _unpack_judge_output(judge_output)
+        if decision is None:
+            decision, parse_error = await _parse_or_repair(judge_llm_provider, raw_output, WinnerJudgeOutput, error_msg_prefix)
+            if decision is None:
+                return {"error": f"{error_msg_prefix} Falha ao decodificar a decisão do judge: {parse_error}", "raw_output": raw_output}
+    except (ProviderOverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        return {
+            "error": f"{error_msg_prefix} Erro inesperado ({type(e).__name__}) na decisão do judge: {e}",
+            "raw_output": raw_output
+        }
+
+    winner = decision["winningVersion"]
+    if winner not in labels:
+        # Resposta posicional (1 = primeira, 2 = segunda) quando os números não coincidem com os labels
+        if winner not in (1, 2):
+            return {
+                "error": f"{error_msg_prefix} O judge escolheu a reformulação {winner}, fora do confronto {labels[0]} x {labels[1]}.",
+                "raw_output": raw_output
+            }
+        decision["winningVersion"] = labels[winner - 1]
+    return decision
+
+
+async def _knockout(
+    judge_llm_provider: LLMProvider,
+    reformulations: list[str],
+    variant_scores: list[dict[str, float]],
+    seeds: list[int],
+    error_msg_prefix: str
+) -> dict:
+    """
+    Mata-mata entre as variantes `seeds` (números a partir de 1, da maior para a menor nota média):
+    a cada rodada a melhor semente enfrenta a pior, e assim por diante, com os confrontos da rodada
+    em paralelo; com número ímpar, a semente do meio avança direto. Para k variantes são k-1 comparações curtas.
+    Retorna a decisão da final ({'winningVersion', 'justification'}) ou {'error', 'raw_output'}.
+    """
+    contenders = list(seeds)
+    decision: dict = {}
+    while len(contenders) > 1:
+        half = len(contenders) // 2
+        pairs = [(contenders[position], contenders[-1 - position]) for position in range(half)]
+        decisions = await asyncio.gather(*(
+            decide_winner(
+                judge_llm_provider, reformulations[first - 1], reformulations[second - 1],
+                variant_scores[first - 1], variant_scores[second - 1], error_msg_prefix, (first, second)
+            )
+            for first, second in pairs
+        ))
+        for match in decisions:
+            if "error" in match:
+                return match
+        winners = {match["winningVersion"] for match in decisions}
+        if len(contenders) % 2:
+            winners.add(contenders[half])
+        contenders = [version for version in contenders if version in winners]
+        decision = decisions[0]
+    return decision
+
+
+async def _evaluate_reformulations_per_text(
+    prompt_original: str,
+    reformulations: list[str],
+    judge_llm_provider: LLMProvider,
+    judge_model_type: str,
+    judge_model_name: str,
+    use_cache: bool,
+    error_msg_prefix: str
+) -> dict:
+    """
+    Pontua cada texto separadamente (reaproveitando notas em cache), ordena as variantes pela nota
+    média e decide a vencedora num mata-mata de comparações curtas entre as JUDGE_TOURNAMENT_TOP_K melhores.
+    """
+    all_scores = await asyncio.gather(*(
+        score_text(text, judge_model_type, judge_model_name, use_cache)
+        for text in (prompt_original, *reformulations)
+    ))
+    return await _judge_scored_texts(prompt_original, reformulations, list(all_scores), judge_llm_provider, error_msg_prefix)
+
+
+async def _judge_scored_texts(
+    prompt_original: str,
+    reformulations: list[str],
+    all_scores: list[dict],
+    judge_llm_provider: LLMProvider,
+    error_msg_prefix: str
+) -> dict:
+    """Decide a vencedora a partir das notas de score_text (original primeiro) e monta o relatório de avaliação."""
+    for scores in all_scores:
+        if "error" in scores:
+            return {"error": f"{error_msg_prefix} Falha ao pontuar os textos: {scores['error']}", "raw_output": scores.get("raw_output", "")}
+
+    original_scores, *variant_scores = (_scores_by_criterion(scores) for scores in all_scores)
+    # Empates na nota média favorecem a variante de menor número (sort estável)
+    ranking = sorted(range(1, len(reformulations) + 1), key=lambda version: -sum(variant_scores[version - 1].values()))
+    top_k = max(2, settings.JUDGE_TOURNAMENT_TOP_K)
+    decision = await _knockout(judge_llm_provider, reformulations, variant_scores, ranking[:top_k], error_msg_prefix)
+    if "error" in decision:
+        return decision
+
+    evaluation_result = {
+        "evaluationData": [
+            {
+                "subject": criterion,
+                "original": original_scores[criterion],
+                "versions": [scores[criterion] for scores in variant_scores],
+                "fullMark": 10
+            }
+            for criterion in EVALUATION_CRITERIA
+        ],
+        **decision
+    }
+    return _comparison_report(evaluation_result, prompt_original, reformulations)
+
+
+async def judge_scored_reformulations(
+    prompt_original: str,
+    reformulations: list[str],
+    all_scores: list[dict],
     judge_model_type: str = "gemini",
     judge_model_name: str = None
+) -> dict:
+    """
+    Etapa final da avaliação por texto, para quem já pontuou os textos com score_text (ex: a execução em
+    pipeline, que pontua cada texto assim que ele existe): all_scores traz as notas do original e de cada
+    reformulação, nessa ordem. Decide a vencedora no mata-mata e retorna o relatório de avaliação ou {'error', 'raw_output'}.
+    """
+    error_msg_prefix = f"evaluate_reformulations (judge_model: {judge_model_type}):"
+    try:
+        judge_llm_provider = _get_judge_provider(judge_model_type, judge_model_name)
+    except ValueError as ve:
+        return {
+            "error": f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}",
+            "raw_output": ""
+        }
+    return await _judge_scored_texts(prompt_original, reformulations, all_scores, judge_llm_provider, error_msg_prefix)
+
+
+def uses_per_text_scoring(num_variants: int) -> bool:
+    """A avaliação de num_variants reformulações pontua cada texto separadamente (em vez da chamada conjunta)?"""
+    return settings.JUDGE_PER_TEXT_SCORING or num_variants != 2
+
+
+async def evaluate_reformulations(
+    prompt_original: str, 
+    reformulations: list[str],
+    judge_model_type: str = "gemini",
+    judge_model_name: str = None,
+    use_cache: bool = True
 ):
     """
-    Avalia o prompt original e duas reformulações com base em 10 critérios.
-    Retorna pontuações para os três e indica qual reformulação é a melhor entre si.
+    Avalia o prompt original e as reformulações com base em 10 critérios.
+    Retorna pontuações para todos e indica qual reformulação é a melhor entre si.
     Usa API_KEY_JUDGE das configurações para o LLM avaliador.
+    Com JUDGE_PER_TEXT_SCORING (ou mais de duas reformulações), cada texto é pontuado separadamente,
+    com notas reaproveitadas entre requisições, e a vencedora sai de um mata-mata entre as mais bem pontuadas;
+    caso contrário, uma única chamada com EVALUATION_TEMPLATE avalia o original e as duas reformulações.
     """
     error_msg_prefix = f"evaluate_reformulations (judge_model: {judge_model_type}):"
     if not settings.API_KEY_JUDGE:
@@ -78,189 +632,193 @@ def evaluate_reformulations(
             f"{error_msg_prefix} API_KEY_JUDGE não encontrada nas configurações/variáveis de ambiente."
         )
 
-    try:
-        judge_llm_provider = LLMProvider(model_type=judge_model_type, api_key_override=settings.API_KEY_JUDGE)
-        judge_llm = judge_llm_provider.get_llm_instance()
-
-        if judge_model_name:
-            if hasattr(judge_llm, 'model_name'):
-                judge_llm.model_name = judge_model_name
-            elif hasattr(judge_llm, 'model'):
-                judge_llm.model = judge_model_name
-            print(f"{error_msg_prefix} Nome do modelo do judge explicitamente definido para: {judge_model_name}")
+    if uses_per_text_scoring(len(reformulations)):
+        try:
+            judge_llm_provider = _get_judge_provider(judge_model_type, judge_model_name)
+        except ValueError as ve:
+            return {
+                "error": f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}",
+                "raw_output": ""
+            }
+        return await _evaluate_reformulations_per_text(
+            prompt_original, reformulations, judge_llm_provider,
+            judge_model_type, judge_model_name, use_cache, error_msg_prefix
+        )
 
+    try:
+        judge_llm_provider = _get_judge_provider(judge_model_type, judge_model_name)
+        evaluation_chain = _build_judge_chain(judge_llm_provider, EVALUATION_PROMPT, ComparisonJudgeOutput)
     except ValueError as ve:
         return {
             "error": f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}",
             "raw_output": ""
         }
 
-    prompt_template = PromptTemplate(
-        template=EVALUATION_TEMPLATE,
-        input_variables=["prompt_original", "reformulation_1", "reformulation_2"], 
-        template_format="f-string"
-    )
-    
-    evaluation_chain: RunnableSequence = prompt_template | judge_llm | StrOutputParser()
-
     raw_json_output_str = ""
-    cleaned_json_str = "" 
     try:
-        print(f"{error_msg_prefix} Invocando a chain de avaliação para três prompts...")
-        raw_json_output_str = evaluation_chain.invoke({
+        logger.debug("%s Invocando a chain de avaliação para três prompts...", error_msg_prefix, extra={"stage": "judge"})
+        judge_output = await judge_llm_provider.ainvoke(evaluation_chain, {
             "prompt_original": prompt_original, 
-            "reformulation_1": reformulation_1,
-            "reformulation_2": reformulation_2
+            "reformulation_1": reformulations[0],
+            "reformulation_2": reformulations[1]
         })
-        print(f"{error_msg_prefix} Saída bruta da LLM (string): '{raw_json_output_str[:500]}...'")
-        
-        cleaned_json_str = raw_json_output_str.strip()
-        if cleaned_json_str.startswith("```json"):
-            cleaned_json_str = cleaned_json_str[7:]
-            if cleaned_json_str.endswith("```"):
-                 cleaned_json_str = cleaned_json_str[:-3]
-            cleaned_json_str = cleaned_json_str.strip()
-        
-        if not cleaned_json_str.startswith("{") or not cleaned_json_str.endswith("}"):
-            error_detail = "Saída da LLM (após tentativa de limpeza) não parece ser um JSON válido."
-            print(f"{error_msg_prefix} {error_detail}\nConteúdo: {cleaned_json_str}")
-        
-        evaluation_result = json.loads(cleaned_json_str)
-        print(f"{error_msg_prefix} JSON decodificado com sucesso.")
-
-    except json.JSONDecodeError as e:
-        error_message = (f"{error_msg_prefix} Falha ao decodificar JSON da LLM. Erro: {e}. "
-                         f"Saída recebida (após limpeza):\n{cleaned_json_str}")
-        print(error_message)
-        return {
-            "error": error_message,
-            "raw_output": raw_json_output_str 
-        }
+        evaluation_result, raw_json_output_str = _unpack_judge_output(judge_output)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s Saída bruta da LLM: %s", error_msg_prefix, truncate(raw_json_output_str), extra={"stage": "judge"})
+    except (ProviderOverloadedError, DeadlineExceededError):
+        raise
     except Exception as e:
         error_message = (f"{error_msg_prefix} Erro inesperado ({type(e).__name__}) durante a avaliação da LLM: {e}. "
                          f"Saída parcial (se houver):\n{raw_json_output_str}")
-        print(error_message)
-        import traceback
-        traceback.print_exc() 
+        logger.exception(
+            "%s Erro inesperado (%s) durante a avaliação da LLM: %s", error_msg_prefix, type(e).__name__, e,
+            extra={"stage": "judge", "raw_output": sample_payload(raw_json_output_str)}
+        )
         return {
             "error": error_message,
             "raw_output": raw_json_output_str 
         }
 
-    return {
-        "original_prompt_content": prompt_original, 
-        "version1": {
-            "title": "Reformulação 1", 
-            "content": reformulation_1
-        },
-        "version2": {
-            "title": "Reformulação 2", 
-            "content": reformulation_2
-        },
-        "evaluationData": evaluation_result.get("evaluationData", []),
-        "winningVersion": evaluation_result.get("winningVersion"), 
-        "justification": evaluation_result.get("justification", "Sem justificativa fornecida pela LLM.")
-    }
+    if evaluation_result is None:
+        return await build_evaluation_report(
+            raw_json_output_str, prompt_original, reformulations,
+            judge_model_type, judge_model_name, error_msg_prefix
+        )
+    return _comparison_report(evaluation_result, prompt_original, reformulations)
 
-def evaluate_single_prompt(
-    prompt: str,
+
+async def stream_evaluation(
+    prompt_original: str,
+    reformulation_1: str,
+    reformulation_2: str,
     judge_model_type: str = "gemini",
     judge_model_name: str = None
-):
+) -> AsyncIterator[str]:
     """
-    Avalia um único prompt com base nos 10 critérios definidos.
-    Retorna pontuações e justificativa.
+    Versão em streaming de evaluate_reformulations para duas reformulações: emite os trechos brutos da saída do judge.
+    O texto completo deve ser convertido com build_evaluation_report. Levanta EvaluationError.
     """
-    error_msg_prefix = f"evaluate_single_prompt (judge_model: {judge_model_type}):"
+    error_msg_prefix = f"stream_evaluation (judge_model: {judge_model_type}):"
     if not settings.API_KEY_JUDGE:
-        raise ValueError(f"{error_msg_prefix} API_KEY_JUDGE não encontrada.")
+        raise EvaluationError(f"{error_msg_prefix} API_KEY_JUDGE não encontrada nas configurações/variáveis de ambiente.")
 
     try:
-        judge_llm_provider = LLMProvider(model_type=judge_model_type, api_key_override=settings.API_KEY_JUDGE)
-        judge_llm = judge_llm_provider.get_llm_instance()
+        judge_llm_provider = _get_judge_provider(judge_model_type, judge_model_name)
+        evaluation_chain = _build_judge_chain(judge_llm_provider, EVALUATION_PROMPT)
+    except ValueError as ve:
+        raise EvaluationError(f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}")
 
-        if judge_model_name:
-            if hasattr(judge_llm, 'model_name'):
-                judge_llm.model_name = judge_model_name
-            elif hasattr(judge_llm, 'model'):
-                judge_llm.model = judge_model_name
+    try:
+        async for chunk in judge_llm_provider.astream(evaluation_chain, {
+            "prompt_original": prompt_original,
+            "reformulation_1": reformulation_1,
+            "reformulation_2": reformulation_2
+        }):
+            yield chunk
+    except (ProviderOverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        raise EvaluationError(f"{error_msg_prefix} Erro inesperado ({type(e).__name__}) durante a avaliação da LLM: {e}")
 
-    except ValueError as ve:
+async def _score_text_with_llm(text: str, judge_llm_provider: LLMProvider, error_msg_prefix: str) -> dict:
+    """Pontua um texto nos 10 critérios com SINGLE_EVAL_TEMPLATE (sem cache)."""
+    raw_json_output_str = ""
+    try:
+        evaluation_chain = _build_judge_chain(judge_llm_provider, SINGLE_EVAL_PROMPT, SingleJudgeOutput)
+        logger.debug("%s Invocando avaliação de prompt único...", error_msg_prefix, extra={"stage": "judge_score"})
+        judge_output = await judge_llm_provider.ainvoke(evaluation_chain, {"prompt": text}, "judge_score")
+        evaluation_result, raw_json_output_str = _unpack_judge_output(judge_output)
+
+        if evaluation_result is None:
+            evaluation_result, parse_error = await _parse_or_repair(
+                judge_llm_provider, raw_json_output_str, SingleJudgeOutput, error_msg_prefix
+            )
+            if evaluation_result is None:
+                logger.warning(
+                    "%s JSON mal formatado.", error_msg_prefix,
+                    extra={"stage": "json_parse", "raw_output": sample_payload(raw_json_output_str)}
+                )
+                return {
+                    "error": f"{error_msg_prefix} Falha ao decodificar JSON: {parse_error}",
+                    "raw_output": raw_json_output_str
+                }
+    except (ProviderOverloadedError, DeadlineExceededError):
+        raise
+    except Exception as e:
+        logger.exception("%s Erro inesperado: %s", error_msg_prefix, e, extra={"stage": "judge_score"})
         return {
-            "error": f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}",
-            "raw_output": ""
+            "error": f"{error_msg_prefix} Erro inesperado: {e}",
+            "raw_output": raw_json_output_str
         }
 
-    # Template específico para avaliação de 1 prompt
-    SINGLE_EVAL_TEMPLATE = """
-Você é um avaliador especialista em engenharia de prompts. Avalie o texto abaixo com base nos 10 critérios listados.
-
-Texto:
-\"\"\"
-{prompt}
-\"\"\"
+    return {
+        "evaluationData": evaluation_result.get("evaluationData", []),
+        "justification": evaluation_result.get("justification", "Sem justificativa fornecida pela LLM.")
+    }
 
-Critérios de Avaliação:
-1. Clareza e Especificidade
-2. Estrutura e Organização
-3. Consistência Interna
-4. Contextualização
-5. Parâmetros de Execução
-6. Eficiência Linguística
-7. Robustez
-8. Adaptabilidade
-9. Preparação e Enquadramento
-10. Princípios Éticos
 
-Responda EXCLUSIVAMENTE em JSON no seguinte formato:
-{{
-  "evaluationData": [
-    {{ "subject": "Clareza e Especificidade", "score": 8, "fullMark": 10 }},
-    ...
-  ],
-  "justification": "O prompt apresentou excelente clareza, organização e especificidade, porém faltou contextualização e definição de parâmetros."
-}}
-"""
+async def score_text(
+    text: str,
+    judge_model_type: str = "gemini",
+    judge_model_name: str = None,
+    use_cache: bool = True
+) -> dict:
+    """
+    Pontua um texto nos 10 critérios, reaproveitando notas já calculadas para o mesmo
+    (texto, modelo avaliador, versão da rubrica). Pontuações simultâneas do mesmo texto
+    são coalescidas. Retorna {'evaluationData', 'justification'} ou {'error', 'raw_output'}.
+    """
+    error_msg_prefix = f"score_text (judge_model: {judge_model_type}):"
+    try:
+        judge_llm_provider = _get_judge_provider(judge_model_type, judge_model_name)
+    except ValueError as ve:
+        return {
+            "error": f"{error_msg_prefix} Falha ao inicializar o LLM avaliador: {ve}",
+            "raw_output": ""
+        }
 
-    prompt_template = PromptTemplate(
-        template=SINGLE_EVAL_TEMPLATE,
-        input_variables=["prompt"],
-        template_format="f-string"
+    key = make_cache_key(
+        "criterion_scores", RUBRIC_VERSION, judge_llm_provider.model_type, judge_llm_provider.model_name, normalize_text(text)
     )
+    if use_cache:
+        cached = await criterion_score_cache.get(key)
+        if cached is not None:
+            return cached
 
-    evaluation_chain: RunnableSequence = prompt_template | judge_llm | StrOutputParser()
+    async def compute() -> dict:
+        scores = await _score_text_with_llm(text, judge_llm_provider, error_msg_prefix)
+        if "error" not in scores:
+            await criterion_score_cache.set(key, scores)
+        return scores
 
-    raw_json_output_str = ""
-    cleaned_json_str = ""
-    try:
-        print(f"{error_msg_prefix} Invocando avaliação de prompt único...")
-        raw_json_output_str = evaluation_chain.invoke({"prompt": prompt})
+    return await _inflight_scores.do(key, compute)
 
-        cleaned_json_str = raw_json_output_str.strip()
-        if cleaned_json_str.startswith("```json"):
-            cleaned_json_str = cleaned_json_str[7:].strip("`").strip()
 
-        if not cleaned_json_str.startswith("{") or not cleaned_json_str.endswith("}"):
-            print(f"{error_msg_prefix} JSON mal formatado:\n{cleaned_json_str}")
+async def evaluate_single_prompt(
+    prompt: str,
+    judge_model_type: str = "gemini",
+    judge_model_name: str = None,
+    use_cache: bool = True,
+    mode: str = "llm"
+):
+    """
+    Avalia um único prompt com base nos 10 critérios definidos.
+    Retorna pontuações e justificativa.
+    mode="fast" usa a pontuação heurística local (aproximada, sem chamada ao LLM).
+    """
+    if mode == "fast":
+        return evaluate_prompts_fast([prompt])[0]
 
-        evaluation_result = json.loads(cleaned_json_str)
-        print(f"{error_msg_prefix} JSON decodificado com sucesso.")
+    error_msg_prefix = f"evaluate_single_prompt (judge_model: {judge_model_type}):"
+    if not settings.API_KEY_JUDGE:
+        raise ValueError(f"{error_msg_prefix} API_KEY_JUDGE não encontrada.")
 
-    except json.JSONDecodeError as e:
-        return {
-            "error": f"{error_msg_prefix} Falha ao decodificar JSON: {e}",
-            "raw_output": raw_json_output_str
-        }
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {
-            "error": f"{error_msg_prefix} Erro inesperado: {e}",
-            "raw_output": raw_json_output_str
-        }
+    scores = await score_text(prompt, judge_model_type, judge_model_name, use_cache)
+    if "error" in scores:
+        return scores
 
     return {
         "prompt": prompt,
-        "evaluationData": evaluation_result.get("evaluationData", []),
-        "justification": evaluation_result.get("justification", "Sem justificativa fornecida pela LLM.")
+        "evaluationData": scores["evaluationData"],
+        "justification": scores["justification"]
     }
@@ -0,0 +1,537 @@
+import asyncio
+import json
+import logging
+import re
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, ContextManager, Dict, List, Optional, Tuple
+
+from app.core.cache import TieredCache, make_cache_key, normalize_text
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError, check_deadline, enforce_deadline, request_deadline, stage_budget
+from app.core.logging_config import sample_payload
+from app.core.metrics import Gauge, registry
+from app.core.near_duplicates import NearDuplicateIndex
+from app.core.prompt_templates import TEMPLATE_VERSION
+from app.core.singleflight import SingleFlight
+from app.core.task_graph import TaskGraph
+from app.providers.admission import ProviderOverloadedError
+from app.providers.llm_provider import select_hedge_model_type
+from app.providers.model_router import routing_scope
+from app.providers.token_budget import PromptTooLargeError, count_tokens, fit_prompt
+from app.schemas.prompt import (
+    NearDuplicateMatch, PromptRequest, PromptResponse, SinglePromptRequest, SinglePromptResponse, VersionInfo,
+)
+from app.services.judge_ensemble import (
+    evaluate_reformulations_ensemble, evaluate_single_prompt_ensemble, parse_judge_spec, resolve_judge_ensemble,
+)
+from app.services.prompt_engineering import (
+    ReformulationError, generate_reformulation, generate_reformulations, generation_prompt_budget, stream_reformulation,
+)
+from app.services.prompt_judge import (
+    EvaluationError, build_evaluation_report, evaluate_reformulations, evaluate_single_prompt, judge_prompt_budget,
+    judge_scored_reformulations, score_text, stream_evaluation,
+)
+
+logger = logging.getLogger(__name__)
+
+result_cache = TieredCache(
+    namespace="results",
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+    sqlite_path=settings.RESULT_CACHE_SQLITE_PATH,
+    disk_max_entries=settings.RESULT_CACHE_SQLITE_MAX_ENTRIES,
+    purge_interval_seconds=settings.RESULT_CACHE_PURGE_INTERVAL_SECONDS,
+)
+
+# Prompts já processados, para reaproveitar resultados de quase duplicatas (cada escopo é comparado só com ele mesmo)
+near_duplicate_index = NearDuplicateIndex(
+    threshold=settings.NEAR_DUP_THRESHOLD,
+    num_perm=settings.NEAR_DUP_NUM_PERM,
+    bands=settings.NEAR_DUP_BANDS,
+    shingle_size=settings.NEAR_DUP_SHINGLE_SIZE,
+    max_entries=settings.NEAR_DUP_MAX_ENTRIES,
+    sqlite_path=settings.RESULT_CACHE_SQLITE_PATH,
+)
+
+# Requisições idênticas simultâneas compartilham a mesma execução do pipeline
+inflight_requests = SingleFlight()
+registry.register(Gauge(
+    "prompt_api_pipeline_in_flight", "Execuções distintas do pipeline em andamento (após coalescência).",
+    collect=lambda: {(): inflight_requests.in_flight()},
+))
+
+# Recebe o model_type de um estágio e devolve o contexto que o admite (ex: semáforo por provedor)
+StageGate = Callable[[str], AsyncContextManager]
+
+
+def _no_gate(model_type: str) -> AsyncContextManager:
+    return nullcontext()
+
+
+def _prompt_budgets(budget_functions: List[Callable[[], Tuple[str, str, int]]]) -> List[Tuple[str, str, int]]:
+    """Orçamentos de tokens dos estágios; provedores desconhecidos ficam de fora (o erro surge no próprio estágio)."""
+    budgets = []
+    for budget in budget_functions:
+        try:
+            budgets.append(budget())
+        except ValueError:
+            continue
+    return budgets
+
+
+def fit_prompt_request(request: Any) -> Tuple[Any, bool]:
+    """
+    Confere o prompt da requisição contra o orçamento de tokens de todos os estágios que ele atravessa.
+    Retorna (requisição, truncado): com PROMPT_OVERFLOW_POLICY=truncate, uma cópia com o prompt cortado.
+    Levanta PromptTooLargeError se o prompt não couber e a política for 'reject'.
+    """
+    num_variants = request.num_variants if isinstance(request, PromptRequest) else 1
+    judges = [parse_judge_spec(spec) for spec in resolve_judge_ensemble(request.judge_ensemble)] or [(request.judge_model_type, None)]
+    budget_functions = [
+        lambda judge_model_type=judge_model_type, judge_model_name=judge_model_name:
+            judge_prompt_budget(judge_model_type, num_variants, judge_model_name)
+        for judge_model_type, judge_model_name in judges
+    ]
+    if isinstance(request, PromptRequest):
+        budget_functions.insert(0, lambda: generation_prompt_budget(request.generation_model_type, request.num_variants))
+    budgets = _prompt_budgets(budget_functions)
+    prompt, truncated = fit_prompt(request.prompt, budgets)
+    return (request.model_copy(update={"prompt": prompt}), True) if truncated else (request, False)
+
+
+def _routing_scope(request: Any) -> ContextManager:
+    """Informa o tamanho do prompt ao roteamento de modelos (MODEL_ROUTING_ENABLED) das chamadas da requisição."""
+    if not settings.MODEL_ROUTING_ENABLED:
+        return nullcontext()
+    return routing_scope(count_tokens(request.prompt, request.judge_model_type, ""))
+
+
+def _judge_label(request: Any) -> str:
+    """Avaliador(es) da requisição nas chaves de cache: o ensemble, se houver, ou judge_model_type."""
+    return ",".join(resolve_judge_ensemble(request.judge_ensemble)) or request.judge_model_type
+
+
+def prompt_cache_key(request: PromptRequest) -> str:
+    """Chave de conteúdo de /processar-prompt: prompt normalizado, modelos, número de variantes e versão dos templates."""
+    return make_cache_key(
+        "processar-prompt", TEMPLATE_VERSION, normalize_text(request.prompt),
+        request.generation_model_type, _judge_label(request), request.num_variants,
+    )
+
+
+def prompt_similarity_scope(request: PromptRequest) -> str:
+    """Escopo de quase duplicatas de /processar-prompt: tudo que compõe a chave de cache, exceto o prompt."""
+    return make_cache_key(
+        "processar-prompt", TEMPLATE_VERSION, request.generation_model_type, _judge_label(request), request.num_variants,
+    )
+
+
+def single_prompt_similarity_scope(request: SinglePromptRequest) -> str:
+    """Escopo de quase duplicatas de /avaliar-prompt."""
+    return make_cache_key("avaliar-prompt", TEMPLATE_VERSION, _judge_label(request))
+
+
+async def _near_duplicate_result(scope: str, prompt: str) -> Optional[Tuple[Any, NearDuplicateMatch]]:
+    """
+    Procura um prompt quase idêntico já processado no mesmo escopo e devolve (resultado em cache, match).
+    Entradas cujo resultado já saiu do cache são removidas do índice.
+    """
+    match = near_duplicate_index.lookup(scope, prompt)
+    if match is None:
+        return None
+    cached = await result_cache.get(match["key"])
+    if cached is None:
+        near_duplicate_index.discard(match["key"])
+        return None
+    logger.info("Resultado reaproveitado de prompt quase duplicado (similaridade %.3f).", match["similarity"], extra={"stage": "cache"})
+    return cached, NearDuplicateMatch(prompt=match["prompt"], similarity=match["similarity"])
+
+
+def single_prompt_cache_key(request: SinglePromptRequest) -> str:
+    """Chave de conteúdo de /avaliar-prompt: prompt normalizado, modelo avaliador e versão dos templates."""
+    return make_cache_key(
+        "avaliar-prompt", TEMPLATE_VERSION, normalize_text(request.prompt), _judge_label(request),
+    )
+
+
+async def _compute_prompt_response(request: PromptRequest, stage_gate: StageGate = _no_gate) -> PromptResponse:
+    """
+    Gera as reformulações, avalia-as e monta o PromptResponse. Levanta ReformulationError.
+    Cada estágio roda dentro de stage_gate(model_type) do provedor que ele usa.
+    Com prazo definido, a geração recebe DEADLINE_GENERATION_SHARE do tempo restante e o judge o que sobrar
+    (levanta DeadlineExceededError se um deles estourar).
+    """
+    hedge_model_type = None
+    if request.hedge:
+        hedge_model_type = request.hedge_model_type or select_hedge_model_type(request.generation_model_type)
+    if settings.PIPELINED_EXECUTION_ENABLED and not resolve_judge_ensemble(request.judge_ensemble):
+        return await _compute_prompt_response_pipelined(request, stage_gate, hedge_model_type)
+
+    with stage_budget(settings.DEADLINE_GENERATION_SHARE):
+        async with stage_gate(request.generation_model_type):
+            reformulations = await generate_reformulations(
+                original_prompt=request.prompt,
+                generation_model_type=request.generation_model_type,
+                hedge_model_type=hedge_model_type,
+                num_variants=request.num_variants
+            )
+
+    if len(reformulations) < 2 or not all(reformulations):
+        raise ReformulationError("Serviço de geração retornou conteúdo vazio para reformulações.")
+
+    check_deadline("judge")
+    async with stage_gate(request.judge_model_type):
+        evaluation_report = await _evaluate(request, reformulations)
+    return _build_prompt_response(request, reformulations, evaluation_report)
+
+
+async def _compute_prompt_response_pipelined(
+    request: PromptRequest, stage_gate: StageGate, hedge_model_type: Optional[str]
+) -> PromptResponse:
+    """
+    Versão em pipeline de _compute_prompt_response (PIPELINED_EXECUTION_ENABLED), sempre com a avaliação por
+    texto, qualquer que seja JUDGE_PER_TEXT_SCORING: os estágios formam um grafo de dependências executado em paralelo. A pontuação do prompt original começa na chegada da requisição e a de
+    cada reformulação assim que ela é gerada; só o mata-mata final espera por todas. Por isso cada variante é
+    sempre uma chamada própria (como na estratégia "parallel"), qualquer que seja REFORMULATION_STRATEGY:
+    numa chamada única todas as pontuações esperariam a geração inteira.
+    Levanta ReformulationError (a primeira falha cancela os estágios em andamento).
+    """
+    num_variants = request.num_variants
+    use_cache = not request.bypass_cache
+    graph = TaskGraph()
+
+    async def score(text: str) -> dict:
+        async with stage_gate(request.judge_model_type):
+            return await score_text(text, request.judge_model_type, use_cache=use_cache)
+
+    async def generate(version: int) -> str:
+        with stage_budget(settings.DEADLINE_GENERATION_SHARE):
+            async with stage_gate(request.generation_model_type):
+                return await generate_reformulation(request.prompt, request.generation_model_type, hedge_model_type, version)
+
+    async def judge(original_scores: dict, *results: Any) -> dict:
+        reformulations, variant_scores = list(results[:num_variants]), list(results[num_variants:])
+        check_deadline("judge")
+        async with stage_gate(request.judge_model_type):
+            return await judge_scored_reformulations(
+                request.prompt, reformulations, [original_scores, *variant_scores], request.judge_model_type
+            )
+
+    versions = range(1, num_variants + 1)
+    graph.add("score_original", lambda: score(request.prompt))
+    for version in versions:
+        graph.add(f"reformulation_{version}", lambda version=version: generate(version))
+        graph.add(f"score_{version}", score, f"reformulation_{version}")
+    graph.add(
+        "evaluation", judge,
+        "score_original", *(f"reformulation_{version}" for version in versions), *(f"score_{version}" for version in versions)
+    )
+
+    results = await graph.run()
+    reformulations = [results[f"reformulation_{version}"] for version in versions]
+    return _build_prompt_response(request, reformulations, results["evaluation"])
+
+
+async def _evaluate(request: PromptRequest, reformulations: List[str]) -> dict:
+    """Avalia as reformulações com o judge da requisição ou, se configurado, com o ensemble de avaliadores."""
+    judges = resolve_judge_ensemble(request.judge_ensemble)
+    if judges:
+        return await evaluate_reformulations_ensemble(request.prompt, reformulations, judges, use_cache=not request.bypass_cache)
+    return await evaluate_reformulations(
+        prompt_original=request.prompt,
+        reformulations=reformulations,
+        judge_model_type=request.judge_model_type,
+        use_cache=not request.bypass_cache
+    )
+
+
+def _build_prompt_response(request: PromptRequest, reformulations: List[str], evaluation_report: dict) -> PromptResponse:
+    """Monta o PromptResponse a partir das reformulações e do relatório do judge (com ou sem erro)."""
+    if "error" in evaluation_report:
+        logger.warning(
+            "Erro do serviço de avaliação: %s", evaluation_report['error'],
+            extra={"stage": "judge", "raw_output": sample_payload(evaluation_report.get('raw_output'))}
+        )
+        variants = [
+            VersionInfo(title=f"Reformulação {version}", content=content)
+            for version, content in enumerate(reformulations, start=1)
+        ]
+        return PromptResponse(
+            original_prompt=request.prompt,
+            version1=variants[0],
+            version2=variants[1],
+            variants=variants,
+            error=f"Falha na avaliação das reformulações: {evaluation_report['error']}",
+            raw_judge_output=str(evaluation_report.get('raw_output', ''))
+        )
+
+    variants = [VersionInfo(**variant) for variant in evaluation_report["variants"]]
+    return PromptResponse(
+        original_prompt=request.prompt,
+        version1=variants[0],
+        version2=variants[1],
+        variants=variants,
+        evaluationData=evaluation_report.get("evaluationData"),
+        winningVersion=evaluation_report.get("winningVersion"),
+        justification=evaluation_report.get("justification"),
+        ensemble=evaluation_report.get("ensemble")
+    )
+
+
+async def _compute_single_prompt_response(request: SinglePromptRequest) -> SinglePromptResponse:
+    """Avalia um único prompt (com o ensemble de avaliadores, se configurado) e monta o SinglePromptResponse. Levanta EvaluationError."""
+    judges = resolve_judge_ensemble(request.judge_ensemble) if request.mode == "llm" else []
+    if judges:
+        evaluation = await evaluate_single_prompt_ensemble(request.prompt, judges, use_cache=not request.bypass_cache)
+    else:
+        evaluation = await evaluate_single_prompt(
+            prompt=request.prompt,
+            judge_model_type=request.judge_model_type,
+            use_cache=not request.bypass_cache,
+            mode=request.mode
+        )
+
+    if "error" in evaluation:
+        raise EvaluationError(evaluation["error"])
+
+    return SinglePromptResponse(
+        prompt=evaluation["prompt"],
+        evaluationData=evaluation["evaluationData"],
+        justification=evaluation["justification"],
+        ensemble=evaluation.get("ensemble")
+    )
+
+
+async def _compute_and_cache_prompt_response(request: PromptRequest, key: str, stage_gate: StageGate) -> PromptResponse:
+    response = await _compute_prompt_response(request, stage_gate)
+    if settings.RESULT_CACHE_ENABLED and response.error is None:
+        await result_cache.set(key, response.model_dump())
+        if settings.NEAR_DUP_ENABLED:
+            await near_duplicate_index.aadd(prompt_similarity_scope(request), request.prompt, key)
+    return response
+
+
+async def _compute_and_cache_single_prompt_response(request: SinglePromptRequest, key: str) -> SinglePromptResponse:
+    response = await _compute_single_prompt_response(request)
+    if settings.RESULT_CACHE_ENABLED:
+        await result_cache.set(key, response.model_dump())
+        if settings.NEAR_DUP_ENABLED:
+            await near_duplicate_index.aadd(single_prompt_similarity_scope(request), request.prompt, key)
+    return response
+
+
+async def run_prompt_pipeline(request: PromptRequest, stage_gate: StageGate = _no_gate) -> PromptResponse:
+    """
+    Executa o fluxo completo de /processar-prompt passando pelo cache de resultados.
+    Requisições idênticas em andamento são coalescidas em uma única execução.
+    Sem acerto exato, um prompt quase idêntico já processado (NEAR_DUP_THRESHOLD) tem o resultado reaproveitado,
+    sinalizado em `near_duplicate`. Apenas respostas sem erro de avaliação são armazenadas.
+    stage_gate permite ao chamador (ex: processamento em lote) limitar a concorrência por provedor.
+    request.timeout_seconds limita a requisição (sem estender um prazo já definido pelo chamador); ao expirar,
+    as chamadas pendentes são canceladas e DeadlineExceededError é levantada. Uma execução coalescida
+    segue o prazo de quem a iniciou, mas cada chamador para de esperar no próprio prazo.
+    """
+    request, truncated = fit_prompt_request(request)
+    with request_deadline(request.timeout_seconds), _routing_scope(request):
+        use_cache = settings.RESULT_CACHE_ENABLED and not request.bypass_cache
+        key = prompt_cache_key(request)
+        if use_cache:
+            cached = await result_cache.get(key)
+            if cached is not None:
+                return PromptResponse.model_validate({**cached, "prompt_truncated": truncated})
+            if settings.NEAR_DUP_ENABLED and request.allow_near_duplicate:
+                near_duplicate = await _near_duplicate_result(prompt_similarity_scope(request), request.prompt)
+                if near_duplicate is not None:
+                    cached, match = near_duplicate
+                    return PromptResponse.model_validate({
+                        **cached, "original_prompt": request.prompt, "near_duplicate": match, "prompt_truncated": truncated
+                    })
+
+        async with enforce_deadline("pipeline"):
+            response = await inflight_requests.do(key, lambda: _compute_and_cache_prompt_response(request, key, stage_gate))
+        # Cópia própria para cada chamador coalescido
+        return response.model_copy(deep=True, update={"prompt_truncated": truncated})
+
+
+async def run_single_evaluation(request: SinglePromptRequest) -> SinglePromptResponse:
+    """
+    Executa o fluxo de /avaliar-prompt passando pelo cache de resultados,
+    coalescendo avaliações idênticas em andamento.
+    O modo 'fast' é local e barato, então dispensa cache e coalescência.
+    request.timeout_seconds limita a avaliação como em run_prompt_pipeline.
+    """
+    if request.mode == "fast":
+        return await _compute_single_prompt_response(request)
+
+    request, truncated = fit_prompt_request(request)
+    with request_deadline(request.timeout_seconds), _routing_scope(request):
+        use_cache = settings.RESULT_CACHE_ENABLED and not request.bypass_cache
+        key = single_prompt_cache_key(request)
+        if use_cache:
+            cached = await result_cache.get(key)
+            if cached is not None:
+                return SinglePromptResponse.model_validate({**cached, "prompt_truncated": truncated})
+            if settings.NEAR_DUP_ENABLED and request.allow_near_duplicate:
+                near_duplicate = await _near_duplicate_result(single_prompt_similarity_scope(request), request.prompt)
+                if near_duplicate is not None:
+                    cached, match = near_duplicate
+                    return SinglePromptResponse.model_validate({
+                        **cached, "prompt": request.prompt, "near_duplicate": match, "prompt_truncated": truncated
+                    })
+
+        async with enforce_deadline("pipeline"):
+            response = await inflight_requests.do(key, lambda: _compute_and_cache_single_prompt_response(request, key))
+        return response.model_copy(deep=True, update={"prompt_truncated": truncated})
+
+
+# Linha completa de evaluationData dentro da saída parcial do judge (objeto plano com "subject")
+_EVALUATION_ROW_PATTERN = re.compile(r'\{[^{}]*"subject"[^{}]*\}')
+
+StreamEvent = Tuple[str, Dict[str, Any]]
+
+
+async def _stream_reformulations(request: PromptRequest, contents: Dict[int, str]) -> AsyncIterator[StreamEvent]:
+    """
+    Executa as reformulações em paralelo (uma chamada por variante), intercalando seus tokens à medida que chegam.
+    O texto completo de cada versão é acumulado em `contents`.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done_marker = object()
+
+    async def produce(version: int) -> None:
+        try:
+            async for token in stream_reformulation(request.prompt, request.generation_model_type, f"reformulation_{version}"):
+                contents[version] += token
+                await queue.put(("reformulation_token", {"version": version, "token": token}))
+            await queue.put(("reformulation_done", {"version": version, "content": contents[version]}))
+        except BaseException as e:
+            await queue.put((done_marker, e))
+            raise
+        await queue.put((done_marker, None))
+
+    producers = [asyncio.create_task(produce(version)) for version in contents]
+    try:
+        pending = len(producers)
+        while pending:
+            event, payload = await queue.get()
+            if event is done_marker:
+                pending -= 1
+                if payload is not None:
+                    raise payload
+                continue
+            yield event, payload
+    finally:
+        for producer in producers:
+            producer.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+
+
+async def _replay_cached_response(response: PromptResponse) -> AsyncIterator[StreamEvent]:
+    """Emite uma resposta do cache no mesmo formato de eventos do fluxo ao vivo."""
+    for version, info in enumerate(response.variants or [response.version1, response.version2], start=1):
+        if info is not None:
+            yield "reformulation_done", {"version": version, "content": info.content}
+    for row in response.evaluationData or []:
+        yield "evaluation_row", row.model_dump()
+    yield "verdict", {"winningVersion": response.winningVersion, "justification": response.justification}
+    yield "result", response.model_dump()
+
+
+async def stream_prompt_pipeline(request: PromptRequest) -> AsyncIterator[StreamEvent]:
+    """
+    Versão em streaming de run_prompt_pipeline. Emite, em ordem:
+    tokens das reformulações ('reformulation_token'/'reformulation_done'),
+    linhas de evaluationData assim que o judge as completa ('evaluation_row'; com mais de duas
+    variantes ou com ensemble de avaliadores, a avaliação não é transmitida e as linhas saem ao final),
+    o veredito ('verdict') e por fim o PromptResponse completo ('result').
+    Falhas são emitidas como um evento 'error' que encerra o fluxo; prazo esgotado (request.timeout_seconds)
+    vem com reason='deadline' e prompt acima do orçamento de tokens, com reason='prompt_too_large'.
+    """
+    try:
+        request, truncated = fit_prompt_request(request)
+    except PromptTooLargeError as e:
+        yield "error", {"detail": str(e), "reason": "prompt_too_large", "tokens": e.tokens, "limit": e.limit}
+        return
+    with request_deadline(request.timeout_seconds), _routing_scope(request):
+        async for event, payload in _stream_prompt_events(request):
+            if event == "result":
+                payload = {**payload, "prompt_truncated": truncated}
+            yield event, payload
+
+
+def _deadline_error_event(error: DeadlineExceededError) -> StreamEvent:
+    return "error", {"detail": str(error), "reason": "deadline"}
+
+
+async def _stream_prompt_events(request: PromptRequest) -> AsyncIterator[StreamEvent]:
+    """Corpo de stream_prompt_pipeline, executado dentro do prazo da requisição."""
+    key = prompt_cache_key(request)
+    if settings.RESULT_CACHE_ENABLED and not request.bypass_cache:
+        cached = await result_cache.get(key)
+        if cached is not None:
+            async for event in _replay_cached_response(PromptResponse.model_validate(cached)):
+                yield event
+            return
+
+    contents = {version: "" for version in range(1, request.num_variants + 1)}
+    try:
+        with stage_budget(settings.DEADLINE_GENERATION_SHARE):
+            async for event in _stream_reformulations(request, contents):
+                yield event
+    except DeadlineExceededError as e:
+        yield _deadline_error_event(e)
+        return
+    except ReformulationError as e:
+        yield "error", {"detail": f"Falha ao gerar reformulações: {str(e)}"}
+        return
+    except ProviderOverloadedError as e:
+        yield "error", {"detail": str(e), "retry_after": e.retry_after}
+        return
+
+    reformulations = list(contents.values())
+    raw_judge_output = ""
+    rows_emitted = 0
+    try:
+        check_deadline("judge")
+        if len(reformulations) != 2 or resolve_judge_ensemble(request.judge_ensemble):
+            evaluation_report = await _evaluate(request, reformulations)
+        else:
+            async for chunk in stream_evaluation(
+                prompt_original=request.prompt,
+                reformulation_1=reformulations[0],
+                reformulation_2=reformulations[1],
+                judge_model_type=request.judge_model_type
+            ):
+                raw_judge_output += chunk
+                rows = _EVALUATION_ROW_PATTERN.findall(raw_judge_output)
+                for row_text in rows[rows_emitted:]:
+                    try:
+                        row = json.loads(row_text)
+                    except json.JSONDecodeError:
+                        break
+                    rows_emitted += 1
+                    yield "evaluation_row", row
+            evaluation_report = await build_evaluation_report(
+                raw_judge_output, request.prompt, reformulations,
+                judge_model_type=request.judge_model_type,
+                error_msg_prefix=f"stream_prompt_pipeline (judge_model: {request.judge_model_type}):"
+            )
+    except ProviderOverloadedError as e:
+        yield "error", {"detail": str(e), "retry_after": e.retry_after}
+        return
+    except DeadlineExceededError as e:
+        yield _deadline_error_event(e)
+        return
+    except EvaluationError as e:
+        evaluation_report = {"error": str(e), "raw_output": raw_judge_output}
+
+    response = _build_prompt_response(request, reformulations, evaluation_report)
+    if response.error is None:
+        for row in (response.evaluationData or [])[rows_emitted:]:
+            yield "evaluation_row", row.model_dump()
+        yield "verdict", {"winningVersion": response.winningVersion, "justification": response.justification}
+        if settings.RESULT_CACHE_ENABLED:
+            await result_cache.set(key, response.model_dump())
+            if settings.NEAR_DUP_ENABLED:
+                await near_duplicate_index.aadd(prompt_similarity_scope(request), request.prompt, key)
+    yield "result", response.model_dump()
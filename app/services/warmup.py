@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+from app.core.config import settings
+from app.core.metrics import Gauge, registry
+from app.providers.llm_provider import ROLE_GENERATION, ROLE_JUDGE
+from app.providers.token_budget import load_tokenizers
+from app.services.prompt_engineering import warm_up_generation
+from app.services.prompt_judge import warm_up_judge
+from app.services.prompt_pipeline import near_duplicate_index
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessState:
+    """
+    Estado de prontidão do worker: fica pronto quando o warm-up termina (ou imediatamente,
+    se desativado). Guarda as durações de inicialização e o resultado do warm-up por provedor.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.timings: Dict[str, float] = {}
+        self.providers: List[Dict[str, Any]] = []
+        self.tokenizers: Dict[str, bool] = {} # Codificação -> carregada (contagem exata de tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "timings_seconds": {phase: round(duration, 3) for phase, duration in self.timings.items()},
+            "providers": self.providers,
+            "tokenizers": self.tokenizers,
+        }
+
+
+readiness = ReadinessState()
+
+registry.register(Gauge(
+    "prompt_api_cold_start_seconds", "Duração das fases de inicialização do worker (import, warmup, total).",
+    ["phase"], collect=lambda: {(phase,): duration for phase, duration in readiness.timings.items()},
+))
+
+
+def _model_types(value: str) -> List[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def _warm_up_providers() -> List[Dict[str, Any]]:
+    """
+    Importa os SDKs, constrói os clientes configurados (com o pool HTTP compartilhado) e monta
+    as chains com os templates já compilados. Falhas (ex: chave ausente) não impedem a prontidão.
+    """
+    results = []
+    plan = [(ROLE_GENERATION, model_type, warm_up_generation) for model_type in _model_types(settings.WARMUP_GENERATION_MODEL_TYPES)]
+    plan += [(ROLE_JUDGE, model_type, warm_up_judge) for model_type in _model_types(settings.WARMUP_JUDGE_MODEL_TYPES)]
+    for role, model_type, warm_up in plan:
+        started_at = time.perf_counter()
+        try:
+            provider = warm_up(model_type)
+            results.append({
+                "provider": model_type, "role": role, "model": provider.model_name,
+                "ok": True, "seconds": round(time.perf_counter() - started_at, 3)
+            })
+        except ValueError as e:
+            logger.warning("Warm-up de %s (%s) falhou: %s", model_type, role, e, extra={"stage": "warmup"})
+            results.append({"provider": model_type, "role": role, "ok": False, "error": str(e)})
+    return results
+
+
+async def run_startup(boot_started_at: float) -> None:
+    """
+    Executa o carregamento dos tokenizers, o warm-up (se WARMUP_ENABLED) e a recarga do índice de quase
+    duplicatas persistido fora do event loop e marca o worker como pronto, registrando as durações de inicialização.
+    boot_started_at é o time.perf_counter() do início do import.
+    """
+    readiness.timings["import"] = time.perf_counter() - boot_started_at
+    if settings.TOKENIZER_ENABLED:
+        started_at = time.perf_counter()
+        readiness.tokenizers = await asyncio.to_thread(load_tokenizers)
+        readiness.timings["tokenizers"] = time.perf_counter() - started_at
+    if settings.NEAR_DUP_ENABLED and settings.RESULT_CACHE_SQLITE_PATH:
+        started_at = time.perf_counter()
+        loaded = await asyncio.to_thread(near_duplicate_index.load, settings.RESULT_CACHE_TTL_SECONDS)
+        readiness.timings["near_duplicate_index"] = time.perf_counter() - started_at
+        logger.info("Índice de quase duplicatas recarregado com %d prompts.", loaded, extra={"stage": "startup"})
+    if settings.WARMUP_ENABLED:
+        started_at = time.perf_counter()
+        readiness.providers = await asyncio.to_thread(_warm_up_providers)
+        readiness.timings["warmup"] = time.perf_counter() - started_at
+    readiness.timings["total"] = time.perf_counter() - boot_started_at
+    readiness.ready = True
+    logger.info(
+        "Worker pronto em %.2fs (import %.2fs, warm-up %.2fs).",
+        readiness.timings["total"], readiness.timings["import"], readiness.timings.get("warmup", 0.0),
+        extra={"stage": "startup", "providers": readiness.providers}
+    )
@@ -0,0 +1,194 @@
+"""
+Benchmark de carga de /processar-prompt e /avaliar-prompt, sem rede por padrão.
+
+Em processo (padrão) a aplicação roda no mesmo event loop via ASGITransport, usando o provedor
+falso (model_type="fake"); via HTTP, aponte --base-url para um servidor já em execução
+(ex: iniciado com FAKE_LLM_LATENCY_MS=300 uvicorn app.main:app).
+
+Exemplos:
+    python -m benchmarks.load_test --endpoint processar-prompt --concurrency 1,8,32 --requests 200
+    python -m benchmarks.load_test --endpoint avaliar-prompt --transport http --base-url http://localhost:8000
+    FAKE_LLM_RATE_LIMIT_RATE=0.05 python -m benchmarks.load_test --json resultado.json
+    python -m benchmarks.load_test --prompt-repeat 50 --accept-encoding gzip --exclude echo,raw
+
+Relata vazão, latência p50/p95/p99, atraso do event loop (lag), bytes recebidos por resposta (como trafegam,
+antes de descomprimir) e tempo de CPU do processo por requisição durante cada rodada.
+No modo HTTP o lag e a CPU medidos são os do cliente, não os do servidor.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+# O provedor falso não usa chave, mas o judge exige API_KEY_JUDGE definida
+os.environ.setdefault("API_KEY_JUDGE", "fake")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """Percentil q (0-100) pelo método nearest-rank."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100.0 * len(ordered)) - 1)]
+
+
+class LoopLagMonitor:
+    """Mede o atraso do event loop: quanto um sleep de `interval` passa do tempo pedido."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            started_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started_at - self.interval))
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def build_payload(args: argparse.Namespace, index: int) -> Dict:
+    # Prompts distintos por requisição: sem --use-cache, cache e coalescência não mascaram o custo real
+    prompt = f"{' '.join([args.prompt] * args.prompt_repeat)} (variação {index})"
+    if args.endpoint == "processar-prompt":
+        return {
+            "prompt": prompt,
+            "generation_model_type": args.generation_model,
+            "judge_model_type": args.judge_model,
+            "bypass_cache": not args.use_cache,
+            "num_variants": args.variants,
+        }
+    return {"prompt": prompt, "judge_model_type": args.judge_model, "bypass_cache": not args.use_cache, "mode": args.mode}
+
+
+async def run_round(client: httpx.AsyncClient, args: argparse.Namespace, concurrency: int) -> Dict:
+    """Executa args.requests requisições com `concurrency` trabalhadores e resume os resultados."""
+    latencies: List[float] = []
+    response_bytes: List[int] = []
+    statuses: Counter = Counter()
+    next_index = 0
+    params = {name: value for name, value in (("fields", args.fields), ("exclude", args.exclude)) if value is not None}
+    headers = {"Accept-Encoding": args.accept_encoding}
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < args.requests:
+            index = next_index
+            next_index += 1
+            started_at = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"/api/v1/{args.endpoint}", json=build_payload(args, index), params=params, headers=headers
+                )
+                statuses[str(response.status_code)] += 1
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started_at)
+                    response_bytes.append(response.num_bytes_downloaded)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+
+    lag = LoopLagMonitor()
+    lag.start()
+    started_at = time.perf_counter()
+    cpu_started_at = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+    cpu_elapsed = time.process_time() - cpu_started_at
+    await lag.stop()
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "endpoint": args.endpoint,
+        "transport": args.transport,
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {q: ms(percentile(latencies, q)) for q in (50, 95, 99)} | {"max": ms(max(latencies, default=None))},
+        "loop_lag_ms": {q: ms(percentile(lag.samples, q)) for q in (50, 99)} | {"max": ms(max(lag.samples, default=None))},
+        "response_bytes_mean": round(sum(response_bytes) / len(response_bytes)) if response_bytes else None,
+        "cpu_ms_per_request": round(cpu_elapsed * 1000 / args.requests, 2) if args.requests else None,
+    }
+
+
+def format_report(result: Dict) -> str:
+    latency, lag = result["latency_ms"], result["loop_lag_ms"]
+    return (
+        f"{result['endpoint']:<17} c={result['concurrency']:<4} ok={result['succeeded']}/{result['requests']} "
+        f"{result['throughput_rps']} req/s | latência p50={latency[50]} p95={latency[95]} p99={latency[99]} max={latency['max']} ms "
+        f"| lag p50={lag[50]} p99={lag[99]} max={lag['max']} ms | {result['response_bytes_mean']} B/resp "
+        f"| cpu {result['cpu_ms_per_request']} ms/req | status={result['statuses']}"
+    )
+
+
+def make_client(args: argparse.Namespace) -> httpx.AsyncClient:
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=max(args.concurrency_levels) + 8)
+    if args.transport == "http":
+        return httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits)
+    from app.main import app # Importado aqui para que as variáveis de ambiente acima já estejam aplicadas
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=timeout, limits=limits)
+
+
+async def main(args: argparse.Namespace) -> List[Dict]:
+    results = []
+    async with make_client(args) as client:
+        if args.warmup:
+            warmup_args = argparse.Namespace(**{**vars(args), "requests": args.warmup})
+            await run_round(client, warmup_args, min(args.warmup, max(args.concurrency_levels)))
+        for concurrency in args.concurrency_levels:
+            result = await run_round(client, args, concurrency)
+            print(format_report(result))
+            results.append(result)
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark offline de /processar-prompt e /avaliar-prompt.")
+    parser.add_argument("--endpoint", choices=["processar-prompt", "avaliar-prompt"], default="processar-prompt")
+    parser.add_argument("--transport", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", default="1,8,32", help="Níveis de concorrência separados por vírgula.")
+    parser.add_argument("--requests", type=int, default=100, help="Requisições por nível de concorrência.")
+    parser.add_argument("--warmup", type=int, default=5, help="Requisições descartadas antes da medição.")
+    parser.add_argument("--generation-model", default="fake")
+    parser.add_argument("--judge-model", default="fake")
+    parser.add_argument("--variants", type=int, default=2, help="Reformulações por requisição de /processar-prompt.")
+    parser.add_argument("--mode", choices=["llm", "fast"], default="llm", help="Modo de /avaliar-prompt.")
+    parser.add_argument("--use-cache", action="store_true", help="Permite acertos no cache de resultados.")
+    parser.add_argument("--prompt", default="Escreva um resumo sobre energia solar para estudantes.")
+    parser.add_argument("--prompt-repeat", type=int, default=1, help="Repete o prompt N vezes (respostas maiores).")
+    parser.add_argument("--accept-encoding", default="identity", help="Cabeçalho Accept-Encoding (ex: 'gzip', 'br, gzip').")
+    parser.add_argument("--fields", help="Campos da resposta a retornar (parâmetro ?fields=).")
+    parser.add_argument("--exclude", help="Campos da resposta a omitir (parâmetro ?exclude=, ex: 'echo,raw').")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", dest="json_path", help="Grava os resultados em JSON neste caminho.")
+    args = parser.parse_args(argv)
+    args.concurrency_levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    benchmark_results = asyncio.run(main(arguments))
+    if arguments.json_path:
+        with open(arguments.json_path, "w", encoding="utf-8") as f:
+            json.dump(benchmark_results, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,6 @@
+import os
+
+# Definidas antes de importar a aplicação: o judge exige uma chave e os testes não devem poluir a saída
+os.environ.setdefault("API_KEY_JUDGE", "test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("RESULT_CACHE_SQLITE_PATH", "")
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from app.providers.admission import ProviderGuard, ProviderOverloadedError, rate_limit_retry_after
+from app.providers.fake_llm import FakeRateLimitError
+
+
+class _Response:
+    def __init__(self, headers):
+        self.status_code = 429
+        self.headers = headers
+
+
+class _SdkRateLimitError(Exception):
+    """429 no formato dos SDKs OpenAI/Groq: o status e os cabeçalhos vêm em `response`."""
+
+    def __init__(self, headers):
+        super().__init__("Error code: 429 - rate limit exceeded")
+        self.response = _Response(headers)
+
+
+def _guard() -> ProviderGuard:
+    return ProviderGuard("fake", "fake-model", requests_per_minute=600, tokens_per_minute=100000)
+
+
+def test_rate_limited_call_raises_provider_overloaded_with_retry_after():
+    guard = _guard()
+
+    async def call():
+        raise _SdkRateLimitError({"retry-after": "7"})
+
+    with pytest.raises(ProviderOverloadedError) as error:
+        asyncio.run(guard.run(call, estimated_tokens=10))
+
+    assert error.value.retry_after == 7.0
+    assert isinstance(error.value.__cause__, _SdkRateLimitError)
+    assert guard.concurrency.limit == 4 # on_overload reduziu o limite inicial (8) pela metade
+    assert guard.concurrency.in_flight == 0
+    assert guard.breaker.consecutive_failures == 0 # 429 não conta como falha do disjuntor
+
+
+def test_rate_limited_stream_raises_provider_overloaded():
+    guard = _guard()
+
+    async def open_stream():
+        yield "primeiro"
+        raise FakeRateLimitError("fake: 429 Too Many Requests (injetado)")
+
+    async def consume():
+        return [chunk async for chunk in guard.stream(open_stream, estimated_tokens=10)]
+
+    with pytest.raises(ProviderOverloadedError) as error:
+        asyncio.run(consume())
+
+    assert error.value.retry_after == 1.0
+    assert guard.concurrency.in_flight == 0
+
+
+def test_other_errors_are_propagated_unchanged():
+    guard = _guard()
+
+    async def call():
+        raise RuntimeError("falha do provedor")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(guard.run(call, estimated_tokens=10))
+
+    assert guard.breaker.consecutive_failures == 1
+
+
+def test_rate_limit_retry_after_reads_provider_headers():
+    assert rate_limit_retry_after(_SdkRateLimitError({"retry-after-ms": "1500", "retry-after": "9"})) == 1.5
+    assert rate_limit_retry_after(_SdkRateLimitError({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"})) == 1.0
+    assert rate_limit_retry_after(FakeRateLimitError("429"), default=2.0) == 2.0
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.core.deadline import (
+    DeadlineExceededError, check_deadline, enforce_deadline, remaining_time, request_deadline, stage_budget,
+)
+
+
+def test_without_deadline_nothing_is_enforced():
+    async def scenario():
+        check_deadline("geracao")
+        with stage_budget(0.5):
+            async with enforce_deadline("geracao"):
+                await asyncio.sleep(0)
+        return remaining_time()
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_request_deadline_never_extends_current_deadline():
+    async def scenario():
+        with request_deadline(1.0):
+            outer = remaining_time()
+            with request_deadline(10.0):
+                extended = remaining_time()
+            with request_deadline(0.2):
+                shortened = remaining_time()
+            with request_deadline(None):
+                kept = remaining_time()
+        return outer, extended, shortened, kept, remaining_time()
+
+    outer, extended, shortened, kept, after = asyncio.run(scenario())
+
+    assert 0.9 < outer <= 1.0
+    assert extended <= outer
+    assert shortened <= 0.2
+    assert kept <= outer
+    assert after is None
+
+
+def test_stage_budget_reserves_share_of_remaining_time():
+    async def scenario():
+        with request_deadline(1.0):
+            with stage_budget(0.25):
+                stage = remaining_time()
+            return stage, remaining_time()
+
+    stage, rest = asyncio.run(scenario())
+
+    assert 0.2 < stage <= 0.25
+    assert rest > 0.9
+
+
+def test_check_deadline_raises_once_expired():
+    async def scenario():
+        with request_deadline(0.01):
+            await asyncio.sleep(0.02)
+            check_deadline("julgamento")
+
+    with pytest.raises(DeadlineExceededError) as error:
+        asyncio.run(scenario())
+    assert error.value.stage == "julgamento"
+
+
+def test_enforce_deadline_cancels_running_block():
+    async def scenario():
+        cancelled = False
+        with request_deadline(0.05):
+            try:
+                async with enforce_deadline("geracao"):
+                    try:
+                        await asyncio.sleep(10)
+                    except asyncio.CancelledError:
+                        cancelled = True
+                        raise
+            except DeadlineExceededError as e:
+                return cancelled, e.stage
+
+    assert asyncio.run(scenario()) == (True, "geracao")
+
+
+def test_enforce_deadline_does_not_swallow_unrelated_timeouts():
+    async def scenario():
+        with request_deadline(10.0):
+            async with enforce_deadline("geracao"):
+                await asyncio.wait_for(asyncio.sleep(10), timeout=0.01)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(scenario())
+
+
+def test_tasks_inherit_deadline_of_the_request():
+    async def child():
+        return remaining_time()
+
+    async def scenario():
+        with request_deadline(1.0):
+            return await asyncio.create_task(child())
+
+    remaining = asyncio.run(scenario())
+
+    assert remaining is not None and 0.9 < remaining <= 1.0
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.schemas.prompt import PromptRequest
+from app.services import job_worker
+from app.services.job_queue import STATUS_FAILED, STATUS_QUEUED, STATUS_RUNNING, STATUS_SUCCEEDED, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def _submit(store: JobStore, prompt: str, priority: int = 5, **fields) -> dict:
+    job, _ = store.submit(PromptRequest(prompt=prompt, **fields), f"hash-{prompt}", priority)
+    return job
+
+
+def _expire_lease(store: JobStore, job_id: str) -> None:
+    store._connect().execute("UPDATE jobs SET lease_expires_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_claim_orders_by_priority_then_arrival(store):
+    low = _submit(store, "baixa", priority=1)
+    first_high = _submit(store, "alta 1", priority=9)
+    second_high = _submit(store, "alta 2", priority=9)
+
+    claimed = [store.claim("w1")["id"] for _ in range(3)]
+
+    assert claimed == [first_high["id"], second_high["id"], low["id"]]
+    assert store.claim("w1") is None
+
+
+def test_submit_deduplicates_by_content_hash_unless_bypass_cache(store):
+    job, deduplicated = store.submit(PromptRequest(prompt="igual"), "hash", 5)
+    again, again_deduplicated = store.submit(PromptRequest(prompt="igual"), "hash", 5)
+    bypass, bypass_deduplicated = store.submit(PromptRequest(prompt="igual", bypass_cache=True), "hash", 5)
+
+    assert not deduplicated and again_deduplicated and again["id"] == job["id"]
+    assert not bypass_deduplicated and bypass["id"] != job["id"]
+
+
+def test_expired_lease_is_reclaimed_with_another_attempt(store):
+    job = _submit(store, "p")
+    assert store.claim("w1")["attempts"] == 1
+    assert store.claim("w2") is None # Lease ainda válido
+
+    _expire_lease(store, job["id"])
+    reclaimed = store.claim("w2")
+
+    assert reclaimed["id"] == job["id"]
+    assert reclaimed["attempts"] == 2
+    assert reclaimed["worker_id"] == "w2"
+
+
+def test_expired_lease_fails_job_after_max_attempts(store, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    job = _submit(store, "p")
+    for worker_id in ("w1", "w2"):
+        assert store.claim(worker_id)["id"] == job["id"]
+        _expire_lease(store, job["id"])
+
+    assert store.claim("w3") is None
+    failed = store.get(job["id"])
+    assert failed["status"] == STATUS_FAILED
+    assert failed["attempts"] == 2
+    assert "2 tentativas" in failed["error"]
+
+
+def test_only_the_lease_owner_records_the_outcome(store):
+    job = _submit(store, "p")
+    store.claim("w1")
+    _expire_lease(store, job["id"])
+    store.claim("w2")
+
+    assert not store.renew_lease(job["id"], "w1")
+    assert not store.complete(job["id"], "w1", {"stale": True})
+    assert not store.fail(job["id"], "w1", "erro antigo")
+    assert store.get(job["id"])["status"] == STATUS_RUNNING
+
+    assert store.renew_lease(job["id"], "w2")
+    assert store.complete(job["id"], "w2", {"ok": True})
+    finished = store.get(job["id"])
+    assert finished["status"] == STATUS_SUCCEEDED
+    assert finished["result"] == {"ok": True}
+
+
+def test_retry_later_requeues_after_delay(store):
+    job = _submit(store, "p")
+    store.claim("w1")
+
+    assert store.retry_later(job["id"], "w1", "sobrecarregado", delay_seconds=60)
+
+    requeued = store.get(job["id"])
+    assert requeued["status"] == STATUS_QUEUED and requeued["worker_id"] is None
+    assert store.claim("w2") is None # Só volta a ser elegível depois do atraso
+
+
+def test_heartbeat_renews_lease_and_abandons_job_taken_by_another_worker(store, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LEASE_RENEW_SECONDS", 0.01)
+    job = _submit(store, "p")
+    store.claim("w1")
+    first_lease = store.get(job["id"])["lease_expires_at"]
+
+    async def scenario():
+        work = asyncio.ensure_future(asyncio.sleep(10))
+        heartbeat = asyncio.create_task(job_worker._keep_lease(store, job["id"], "w1", work))
+        await asyncio.sleep(0.05)
+        assert store.get(job["id"])["lease_expires_at"] > first_lease
+        _expire_lease(store, job["id"])
+        store.claim("w2")
+        await asyncio.wait_for(heartbeat, 1)
+        await asyncio.wait_for(asyncio.gather(work, return_exceptions=True), 1)
+        return work.cancelled()
+
+    assert asyncio.run(scenario())
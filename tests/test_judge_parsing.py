@@ -0,0 +1,101 @@
+import asyncio
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.services import prompt_judge
+from app.services.judge_parsing import broken_json_fragment, extract_json_object, parse_judge_output
+
+
+class _Verdict(BaseModel):
+    winningVersion: int
+    justification: str
+
+
+class _RepairProvider:
+    """Provedor mínimo para o reparo: devolve uma saída fixa e guarda as entradas recebidas."""
+    model_type = "fake"
+    model_name = "fake-judge"
+    role = "judge"
+
+    def __init__(self, output):
+        self.output = output
+        self.calls = []
+
+    async def ainvoke(self, chain, inputs, stage):
+        self.calls.append((stage, inputs))
+        if isinstance(self.output, Exception):
+            raise self.output
+        return self.output
+
+
+def _parse_or_repair(monkeypatch, provider, raw_output):
+    monkeypatch.setattr(settings, "JUDGE_REPAIR_ENABLED", True)
+    monkeypatch.setattr(prompt_judge, "_build_judge_chain", lambda *args, **kwargs: object())
+    return asyncio.run(prompt_judge._parse_or_repair(provider, raw_output, _Verdict, "[teste]"))
+
+
+def test_extract_json_object_skips_prose_fences_and_braces_inside_strings():
+    text = 'Segue a avaliação:\n```json\n{"justification": "usa {chaves} e \\"aspas\\"", "winningVersion": 2}\n```'
+
+    assert extract_json_object(text) == '{"justification": "usa {chaves} e \\"aspas\\"", "winningVersion": 2}'
+
+
+def test_extract_json_object_tries_next_object_after_invalid_one():
+    assert extract_json_object('{nota: 1} depois {"winningVersion": 1}') == '{"winningVersion": 1}'
+
+
+def test_extract_json_object_returns_none_for_truncated_output():
+    assert extract_json_object('{"winningVersion": 1, "justification": "cortad') is None
+
+
+def test_broken_json_fragment_drops_surrounding_prose_and_fence():
+    assert broken_json_fragment('Resposta:\n```json\n{"winningVersion": 1,\n```') == '{"winningVersion": 1,'
+
+
+def test_parse_judge_output_validates_against_schema():
+    data, error = parse_judge_output('ok {"winningVersion": 1, "justification": "clara"}', _Verdict)
+    missing, missing_error = parse_judge_output('{"winningVersion": 1}', _Verdict)
+
+    assert data == {"winningVersion": 1, "justification": "clara"} and error is None
+    assert missing is None and "formato esperado" in missing_error
+
+
+def test_valid_output_does_not_call_repair(monkeypatch):
+    provider = _RepairProvider('{"winningVersion": 9, "justification": "não usado"}')
+
+    data, error = _parse_or_repair(monkeypatch, provider, '{"winningVersion": 2, "justification": "ok"}')
+
+    assert data == {"winningVersion": 2, "justification": "ok"} and error is None
+    assert provider.calls == []
+
+
+def test_broken_output_is_repaired_with_only_the_json_fragment(monkeypatch):
+    provider = _RepairProvider('```json\n{"winningVersion": 1, "justification": "reparado"}\n```')
+
+    data, error = _parse_or_repair(monkeypatch, provider, 'Veredito: {"winningVersion": 1, "justification": "cortad')
+
+    assert data == {"winningVersion": 1, "justification": "reparado"} and error is None
+    [(stage, inputs)] = provider.calls
+    assert stage == "judge_repair"
+    assert inputs["broken_json"] == '{"winningVersion": 1, "justification": "cortad'
+    assert "winningVersion" in inputs["schema"]
+
+
+def test_repair_failure_returns_both_errors(monkeypatch):
+    still_broken, still_broken_error = _parse_or_repair(monkeypatch, _RepairProvider("continua sem JSON"), "{quebrado")
+    raised, raised_error = _parse_or_repair(monkeypatch, _RepairProvider(RuntimeError("indisponível")), "{quebrado")
+
+    assert still_broken is None and "Reparo também falhou" in still_broken_error
+    assert raised is None and "Reparo falhou (RuntimeError): indisponível" in raised_error
+
+
+def test_repair_disabled_returns_parse_error(monkeypatch):
+    provider = _RepairProvider('{"winningVersion": 1, "justification": "x"}')
+    monkeypatch.setattr(prompt_judge, "_build_judge_chain", lambda *args, **kwargs: object())
+    monkeypatch.setattr(settings, "JUDGE_REPAIR_ENABLED", False)
+
+    data, error = asyncio.run(prompt_judge._parse_or_repair(provider, "{quebrado", _Verdict, "[teste]"))
+
+    assert data is None and "Nenhum objeto JSON" in error
+    assert provider.calls == []
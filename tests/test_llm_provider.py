@@ -0,0 +1,15 @@
+from app.providers.llm_provider import _sends_prefix_cache_key
+
+
+def test_prefix_cache_key_is_sent_only_to_the_openai_api_by_default():
+    assert _sends_prefix_cache_key("openai", {"sdk": "openai", "api_key_env": "API_KEY_OPENAI"})
+    assert not _sends_prefix_cache_key("groq", {"sdk": "groq"})
+    assert not _sends_prefix_cache_key("gemini", {"sdk": "gemini"})
+
+
+def test_openai_compatible_provider_with_base_url_needs_explicit_opt_in():
+    compatible = {"sdk": "openai", "base_url": "http://localhost:8000/v1"}
+
+    assert not _sends_prefix_cache_key("openai", compatible)
+    assert _sends_prefix_cache_key("openai", {**compatible, "prefix_cache_key": True})
+    assert not _sends_prefix_cache_key("openai", {"sdk": "openai", "prefix_cache_key": False})
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app.core.near_duplicates import NearDuplicateIndex, normalize_for_similarity
+
+PROMPT = "Explique em detalhes como funciona o protocolo TCP, incluindo o handshake de três vias e o controle de congestionamento."
+
+
+def _index(**overrides) -> NearDuplicateIndex:
+    options = {"threshold": 0.8, "num_perm": 64, "bands": 16, "shingle_size": 5, "max_entries": 100}
+    options.update(overrides)
+    return NearDuplicateIndex(**options)
+
+
+def test_normalize_for_similarity_ignores_case_punctuation_and_spacing():
+    assert normalize_for_similarity("  Olá,   MUNDO!!\n  tudo bem? ") == "olá mundo tudo bem"
+
+
+def test_num_perm_must_be_multiple_of_bands():
+    with pytest.raises(ValueError):
+        _index(num_perm=64, bands=10)
+
+
+def test_lookup_finds_near_duplicate_in_same_scope():
+    index = _index()
+    index.add("generate", PROMPT, "chave-1")
+
+    match = index.lookup("generate", PROMPT.upper().replace(",", "") + " ")
+
+    assert match == {"key": "chave-1", "prompt": PROMPT, "similarity": 1.0}
+    assert index.snapshot()["hits"] == 1
+
+
+def test_lookup_misses_different_prompt_and_other_scope():
+    index = _index()
+    index.add("generate", PROMPT, "chave-1")
+
+    assert index.lookup("generate", "Escreva um poema curto sobre o outono em Lisboa e as folhas que caem.") is None
+    assert index.lookup("evaluate", PROMPT) is None
+
+
+def test_small_edit_stays_above_threshold_only_when_threshold_allows():
+    edited = PROMPT.replace("detalhes", "pormenores")
+    permissive = _index(threshold=0.5)
+    strict = _index(threshold=0.99)
+    for index in (permissive, strict):
+        index.add("generate", PROMPT, "chave-1")
+
+    match = permissive.lookup("generate", edited)
+
+    assert match is not None and 0.5 <= match["similarity"] < 1.0
+    assert strict.lookup("generate", edited) is None
+
+
+def test_oldest_entries_are_evicted_and_discard_removes_key():
+    index = _index(max_entries=2)
+    index.add("s", "primeiro prompt bem diferente dos demais", "k1")
+    index.add("s", "segundo texto sobre outro assunto qualquer", "k2")
+    index.add("s", "terceira pergunta com palavras novas aqui", "k3")
+
+    assert index.lookup("s", "primeiro prompt bem diferente dos demais") is None
+    assert index.lookup("s", "segundo texto sobre outro assunto qualquer")["key"] == "k2"
+
+    index.discard("k2")
+
+    assert index.lookup("s", "segundo texto sobre outro assunto qualquer") is None
+    assert index.snapshot()["entries"] == 1
+
+
+def test_re_adding_key_replaces_previous_prompt():
+    index = _index()
+    index.add("s", "prompt antigo sobre bancos de dados relacionais", "k")
+    index.add("s", PROMPT, "k")
+
+    assert index.lookup("s", "prompt antigo sobre bancos de dados relacionais") is None
+    assert index.lookup("s", PROMPT)["key"] == "k"
+    assert index.snapshot()["entries"] == 1
+
+
+def test_entries_persisted_in_sqlite_are_reloaded(tmp_path):
+    path = str(tmp_path / "near.db")
+    asyncio.run(_index(sqlite_path=path).aadd("generate", PROMPT, "chave-1"))
+
+    reloaded = _index(sqlite_path=path)
+
+    assert reloaded.load(max_age_seconds=3600) == 1
+    assert reloaded.lookup("generate", PROMPT)["key"] == "chave-1"
+
+
+def test_load_drops_expired_rows_and_ignores_other_signature_sizes(tmp_path):
+    path = str(tmp_path / "near.db")
+    asyncio.run(_index(sqlite_path=path).aadd("generate", PROMPT, "chave-1"))
+
+    other_config = _index(sqlite_path=path, num_perm=32, bands=8)
+    other_config.load(max_age_seconds=3600)
+    expired = _index(sqlite_path=path)
+
+    assert other_config.snapshot()["entries"] == 0
+    assert expired.load(max_age_seconds=-1) == 0
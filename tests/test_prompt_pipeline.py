@@ -0,0 +1,41 @@
+import asyncio
+
+from app.core.config import settings
+from app.schemas.prompt import PromptRequest
+from app.services import prompt_pipeline
+
+
+def _route(monkeypatch, pipelined: bool, **fields) -> list:
+    """Executa _compute_prompt_response registrando qual caminho (pipeline ou por fases) foi escolhido."""
+    taken = []
+
+    async def pipelined_path(request, stage_gate, hedge_model_type):
+        taken.append("pipelined")
+
+    async def phased_generation(**kwargs):
+        taken.append("phased")
+        raise prompt_pipeline.ReformulationError("interrompido pelo teste")
+
+    monkeypatch.setattr(settings, "PIPELINED_EXECUTION_ENABLED", pipelined)
+    monkeypatch.setattr(settings, "JUDGE_PER_TEXT_SCORING", False)
+    monkeypatch.setattr(prompt_pipeline, "_compute_prompt_response_pipelined", pipelined_path)
+    monkeypatch.setattr(prompt_pipeline, "generate_reformulations", phased_generation)
+    request = PromptRequest(prompt="Escreva um poema", generation_model_type="fake", judge_model_type="fake", **fields)
+    try:
+        asyncio.run(prompt_pipeline._compute_prompt_response(request))
+    except prompt_pipeline.ReformulationError:
+        pass
+    return taken
+
+
+def test_pipelined_flag_selects_pipeline_for_default_two_variants(monkeypatch):
+    assert _route(monkeypatch, pipelined=True) == ["pipelined"]
+
+
+def test_without_flag_request_runs_in_phases(monkeypatch):
+    assert _route(monkeypatch, pipelined=False) == ["phased"]
+    assert _route(monkeypatch, pipelined=False, num_variants=3) == ["phased"]
+
+
+def test_judge_ensemble_always_runs_in_phases(monkeypatch):
+    assert _route(monkeypatch, pipelined=True, judge_ensemble=["fake", "fake:outro"]) == ["phased"]
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_same_key_share_one_computation():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "resultado"
+
+        results = await asyncio.gather(*(flight.do("chave", compute) for _ in range(5)))
+        return calls, results, flight.in_flight()
+
+    calls, results, in_flight = asyncio.run(scenario())
+
+    assert calls == 1
+    assert results == ["resultado"] * 5
+    assert in_flight == 0
+
+
+def test_distinct_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight()
+        seen = []
+
+        async def compute(key):
+            seen.append(key)
+            await asyncio.sleep(0)
+            return key
+
+        results = await asyncio.gather(flight.do("a", lambda: compute("a")), flight.do("b", lambda: compute("b")))
+        return seen, results
+
+    seen, results = asyncio.run(scenario())
+
+    assert sorted(seen) == ["a", "b"]
+    assert results == ["a", "b"]
+
+
+def test_exception_is_propagated_to_every_caller_and_key_is_released():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("falhou")
+
+        results = await asyncio.gather(flight.do("chave", fail), flight.do("chave", fail), return_exceptions=True)
+        retried = await flight.do("chave", lambda: asyncio.sleep(0, result="ok"))
+        return results, retried
+
+    results, retried = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == "ok"
+
+
+def test_cancelling_one_caller_keeps_shared_task_for_the_others():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "ok"
+
+        quitter = asyncio.ensure_future(flight.do("chave", compute))
+        stayer = asyncio.ensure_future(flight.do("chave", compute))
+        await asyncio.sleep(0)
+        quitter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await stayer, quitter.cancelled()
+
+    result, quitter_cancelled = asyncio.run(scenario())
+
+    assert result == "ok"
+    assert quitter_cancelled
+
+
+def test_shared_task_is_cancelled_when_every_caller_gives_up():
+    async def scenario():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def compute():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.ensure_future(flight.do("chave", compute))
+        await asyncio.sleep(0)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        return flight.in_flight()
+
+    assert asyncio.run(scenario()) == 0
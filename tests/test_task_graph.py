@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from app.core.deadline import remaining_time, request_deadline
+from app.core.task_graph import TaskGraph
+
+
+def test_add_rejects_duplicate_and_unregistered_dependencies():
+    graph = TaskGraph()
+    graph.add("a", lambda: asyncio.sleep(0))
+
+    with pytest.raises(ValueError):
+        graph.add("a", lambda: asyncio.sleep(0))
+    with pytest.raises(ValueError):
+        graph.add("b", lambda a: asyncio.sleep(0), "a", "inexistente")
+
+
+def test_dependency_results_are_passed_in_order():
+    async def value(result):
+        await asyncio.sleep(0)
+        return result
+
+    async def combine(left, right):
+        return f"{left}+{right}"
+
+    graph = TaskGraph()
+    graph.add("left", lambda: value("esq"))
+    graph.add("right", lambda: value("dir"))
+    graph.add("both", combine, "right", "left")
+
+    assert asyncio.run(graph.run()) == {"left": "esq", "right": "dir", "both": "dir+esq"}
+
+
+def test_node_starts_as_soon_as_its_own_dependencies_finish():
+    async def scenario():
+        order = []
+        slow_release = asyncio.Event()
+
+        async def fast():
+            order.append("fast")
+            return 1
+
+        async def slow():
+            await slow_release.wait()
+            order.append("slow")
+            return 2
+
+        async def after_fast(result):
+            order.append("after_fast")
+            slow_release.set()
+            return result
+
+        graph = TaskGraph()
+        graph.add("fast", fast)
+        graph.add("slow", slow)
+        graph.add("after_fast", after_fast, "fast")
+        await graph.run()
+        return order
+
+    assert asyncio.run(scenario()) == ["fast", "after_fast", "slow"]
+
+
+def test_first_failure_cancels_pending_nodes_and_propagates():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("falhou")
+
+        async def long_running():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def never(result):
+            raise AssertionError("não deveria rodar")
+
+        graph = TaskGraph()
+        graph.add("fail", fail)
+        graph.add("long", long_running)
+        graph.add("dependent", never, "fail")
+        with pytest.raises(RuntimeError):
+            await graph.run()
+        return cancelled.is_set()
+
+    assert asyncio.run(scenario())
+
+
+def test_nodes_inherit_request_deadline():
+    async def scenario():
+        async def read_deadline():
+            return remaining_time()
+
+        graph = TaskGraph()
+        graph.add("node", read_deadline)
+        with request_deadline(1.0):
+            return (await graph.run())["node"]
+
+    remaining = asyncio.run(scenario())
+
+    assert remaining is not None and 0.9 < remaining <= 1.0